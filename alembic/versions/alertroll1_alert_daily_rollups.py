@@ -0,0 +1,53 @@
+"""create daily alert rollup table
+
+Revision ID: alertroll1
+Revises: outboxtopic1
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "alertroll1"
+down_revision = "outboxtopic1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "AlertasResumenDiario",
+        sa.Column("dia", sa.Date, primary_key=True),
+        sa.Column("severidad", sa.String(length=20), primary_key=True),
+        sa.Column(
+            "id_estudiante",
+            sa.Integer,
+            sa.ForeignKey("Usuarios.id_usuario"),
+            primary_key=True,
+        ),
+        sa.Column("total", sa.Integer, nullable=False, server_default="0"),
+    )
+    op.create_index(
+        "ix_AlertasResumenDiario_id_estudiante_dia",
+        "AlertasResumenDiario",
+        ["id_estudiante", "dia"],
+    )
+    # Backfill inicial desde el histórico (días en UTC; para otra zona
+    # horaria, volver a ejecutar backfill_alert_rollups.py)
+    op.execute(
+        """
+        INSERT INTO "AlertasResumenDiario" (dia, severidad, id_estudiante, total)
+        SELECT (fecha_creacion AT TIME ZONE 'UTC')::date, severidad, id_estudiante, count(*)
+        FROM "Alertas"
+        WHERE fecha_creacion IS NOT NULL
+        GROUP BY 1, 2, 3
+        """
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_AlertasResumenDiario_id_estudiante_dia", table_name="AlertasResumenDiario"
+    )
+    op.drop_table("AlertasResumenDiario")
@@ -0,0 +1,30 @@
+"""citas exclusion constraint against overlapping bookings
+
+Revision ID: citaexcl1
+Revises: citaidx1
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "citaexcl1"
+down_revision = "citaidx1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Falla si ya existen citas solapadas: hay que resolverlas antes de migrar
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.execute(
+        'ALTER TABLE "Citas" ADD CONSTRAINT citas_psicologo_sin_solapes '
+        "EXCLUDE USING gist ("
+        "id_psicologo WITH =, "
+        "tstzrange(fecha_hora_inicio, fecha_hora_fin) WITH &&"
+        ") WHERE (fecha_cancelacion IS NULL)"
+    )
+
+
+def downgrade():
+    op.execute('ALTER TABLE "Citas" DROP CONSTRAINT citas_psicologo_sin_solapes')
@@ -0,0 +1,32 @@
+"""add citas calendar indexes
+
+Revision ID: citaidx1
+Revises: page1
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "citaidx1"
+down_revision = "page1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_Citas_id_psicologo_fecha_hora_inicio",
+        "Citas",
+        ["id_psicologo", "fecha_hora_inicio"],
+    )
+    op.create_index(
+        "ix_Citas_id_estudiante_fecha_hora_inicio",
+        "Citas",
+        ["id_estudiante", "fecha_hora_inicio"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_Citas_id_estudiante_fecha_hora_inicio", table_name="Citas")
+    op.drop_index("ix_Citas_id_psicologo_fecha_hora_inicio", table_name="Citas")
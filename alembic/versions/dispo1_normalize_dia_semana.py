@@ -0,0 +1,72 @@
+"""store DisponibilidadPsicologo.dia_semana as smallint weekday
+
+Revision ID: dispo1
+Revises: citaexcl1
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "dispo1"
+down_revision = "citaexcl1"
+branch_labels = None
+depends_on = None
+
+DIAS = ["LUNES", "MARTES", "MIERCOLES", "JUEVES", "VIERNES", "SABADO", "DOMINGO"]
+
+# Nombre normalizado: sin tildes, en mayúsculas y sin espacios
+NOMBRE_NORMALIZADO = "upper(translate(trim(dia_semana), 'áéíóúÁÉÍÓÚ', 'aeiouAEIOU'))"
+
+
+def upgrade():
+    conn = op.get_bind()
+    desconocidos = conn.execute(
+        sa.text(
+            f'SELECT DISTINCT dia_semana FROM "DisponibilidadPsicologo" '
+            f"WHERE {NOMBRE_NORMALIZADO} NOT IN ({', '.join(repr(d) for d in DIAS)})"
+        )
+    ).scalars().all()
+    if desconocidos:
+        raise RuntimeError(
+            f"Valores de dia_semana no reconocidos, corrígelos antes de migrar: {desconocidos}"
+        )
+    casos = " ".join(f"WHEN '{dia}' THEN {i}" for i, dia in enumerate(DIAS))
+    op.alter_column(
+        "DisponibilidadPsicologo",
+        "dia_semana",
+        type_=sa.SmallInteger(),
+        existing_type=sa.String(length=10),
+        existing_nullable=False,
+        postgresql_using=f"CASE {NOMBRE_NORMALIZADO} {casos} END",
+    )
+    op.create_check_constraint(
+        "ck_disponibilidad_dia_semana",
+        "DisponibilidadPsicologo",
+        "dia_semana BETWEEN 0 AND 6",
+    )
+    op.create_index(
+        "ix_DisponibilidadPsicologo_id_psicologo_dia",
+        "DisponibilidadPsicologo",
+        ["id_psicologo", "dia_semana"],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_DisponibilidadPsicologo_id_psicologo_dia",
+        table_name="DisponibilidadPsicologo",
+    )
+    op.drop_constraint(
+        "ck_disponibilidad_dia_semana", "DisponibilidadPsicologo", type_="check"
+    )
+    casos = " ".join(f"WHEN {i} THEN '{dia}'" for i, dia in enumerate(DIAS))
+    op.alter_column(
+        "DisponibilidadPsicologo",
+        "dia_semana",
+        type_=sa.String(length=10),
+        existing_type=sa.SmallInteger(),
+        existing_nullable=False,
+        postgresql_using=f"CASE dia_semana {casos} END",
+    )
@@ -0,0 +1,35 @@
+"""partial indexes for unread notificaciones
+
+Revision ID: notiidx1
+Revises: dispo1
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "notiidx1"
+down_revision = "dispo1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_Notificaciones_id_estudiante_no_leidas",
+        "Notificaciones",
+        ["id_estudiante"],
+        postgresql_where=sa.text("leida = false"),
+    )
+    op.create_index(
+        "ix_Notificaciones_id_psicologo_no_leidas",
+        "Notificaciones",
+        ["id_psicologo"],
+        postgresql_where=sa.text("leida = false"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_Notificaciones_id_psicologo_no_leidas", table_name="Notificaciones")
+    op.drop_index("ix_Notificaciones_id_estudiante_no_leidas", table_name="Notificaciones")
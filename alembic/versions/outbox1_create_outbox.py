@@ -0,0 +1,43 @@
+"""create outbox table for real-time events
+
+Revision ID: outbox1
+Revises: notiidx1
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "outbox1"
+down_revision = "notiidx1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "Outbox",
+        sa.Column("id_evento", sa.BigInteger, primary_key=True),
+        sa.Column("id_usuario", sa.Integer, nullable=False),
+        sa.Column("payload", postgresql.JSONB, nullable=False),
+        sa.Column(
+            "fecha_creacion",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("fecha_entrega", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index(
+        "ix_Outbox_pendientes",
+        "Outbox",
+        ["id_evento"],
+        postgresql_where=sa.text("fecha_entrega IS NULL"),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_Outbox_pendientes", table_name="Outbox")
+    op.drop_table("Outbox")
@@ -0,0 +1,33 @@
+"""assign outbox sequence numbers at delivery time
+
+Revision ID: outboxseq1
+Revises: alertroll1
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "outboxseq1"
+down_revision = "alertroll1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE SEQUENCE "Outbox_seq"')
+    op.add_column("Outbox", sa.Column("seq", sa.BigInteger, nullable=True))
+    # Los eventos ya entregados conservan el seq que vieron los clientes (su
+    # id) y la secuencia sigue desde ahí
+    op.execute('UPDATE "Outbox" SET seq = id_evento WHERE fecha_entrega IS NOT NULL')
+    op.execute(
+        """SELECT setval('"Outbox_seq"', COALESCE((SELECT max(id_evento) FROM "Outbox"), 0) + 1, false)"""
+    )
+    op.create_index("ix_Outbox_seq", "Outbox", ["seq"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ix_Outbox_seq", table_name="Outbox")
+    op.drop_column("Outbox", "seq")
+    op.execute('DROP SEQUENCE "Outbox_seq"')
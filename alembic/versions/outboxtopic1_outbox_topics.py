@@ -0,0 +1,30 @@
+"""allow outbox events addressed to a topic
+
+Revision ID: outboxtopic1
+Revises: outbox1
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "outboxtopic1"
+down_revision = "outbox1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("Outbox", sa.Column("topico", sa.String(64), nullable=True))
+    op.alter_column("Outbox", "id_usuario", existing_type=sa.Integer, nullable=True)
+    op.create_check_constraint(
+        "ck_Outbox_destino", "Outbox", "(id_usuario IS NULL) <> (topico IS NULL)"
+    )
+
+
+def downgrade():
+    op.execute('DELETE FROM "Outbox" WHERE topico IS NOT NULL')
+    op.drop_constraint("ck_Outbox_destino", "Outbox", type_="check")
+    op.alter_column("Outbox", "id_usuario", existing_type=sa.Integer, nullable=False)
+    op.drop_column("Outbox", "topico")
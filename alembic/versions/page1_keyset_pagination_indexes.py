@@ -0,0 +1,38 @@
+"""keyset pagination indexes for alertas and notificaciones
+
+Revision ID: page1
+Revises: alert1
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "page1"
+down_revision = "alert1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_Alertas_fecha_creacion_id_alerta",
+        "Alertas",
+        ["fecha_creacion", "id_alerta"],
+    )
+    op.create_index(
+        "ix_Notificaciones_id_estudiante_fecha",
+        "Notificaciones",
+        ["id_estudiante", "fecha_creacion"],
+    )
+    op.create_index(
+        "ix_Notificaciones_id_psicologo_fecha",
+        "Notificaciones",
+        ["id_psicologo", "fecha_creacion"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_Notificaciones_id_psicologo_fecha", table_name="Notificaciones")
+    op.drop_index("ix_Notificaciones_id_estudiante_fecha", table_name="Notificaciones")
+    op.drop_index("ix_Alertas_fecha_creacion_id_alerta", table_name="Alertas")
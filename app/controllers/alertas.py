@@ -1,100 +1,170 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import date
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import List
 
 from app.core.deps import get_db
 from app.models.alerta import Alerta
-from app.models.users import User
-from app.models.roles import Role
-from app.models.notificacion import Notificacion
-from app.schemas.alerta import AlertaCreate, AlertaRead
+from app.schemas.alerta import AlertaCreate, AlertaLote, AlertaRead, AlertaResumen
 from app.schemas.notificacion import NotificacionRead
-from app.core.ws import manager
+from app.core.outbox import encolar
+from app.core.ws import topico_rol
+from app.services.alertas import (
+    STAFF_ROLES,
+    AlertasService,
+    EstudiantesNoEncontradosError,
+    alerta_evento,
+)
+from app.services.notificaciones import unread_counter
+from app.utils.pagination import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    apply_keyset,
+    split_page,
+    stream_ndjson,
+)
 
 router = APIRouter()
 
 
 @router.post("/", response_model=AlertaRead, status_code=status.HTTP_201_CREATED)
-async def crear_alerta(alert_in: AlertaCreate, db: AsyncSession = Depends(get_db)):
-    # Validate student exists
-    res_user = await db.execute(
-        select(User).where(User.id_usuario == alert_in.id_estudiante)
-    )
-    estudiante = res_user.scalar_one_or_none()
-    if not estudiante:
+async def crear_alerta(
+    alert_in: AlertaCreate, db: AsyncSession = Depends(get_db)
+):
+    try:
+        alertas, notis, estudiantes = await AlertasService.crear_lote(db, [alert_in])
+    except EstudiantesNoEncontradosError:
         raise HTTPException(status_code=404, detail="Estudiante no encontrado")
+    alerta = alertas[0]
 
-    alerta = Alerta(**alert_in.model_dump())
-    db.add(alerta)
+    # Standard notification push so existing panels update
+    mensajes = [
+        (
+            n.id_psicologo,
+            {
+                "type": "notification_new",
+                "data": NotificacionRead.model_validate(n).model_dump(mode="json"),
+            },
+        )
+        for n in notis
+    ]
+    # Extra event for specialized UIs: one event per role topic, delivered to
+    # whichever staff sockets are connected
+    alerta_nueva = {
+        "type": "alerta_nueva",
+        "data": alerta_evento(alerta, estudiantes[alerta.id_estudiante]),
+    }
+    mensajes.extend((topico_rol(rol), alerta_nueva) for rol in STAFF_ROLES)
+    # Los eventos se confirman con la alerta; el despachador de la Outbox
+    # los entrega por WebSocket fuera de la petición
+    await encolar(db, mensajes)
     await db.commit()
-    await db.refresh(alerta)
+    no_leidas = AlertasService.no_leidas_por_usuario(notis)
+    for uid, total in no_leidas.items():
+        unread_counter.adjust(uid, total)
+    await unread_counter.publicar(no_leidas)
+
+    return alerta
 
-    # Build human-readable info for notifications
-    estudiante_nombre = f"{getattr(estudiante, 'nombre', '')} {getattr(estudiante, 'apellido', '')}".strip()
-    titulo_base = (
-        f"ALERTA {alerta.severidad}: {estudiante_nombre} ({estudiante.email}) a las "
-        f"{alerta.fecha_creacion} dijo: '{alerta.texto[:150]}{'...' if len(alerta.texto) > 150 else ''}'"
-    )
 
-    # Find ADMIN and PSICOLOGO users
-    res_roles = await db.execute(select(Role))
-    roles = {r.nombre_rol: r.id_rol for r in res_roles.scalars().all()}
-    admin_role_id = roles.get("ADMINISTRADOR")
-    psicologo_role_id = roles.get("PSICOLOGO")
-
-    target_users: List[int] = []
-    if admin_role_id:
-        res_admins = await db.execute(select(User).where(User.id_rol == admin_role_id))
-        target_users.extend([u.id_usuario for u in res_admins.scalars().all()])
-    if psicologo_role_id:
-        res_psis = await db.execute(
-            select(User).where(User.id_rol == psicologo_role_id)
+@router.post(
+    "/batch", response_model=list[AlertaRead], status_code=status.HTTP_201_CREATED
+)
+async def crear_alertas_lote(lote: AlertaLote, db: AsyncSession = Depends(get_db)):
+    # Todo el lote en una transacción y un puñado de sentencias; cada
+    # destinatario recibe un solo evento con todo lo que le corresponde
+    try:
+        alertas, notis, estudiantes = await AlertasService.crear_lote(
+            db, lote.alertas
         )
-        target_users.extend([u.id_usuario for u in res_psis.scalars().all()])
-
-    # Create Notificaciones for each target
-    for uid in set(target_users):
-        n = Notificacion(
-            id_estudiante=alerta.id_estudiante,
-            id_psicologo=uid,
-            titulo=titulo_base,
+    except EstudiantesNoEncontradosError as exc:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Estudiantes no encontrados: {', '.join(map(str, exc.ids))}",
         )
-        db.add(n)
-        await db.commit()
-        await db.refresh(n)
-        # Standard notification push so existing panels update
-        await manager.send_to_user(
-            uid,
-            {
-                "type": "notification_new",
-                "data": NotificacionRead.from_orm(n).model_dump(),
-            },
-        )
-        # Extra event for specialized UIs if needed
-        await manager.send_to_user(
-            uid,
-            {
-                "type": "alerta_nueva",
-                "data": {
-                    "id_alerta": alerta.id_alerta,
-                    "id_estudiante": alerta.id_estudiante,
-                    "texto": alerta.texto,
-                    "severidad": alerta.severidad,
-                    "fecha_creacion": str(alerta.fecha_creacion),
-                    "estudiante_nombre": estudiante_nombre,
-                    "estudiante_email": estudiante.email,
-                },
-            },
+
+    por_usuario: dict[int, list[dict]] = {}
+    for n in notis:
+        por_usuario.setdefault(n.id_psicologo, []).append(
+            NotificacionRead.model_validate(n).model_dump(mode="json")
         )
+    mensajes = [
+        (uid, {"type": "notifications_new", "data": data})
+        for uid, data in por_usuario.items()
+    ]
+    alertas_nuevas = {
+        "type": "alertas_nuevas",
+        "data": [alerta_evento(a, estudiantes[a.id_estudiante]) for a in alertas],
+    }
+    mensajes.extend((topico_rol(rol), alertas_nuevas) for rol in STAFF_ROLES)
+    await encolar(db, mensajes)
+    await db.commit()
+    no_leidas = AlertasService.no_leidas_por_usuario(notis)
+    for uid, total in no_leidas.items():
+        unread_counter.adjust(uid, total)
+    await unread_counter.publicar(no_leidas)
 
-    return alerta
+    return alertas
 
 
 @router.get("/", response_model=list[AlertaRead])
-async def listar_alertas(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(Alerta).order_by(Alerta.fecha_creacion.desc()))
-    return res.scalars().all()
+async def listar_alertas(
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    stmt = apply_keyset(
+        select(Alerta),
+        [Alerta.fecha_creacion, Alerta.id_alerta],
+        cursor,
+        descending=True,
+    )
+    if stream:
+        return StreamingResponse(
+            stream_ndjson(
+                stmt, lambda row: AlertaRead.model_validate(row[0]).model_dump_json()
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+    res = await db.execute(stmt.limit(limit + 1))
+    alertas, next_cursor = split_page(
+        res.scalars().all(), limit, lambda a: (a.fecha_creacion, a.id_alerta)
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return alertas
+
+
+@router.get("/analytics", response_model=list[AlertaResumen])
+async def analitica_alertas(
+    periodo: Literal["dia", "semana", "mes"] = "dia",
+    desde: date | None = None,
+    hasta: date | None = None,
+    id_estudiante: int | None = None,
+    por_estudiante: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    # Conteos por periodo y severidad leídos del resumen diario, que se
+    # mantiene al crear alertas; no recorre la tabla de alertas
+    if desde and hasta and desde > hasta:
+        raise HTTPException(
+            status_code=400, detail="'desde' no puede ser posterior a 'hasta'"
+        )
+    return await AlertasService.resumen(
+        db,
+        periodo,
+        desde,
+        hasta,
+        id_estudiante,
+        por_estudiante or id_estudiante is not None,
+    )
 
 
 @router.get("/user/{id_estudiante}", response_model=list[AlertaRead])
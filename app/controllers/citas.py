@@ -1,12 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.deps import get_db
-from app.schemas.citas import CitaCreate, CitaRead, CitaReschedule
-from app.services.citas import CitasService
+from app.schemas.citas import CitaCreate, CitaRead, CitaReschedule, CitaSerieCreate
+from app.services.citas import CitaSolapadaError, CitasService
+from app.utils.pagination import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    stream_ndjson,
+)
 
 router = APIRouter()
 
+CITA_SOLAPADA_DETAIL = "El psicólogo ya tiene una cita en ese horario"
+
+
+def _validar_rango(inicio: datetime, fin: datetime):
+    if fin <= inicio:
+        raise HTTPException(
+            status_code=400,
+            detail="La fecha de fin debe ser posterior a la fecha de inicio",
+        )
+
 
 @router.post("/", response_model=CitaRead, status_code=status.HTTP_201_CREATED)
 async def create_cita(cita_in: CitaCreate, db: AsyncSession = Depends(get_db)):
@@ -15,7 +35,25 @@ async def create_cita(cita_in: CitaCreate, db: AsyncSession = Depends(get_db)):
         raise HTTPException(
             status_code=400, detail="Estudiante y Psicólogo son obligatorios"
         )
-    return await CitasService.create(db, cita_in)
+    _validar_rango(cita_in.fecha_hora_inicio, cita_in.fecha_hora_fin)
+    try:
+        return await CitasService.create(db, cita_in)
+    except CitaSolapadaError:
+        raise HTTPException(status_code=409, detail=CITA_SOLAPADA_DETAIL)
+
+
+@router.post(
+    "/series", response_model=list[CitaRead], status_code=status.HTTP_201_CREATED
+)
+async def create_cita_series(
+    serie_in: CitaSerieCreate, db: AsyncSession = Depends(get_db)
+):
+    try:
+        return await CitasService.create_series(db, serie_in)
+    except CitaSolapadaError as e:
+        fechas = ", ".join(f.isoformat() for f in e.conflictos)
+        detail = f"{CITA_SOLAPADA_DETAIL}: {fechas}" if fechas else CITA_SOLAPADA_DETAIL
+        raise HTTPException(status_code=409, detail=detail)
 
 
 @router.get("/estudiante/{id_estudiante}", response_model=list[CitaRead])
@@ -52,7 +90,11 @@ async def reschedule_cita(
     reschedule_in: CitaReschedule,
     db: AsyncSession = Depends(get_db),
 ):
-    cita = await CitasService.reschedule(db, id_cita, reschedule_in)
+    _validar_rango(reschedule_in.fecha_hora_inicio, reschedule_in.fecha_hora_fin)
+    try:
+        cita = await CitasService.reschedule(db, id_cita, reschedule_in)
+    except CitaSolapadaError:
+        raise HTTPException(status_code=409, detail=CITA_SOLAPADA_DETAIL)
     if not cita:
         raise HTTPException(
             status_code=404, detail="Cita no encontrada o no se puede reprogramar"
@@ -69,5 +111,24 @@ async def get_cita(id_cita: int, db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/", response_model=list[CitaRead])
-async def list_citas(db: AsyncSession = Depends(get_db)):
-    return await CitasService.get_all(db)
+async def list_citas(
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    if stream:
+        return StreamingResponse(
+            stream_ndjson(
+                CitasService.page_stmt(cursor),
+                lambda row: CitaRead.model_validate(
+                    CitasService.row_to_dict(row)
+                ).model_dump_json(),
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+    citas, next_cursor = await CitasService.get_page(db, limit, cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return citas
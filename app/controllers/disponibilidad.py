@@ -1,22 +1,31 @@
-import unicodedata
 from datetime import date, datetime, timedelta
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import Date, cast, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app.core.deps import get_db
 from app.models.disponibilidad import DisponibilidadPsicologo
-from app.models.citas import Cita
 from app.schemas.disponibilidad import (
     DisponibilidadCreate,
     DisponibilidadRead,
+    FranjaSemanal,
     HorarioLibre,
+    SlotLibre,
+    SlotPsicologo,
 )
+from app.services.disponibilidad import (
+    DisponibilidadService,
+    FranjasInvalidasError,
+    slot_store,
+)
+from app.utils.date_utils import DIAS_SEMANA, zona_horaria
 
 router = APIRouter()
 
+MAX_DIAS_RANGO = 62
+TZ_DESCRIPCION = "Zona horaria IANA, p. ej. America/Bogota"
+
 
 # Crear disponibilidad
 @router.post(
@@ -35,6 +44,13 @@ async def create_disponibilidad(
     db.add(disponibilidad)
     await db.commit()
     await db.refresh(disponibilidad)
+    slot_store.franja_agregada(
+        disponibilidad.id_psicologo,
+        disponibilidad.dia_semana,
+        disponibilidad.hora_inicio,
+        disponibilidad.hora_fin,
+    )
+    await slot_store.publicar(disponibilidad.id_psicologo)
     # Construir el objeto de respuesta manualmente para cumplir con el schema
     return DisponibilidadRead(
         id_disponibilidad=disponibilidad.id_disponibilidad,
@@ -45,6 +61,42 @@ async def create_disponibilidad(
     )
 
 
+# Reemplazar el horario semanal completo de un psicólogo en una sola llamada
+@router.put("/{id_psicologo}/semana", response_model=list[DisponibilidadRead])
+async def replace_semana(
+    id_psicologo: int,
+    franjas: list[FranjaSemanal],
+    db: AsyncSession = Depends(get_db),
+):
+    try:
+        return await DisponibilidadService.replace_semana(db, id_psicologo, franjas)
+    except FranjasInvalidasError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# Primeros horarios libres entre todos los psicólogos
+@router.get("/earliest", response_model=list[SlotPsicologo])
+async def earliest_slots(
+    desde: datetime | None = Query(None, alias="from", description="Desde (por defecto, ahora)"),
+    modalidad: str | None = Query(None, description="Modalidad deseada de la cita"),
+    limit: int = Query(10, ge=1, le=100),
+    dias: int = Query(14, ge=1, le=MAX_DIAS_RANGO, description="Días a buscar"),
+    duracion: int = Query(60, ge=5, le=480, description="Minutos por slot"),
+    tz: str | None = Query(None, description=TZ_DESCRIPCION),
+    db: AsyncSession = Depends(get_db),
+):
+    zona = zona_horaria(tz)
+    if desde is None:
+        desde = datetime.now(zona)
+    elif desde.tzinfo is None:
+        desde = desde.replace(tzinfo=zona)
+    slots = await DisponibilidadService.get_earliest(
+        db, desde, dias, limit, timedelta(minutes=duracion), zona
+    )
+    # Las franjas no distinguen modalidad; se devuelve la pedida para reservar
+    return [{**slot, "modalidad": modalidad} for slot in slots]
+
+
 # Listar disponibilidad por psicólogo (todas sus citas)
 @router.get(
     "/{id_psicologo}/cita/{id_cita}",
@@ -70,78 +122,60 @@ async def list_disponibilidad_psicologo_cita(
 async def list_horarios_libres(
     id_psicologo: int,
     fecha: date = Query(..., description="Fecha en formato YYYY-MM-DD"),
+    duracion: int = Query(60, ge=5, le=480, description="Minutos por slot"),
+    paso: int | None = Query(None, ge=5, le=480, description="Minutos entre inicios"),
+    buffer: int = Query(0, ge=0, le=120, description="Minutos libres entre citas"),
+    tz: str | None = Query(None, description=TZ_DESCRIPCION),
     db: AsyncSession = Depends(get_db),
 ):
-    dias = ["LUNES", "MARTES", "MIERCOLES", "JUEVES", "VIERNES", "SABADO", "DOMINGO"]
-    dia_semana = dias[fecha.weekday()]
-    print(
-        f"[DEBUG] fecha={fecha} fecha.weekday()={fecha.weekday()} dia_semana={dia_semana}"
+    slots = await DisponibilidadService.get_horarios_libres(
+        db,
+        id_psicologo,
+        fecha,
+        fecha,
+        timedelta(minutes=duracion),
+        timedelta(minutes=paso) if paso else None,
+        timedelta(minutes=buffer),
+        zona_horaria(tz),
     )
-
-    q_disp = await db.execute(
-        select(DisponibilidadPsicologo).where(
-            DisponibilidadPsicologo.id_psicologo == id_psicologo,
-            func.upper(DisponibilidadPsicologo.dia_semana) == dia_semana,
-        )
-    )
-    franjas = q_disp.scalars().all()
-    print(f"[DEBUG] Franjas encontradas para dia_semana={dia_semana}: {franjas}")
-    # 2) Trae las tutorías ocupadas ese día
-    q_tuts = await db.execute(
-        select(Cita).where(
-            Cita.id_psicologo == id_psicologo,
-            cast(Cita.fecha_hora_inicio, Date) == fecha,
-        )
-    )
-    tuts = q_tuts.scalars().all()
-    print(f"[DEBUG] Citas ocupadas ese día: {tuts}")
-
-    ocupado_times = [
-        (tut.fecha_hora_inicio.time(), tut.fecha_hora_fin.time()) for tut in tuts
+    return [
+        {
+            "inicio": inicio.time().strftime("%H:%M:%S"),
+            "fin": fin.time().strftime("%H:%M:%S"),
+        }
+        for inicio, fin in slots
     ]
 
-    libres: list[dict] = []
-    for f in franjas:
-        # Ensure we get the actual Python time object, not a SQLAlchemy Column
-        hora_inicio = getattr(f, "hora_inicio", None)
-        hora_fin = getattr(f, "hora_fin", None)
-        from datetime import time as dt_time
-
-        if not isinstance(hora_inicio, dt_time) or not isinstance(hora_fin, dt_time):
-            print(f"[DEBUG] Franja ignorada por tipo: {f}")
-            continue
-        inicio_dt = datetime.combine(fecha, hora_inicio)
-        fin_dt = datetime.combine(fecha, hora_fin)
-        current_slot_start_dt = inicio_dt
-        while current_slot_start_dt + timedelta(hours=1) <= fin_dt:
-            slot_inicio_time = current_slot_start_dt.time()
-            slot_fin_dt = current_slot_start_dt + timedelta(hours=1)
-            slot_fin_time = slot_fin_dt.time()
-            is_slot_ocupado = False
-            for tut_start_time, tut_end_time in ocupado_times:
-                if slot_inicio_time < tut_end_time and tut_start_time < slot_fin_time:
-                    is_slot_ocupado = True
-                    break
-            if not is_slot_ocupado:
-                libres.append(
-                    {
-                        "inicio": slot_inicio_time.strftime("%H:%M:%S"),
-                        "fin": slot_fin_time.strftime("%H:%M:%S"),
-                    }
-                )
-            current_slot_start_dt += timedelta(hours=1)
-    print(f"[DEBUG] Horarios libres calculados: {libres}")
-    return libres
-
-
-def normaliza_dia(d: str) -> str:
-    return (
-        unicodedata.normalize("NFKD", d)
-        .encode("ascii", "ignore")
-        .decode("ascii")
-        .lower()
-        .strip()
+
+# Slots libres de varios días (una semana, un mes) en una sola llamada
+@router.get("/{id_psicologo}/libres", response_model=list[SlotLibre])
+async def list_slots_libres(
+    id_psicologo: int,
+    desde: date = Query(..., alias="from", description="Fecha inicial YYYY-MM-DD"),
+    hasta: date = Query(..., alias="to", description="Fecha final YYYY-MM-DD"),
+    duracion: int = Query(60, ge=5, le=480, description="Minutos por slot"),
+    paso: int | None = Query(None, ge=5, le=480, description="Minutos entre inicios"),
+    buffer: int = Query(0, ge=0, le=120, description="Minutos libres entre citas"),
+    tz: str | None = Query(None, description=TZ_DESCRIPCION),
+    db: AsyncSession = Depends(get_db),
+):
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="'to' debe ser posterior a 'from'")
+    if (hasta - desde).days >= MAX_DIAS_RANGO:
+        raise HTTPException(
+            status_code=400, detail=f"El rango no puede superar {MAX_DIAS_RANGO} días"
+        )
+    slots = await DisponibilidadService.get_horarios_libres(
+        db,
+        id_psicologo,
+        desde,
+        hasta,
+        timedelta(minutes=duracion),
+        timedelta(minutes=paso) if paso else None,
+        timedelta(minutes=buffer),
+        zona_horaria(tz),
     )
+    return [{"inicio": inicio, "fin": fin} for inicio, fin in slots]
 
 
 @router.get("/{id_psicologo}/cita/{id_cita}/dias", response_model=list[str])
@@ -158,7 +192,7 @@ async def dias_disponibles_psicologo_cita(
     )
     dias = [row[0] for row in q.fetchall()]
     # Quita duplicados por si acaso
-    return list(sorted(set(dias)))
+    return [DIAS_SEMANA[d] for d in sorted(set(dias))]
 
 
 # New endpoint: list free dates for a psychologist
@@ -170,45 +204,25 @@ async def list_dias_libres(
     id_psicologo: int,
     start: date = Query(..., description="Fecha de inicio YYYY-MM-DD"),
     end: date = Query(..., description="Fecha de fin YYYY-MM-DD"),
+    tz: str | None = Query(None, description=TZ_DESCRIPCION),
     db: AsyncSession = Depends(get_db),
 ):
-    # Fetch configured availability days for the psychologist
-    q_disp = await db.execute(
-        select(DisponibilidadPsicologo.dia_semana)
-        .where(DisponibilidadPsicologo.id_psicologo == id_psicologo)
+    return await DisponibilidadService.get_dias_libres(
+        db, id_psicologo, start, end, zona_horaria(tz)
     )
-    dias_config = [row[0].upper() for row in q_disp.fetchall()]
 
-    # Map Spanish day names to weekday numbers (0=Monday)
-    map_dia = {
-        'LUNES': 0, 'MARTES': 1, 'MIERCOLES': 2,
-        'JUEVES': 3, 'VIERNES': 4, 'SABADO': 5, 'DOMINGO': 6
+
+# Compara los slots precalculados con un recálculo completo desde la BD
+@router.get("/{id_psicologo}/consistencia")
+async def verificar_slots_precalculados(
+    id_psicologo: int,
+    db: AsyncSession = Depends(get_db),
+):
+    diferencias = await slot_store.verificar(db, id_psicologo)
+    return {
+        "consistente": not diferencias,
+        "dias_con_diferencias": [dia.isoformat() for dia in diferencias],
     }
-    disponibles_weekdays = {map_dia[d] for d in dias_config if d in map_dia}
-
-    libres: list[str] = []
-    current = start
-    from datetime import timedelta
-    while current <= end:
-        wd = current.weekday()
-        # Check if psychologist works this weekday
-        if wd in disponibles_weekdays:
-            # Check if any appointment exists on this date
-            q_cita = await db.execute(
-                select(func.count())
-                .select_from(Cita)
-                .where(
-                    Cita.id_psicologo == id_psicologo,
-                    cast(Cita.fecha_hora_inicio, Date) == current,
-                )
-            )
-            total = q_cita.scalar_one()
-            if total == 0:
-                libres.append(current.isoformat())
-        current += timedelta(days=1)
-    # Sort dates descending
-    libres.sort(reverse=True)
-    return libres
 
 
 @router.delete("/{id_disponibilidad}", status_code=204)
@@ -221,4 +235,11 @@ async def delete_disponibilidad(
         raise HTTPException(status_code=404, detail="Disponibilidad no encontrada")
     await db.delete(disponibilidad)
     await db.commit()
+    slot_store.franja_eliminada(
+        disponibilidad.id_psicologo,
+        disponibilidad.dia_semana,
+        disponibilidad.hora_inicio,
+        disponibilidad.hora_fin,
+    )
+    await slot_store.publicar(disponibilidad.id_psicologo)
     return None
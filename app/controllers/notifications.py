@@ -1,11 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app.core.deps import get_db
 from app.models.notificacion import Notificacion
-from app.schemas.notificacion import NotificacionCreate, NotificacionRead
-from app.core.ws import manager
+from app.schemas.notificacion import (
+    NotificacionCreate,
+    NotificacionIds,
+    NotificacionRead,
+)
+from app.core.outbox import encolar
+from app.services.notificaciones import (
+    agrupar_por_destinatario,
+    destinatarios,
+    unread_counter,
+)
+from app.utils.pagination import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    apply_keyset,
+    split_page,
+    stream_ndjson,
+)
 
 router = APIRouter()
 
@@ -14,39 +34,59 @@ router = APIRouter()
 async def create_notification(
     notification_in: NotificacionCreate, db: AsyncSession = Depends(get_db)
 ):
-    noti = Notificacion(**notification_in.model_dump())
-    db.add(noti)
+    result = await db.execute(
+        insert(Notificacion)
+        .values(**notification_in.model_dump())
+        .returning(Notificacion)
+    )
+    noti = result.scalar_one()
+    target_users = destinatarios(noti.id_estudiante, noti.id_psicologo)
+    data = NotificacionRead.model_validate(noti).model_dump(mode="json")
+    await encolar(
+        db, ((uid, {"type": "notification_new", "data": data}) for uid in target_users)
+    )
     await db.commit()
-    await db.refresh(noti)
-    target_users = []
-    id_est = getattr(noti, "id_estudiante", None)
-    id_psi = getattr(noti, "id_psicologo", None)
-    if id_est:
-        target_users.append(id_est)
-    if id_psi and id_psi != id_est:
-        target_users.append(id_psi)
-    for uid in target_users:
-        await manager.send_to_user(
-            uid,
-            {
-                "type": "notification_new",
-                "data": NotificacionRead.from_orm(noti).model_dump(),
-            },
-        )
+    if not noti.leida:
+        unread_counter.adjust_many(target_users, 1)
+        await unread_counter.publicar(target_users)
     return noti
 
 
 @router.get("/user/{user_id}", response_model=list[NotificacionRead])
-async def list_notifications(user_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Notificacion)
-        .where(
+async def list_notifications(
+    user_id: int,
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    stmt = apply_keyset(
+        select(Notificacion).where(
             (Notificacion.id_estudiante == user_id)
             | (Notificacion.id_psicologo == user_id)
+        ),
+        [Notificacion.fecha_creacion, Notificacion.id_notificacion],
+        cursor,
+        descending=True,
+    )
+    if stream:
+        return StreamingResponse(
+            stream_ndjson(
+                stmt,
+                lambda row: NotificacionRead.model_validate(row[0]).model_dump_json(),
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
         )
-        .order_by(Notificacion.fecha_creacion.desc())
+    result = await db.execute(stmt.limit(limit + 1))
+    notis, next_cursor = split_page(
+        result.scalars().all(),
+        limit,
+        lambda n: (n.fecha_creacion, n.id_notificacion),
     )
-    return result.scalars().all()
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return notis
 
 
 @router.patch("/{notification_id}/read", response_model=NotificacionRead)
@@ -57,20 +97,21 @@ async def mark_as_read(notification_id: int, db: AsyncSession = Depends(get_db))
     noti = result.scalar_one_or_none()
     if not noti:
         raise HTTPException(status_code=404, detail="Notificación no encontrada")
+    estaba_leida = noti.leida
     setattr(noti, "leida", True)
+    targets = destinatarios(noti.id_estudiante, noti.id_psicologo)
+    await encolar(
+        db,
+        (
+            (uid, {"type": "notification_read", "id": noti.id_notificacion})
+            for uid in targets
+        ),
+    )
     await db.commit()
     await db.refresh(noti)
-    targets = []
-    id_est = getattr(noti, "id_estudiante", None)
-    id_psi = getattr(noti, "id_psicologo", None)
-    if id_est:
-        targets.append(id_est)
-    if id_psi and id_psi != id_est:
-        targets.append(id_psi)
-    for uid in targets:
-        await manager.send_to_user(
-            uid, {"type": "notification_read", "id": noti.id_notificacion}
-        )
+    if estaba_leida is False:
+        unread_counter.adjust_many(targets, -1)
+        await unread_counter.publicar(targets)
     return noti
 
 
@@ -82,33 +123,121 @@ async def delete_notification(notification_id: int, db: AsyncSession = Depends(g
     noti = result.scalar_one_or_none()
     if not noti:
         raise HTTPException(status_code=404, detail="Notificación no encontrada")
-    targets = []
-    id_est = getattr(noti, "id_estudiante", None)
-    id_psi = getattr(noti, "id_psicologo", None)
-    if id_est:
-        targets.append(id_est)
-    if id_psi and id_psi != id_est:
-        targets.append(id_psi)
+    targets = destinatarios(noti.id_estudiante, noti.id_psicologo)
     await db.delete(noti)
+    await encolar(
+        db,
+        ((uid, {"type": "notification_deleted", "id": notification_id}) for uid in targets),
+    )
     await db.commit()
-    for uid in targets:
-        await manager.send_to_user(
-            uid, {"type": "notification_deleted", "id": notification_id}
-        )
+    if noti.leida is False:
+        unread_counter.adjust_many(targets, -1)
+        await unread_counter.publicar(targets)
     return None
 
 
-@router.delete("/user/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_all_notifications(user_id: int, db: AsyncSession = Depends(get_db)):
+def _es_de_usuario(user_id: int):
+    return (Notificacion.id_estudiante == user_id) | (
+        Notificacion.id_psicologo == user_id
+    )
+
+
+_RETURNING = (
+    Notificacion.id_notificacion,
+    Notificacion.id_estudiante,
+    Notificacion.id_psicologo,
+)
+
+
+async def _marcar_leidas(db: AsyncSession, condicion) -> NotificacionIds:
+    # Un solo UPDATE ... RETURNING y un evento por usuario con todos los ids
     result = await db.execute(
-        select(Notificacion).where(
-            (Notificacion.id_estudiante == user_id)
-            | (Notificacion.id_psicologo == user_id)
-        )
+        update(Notificacion)
+        .where(condicion, Notificacion.leida == False)  # noqa: E712
+        .values(leida=True)
+        .returning(*_RETURNING)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    por_usuario = agrupar_por_destinatario(rows)
+    await encolar(
+        db,
+        (
+            (uid, {"type": "notifications_read", "ids": ids})
+            for uid, ids in por_usuario.items()
+        ),
+    )
+    await db.commit()
+    for uid, ids in por_usuario.items():
+        unread_counter.adjust(uid, -len(ids))
+    await unread_counter.publicar(por_usuario)
+    return NotificacionIds(ids=[row[0] for row in rows])
+
+
+@router.patch("/user/{user_id}/read-all", response_model=NotificacionIds)
+async def mark_all_as_read(user_id: int, db: AsyncSession = Depends(get_db)):
+    return await _marcar_leidas(db, _es_de_usuario(user_id))
+
+
+@router.post("/read", response_model=NotificacionIds)
+async def mark_many_as_read(
+    ids_in: NotificacionIds, db: AsyncSession = Depends(get_db)
+):
+    if not ids_in.ids:
+        return NotificacionIds()
+    return await _marcar_leidas(db, Notificacion.id_notificacion.in_(ids_in.ids))
+
+
+async def _borrar(db: AsyncSession, condicion, evento, siempre=()):
+    # Un solo DELETE ... RETURNING; ``evento(uid, ids)`` arma el mensaje de
+    # cada usuario, encolado en la misma transacción. Los usuarios de
+    # ``siempre`` reciben el suyo aunque no se borre ninguna fila
+    result = await db.execute(
+        delete(Notificacion)
+        .where(condicion)
+        .returning(*_RETURNING, Notificacion.leida)
+        .execution_options(synchronize_session=False)
     )
-    notis = result.scalars().all()
-    for n in notis:
-        await db.delete(n)
+    rows = result.all()
+    por_usuario = agrupar_por_destinatario(row[:3] for row in rows)
+    for uid in siempre:
+        por_usuario.setdefault(uid, [])
+    await encolar(db, ((uid, evento(uid, ids)) for uid, ids in por_usuario.items()))
     await db.commit()
-    await manager.send_to_user(user_id, {"type": "notifications_cleared"})
+    no_leidas = agrupar_por_destinatario(
+        (id_n, id_est, id_psi) for id_n, id_est, id_psi, leida in rows if leida is False
+    )
+    for uid, ids in no_leidas.items():
+        unread_counter.adjust(uid, -len(ids))
+    await unread_counter.publicar(no_leidas)
+    return [row[0] for row in rows]
+
+
+@router.post("/delete", response_model=NotificacionIds)
+async def delete_many_notifications(
+    ids_in: NotificacionIds, db: AsyncSession = Depends(get_db)
+):
+    if not ids_in.ids:
+        return NotificacionIds()
+    borradas = await _borrar(
+        db,
+        Notificacion.id_notificacion.in_(ids_in.ids),
+        lambda uid, ids: {"type": "notifications_deleted", "ids": ids},
+    )
+    return NotificacionIds(ids=borradas)
+
+
+@router.delete("/user/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_all_notifications(user_id: int, db: AsyncSession = Depends(get_db)):
+    # El usuario siempre recibe notifications_cleared, como antes, ahora con
+    # los ids borrados; la otra parte de cada notificación también la pierde
+    await _borrar(
+        db,
+        _es_de_usuario(user_id),
+        lambda uid, ids: {
+            "type": "notifications_cleared" if uid == user_id else "notifications_deleted",
+            "ids": ids,
+        },
+        siempre=(user_id,),
+    )
     return None
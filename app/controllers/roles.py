@@ -5,6 +5,7 @@ from sqlalchemy.future import select
 from app.core.deps import get_db
 from app.models.roles import Role
 from app.schemas.roles import RoleCreate, RoleRead
+from app.services.catalogos import invalidar_catalogos, role_catalog, staff_directory
 
 router = APIRouter()
 
@@ -15,6 +16,7 @@ async def create_role(role_in: RoleCreate, db: AsyncSession = Depends(get_db)):
     db.add(db_role)
     await db.commit()
     await db.refresh(db_role)
+    await invalidar_catalogos()
     return db_role
 
 
@@ -24,6 +26,12 @@ async def list_roles(db: AsyncSession = Depends(get_db)):
     return result.scalars().all()
 
 
+@router.get("/cache-stats")
+async def role_cache_stats():
+    # Aciertos y fallos de los catálogos en memoria de este proceso
+    return {"roles": role_catalog.stats(), "staff": staff_directory.stats()}
+
+
 @router.get("/{role_id}", response_model=RoleRead)
 async def get_role(role_id: int, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(Role).where(Role.id_rol == role_id))
@@ -41,3 +49,4 @@ async def delete_role(role_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Role not found")
     await db.delete(role)
     await db.commit()
+    await invalidar_catalogos()
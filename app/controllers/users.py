@@ -1,14 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Body, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from typing import Any
 
 from app.core.deps import get_db
+from app.core.ws import manager, topico_rol
 from app.models.users import User
 from app.schemas.users import UserCreate, UserRead, UserUpdate
-from app.models.roles import Role
+from app.services.catalogos import invalidar_catalogos, role_catalog
 from app.services.users import UserService
 from app.core.security import get_password_hash, verify_password
+from app.utils.pagination import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    NDJSON_MEDIA_TYPE,
+    NEXT_CURSOR_HEADER,
+    apply_keyset,
+    split_page,
+    stream_ndjson,
+)
 
 router = APIRouter()
 
@@ -25,13 +36,33 @@ async def create_user(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    await invalidar_catalogos(roles=False)
     return db_user
 
 
 @router.get("/", response_model=list[UserRead])
-async def list_users(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(User))
-    return result.scalars().all()
+async def list_users(
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    stmt = apply_keyset(select(User), [User.id_usuario], cursor)
+    if stream:
+        return StreamingResponse(
+            stream_ndjson(
+                stmt, lambda row: UserRead.model_validate(row[0]).model_dump_json()
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+    result = await db.execute(stmt.limit(limit + 1))
+    users, next_cursor = split_page(
+        result.scalars().all(), limit, lambda u: (u.id_usuario,)
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return users
 
 
 @router.get("/{user_id}", response_model=UserRead)
@@ -51,6 +82,7 @@ async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="User not found")
     await db.delete(user)
     await db.commit()
+    await invalidar_catalogos(roles=False)
     return Response(status_code=204)
 
 
@@ -58,11 +90,10 @@ async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
 async def create_default_users(db: AsyncSession = Depends(get_db)):
     # Utilidad para buscar rol por nombre
     async def get_role_id(nombre_rol):
-        result = await db.execute(select(Role).where(Role.nombre_rol == nombre_rol))
-        role = result.scalar_one_or_none()
-        if not role:
+        id_rol = await role_catalog.id_de(db, nombre_rol)
+        if id_rol is None:
             raise Exception(f"Role '{nombre_rol}' not found")
-        return role.id_rol
+        return id_rol
 
     usuarios = [
         {
@@ -102,6 +133,7 @@ async def create_default_users(db: AsyncSession = Depends(get_db)):
                     "msg": "Ya existía",
                 }
             )
+    await invalidar_catalogos(roles=False)
     return results
 
 
@@ -141,6 +173,11 @@ async def patch_user(
     db.add(user)
     await db.commit()
     await db.refresh(user)
+    if "id_rol" in user_update:
+        await invalidar_catalogos(roles=False)
+        # Los sockets abiertos pasan al tópico del rol nuevo
+        rol = await role_catalog.nombre_de(db, user.id_rol)
+        await manager.cambiar_topicos(user_id, [topico_rol(rol)] if rol else [])
     return user
 
 
@@ -1,10 +1,24 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    WebSocket,
+    WebSocketDisconnect,
+    Query,
+    status,
+)
 from jose import jwt, JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from app.core.ws import manager
-from app.models.notificacion import Notificacion
+from app.core.deps import get_db
+from app.core.security import get_current_user
+from app.core.outbox import eventos_desde
+from app.core.ws import encode, manager, topico_rol
 from app.core.config import settings
+from app.models.users import User
+from app.services.catalogos import role_catalog
+from app.services.notificaciones import unread_counter
 
 
 router = APIRouter()
@@ -12,9 +26,18 @@ router = APIRouter()
 SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 
+# Respuestas del cliente al ping del servidor; no se contestan con "pong"
+PONG_MESSAGES = ("pong", '{"type":"pong"}', '{"type": "pong"}')
+
 
 @router.websocket("/ws/notifications")
-async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    token: str = Query(...),
+    batch: bool = False,
+    last_seq: int | None = None,
+    heartbeat: bool = False,
+):
     # Accept early to avoid 403 during handshake; close with custom code on failure
     await websocket.accept()
     try:
@@ -27,34 +50,86 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
         await websocket.close(code=4401)
         return
 
-    await manager.connect(user_id, websocket)
+    # batch=true: los eventos de cada ventana llegan en un frame {"type": "batch"}
+    # last_seq: seq del último evento recibido; se reponen solo los perdidos
+    # heartbeat=true: pings {"type": "ping"} que el cliente debe contestar;
+    # sin él, los sockets muertos los detectan los pings de protocolo de uvicorn
+    await manager.connect(
+        user_id,
+        websocket,
+        batch_window=settings.ws_batch_window_ms / 1000 if batch else 0.0,
+        paused=last_seq is not None,
+        heartbeat=heartbeat,
+    )
 
-    # Send initial count of unread notifications
-    try:
-        # Lazy import to avoid circular app
-        from app.core.database import AsyncSessionLocal
+    # Lazy import to avoid circular app
+    from app.core.database import AsyncSessionLocal
 
+    # Role topic (e.g. "rol:PSICOLOGO") and initial count of unread notifications
+    topics = []
+    try:
         async with AsyncSessionLocal() as db:
-            result = await db.execute(
-                select(Notificacion).where(
-                    (
-                        (Notificacion.id_estudiante == user_id)
-                        | (Notificacion.id_psicologo == user_id)
-                    )
-                    & (Notificacion.leida == False)  # noqa: E712
-                )
+            id_rol = await db.scalar(
+                select(User.id_rol).where(User.id_usuario == user_id)
+            )
+            rol = await role_catalog.nombre_de(db, id_rol)
+            if rol:
+                topics.append(topico_rol(rol))
+                manager.subscribe(user_id, websocket, topics)
+            unread_count = await unread_counter.get(db, user_id)
+            manager.send_to_socket(
+                user_id, websocket, {"type": "unread_count", "count": unread_count}
             )
-            unread_count = len(result.scalars().all())
-            await websocket.send_json({"type": "unread_count", "count": unread_count})
     except Exception:  # noqa: BLE001 - keep connection open on failure
         # Don't terminate connection on initial count failure
         pass
 
+    if last_seq is not None:
+        replay = manager.buffered_since([user_id, *topics], last_seq)
+        if replay is None:
+            # El búfer no cubre el hueco (p. ej. tras un deploy): se intenta
+            # con la Outbox; si tampoco alcanza, el cliente recibe "resync"
+            try:
+                async with AsyncSessionLocal() as db:
+                    eventos = await eventos_desde(db, user_id, topics, last_seq)
+                if eventos is not None:
+                    replay = [(evento, encode(evento)) for evento in eventos]
+            except Exception:  # noqa: BLE001 - fall back to resync
+                pass
+        manager.resume(user_id, websocket, replay)
+
+    code = None
     try:
         while True:
-            # Keep connection open; optionally receive pings
-            _ = await websocket.receive_text()
+            # Keep connection open; any client message proves liveness
+            text = await websocket.receive_text()
+            manager.touch(user_id, websocket)
+            if text.strip() in PONG_MESSAGES:
+                continue
             # Echo ping-pong
-            await websocket.send_json({"type": "pong"})
-    except WebSocketDisconnect:
-        manager.disconnect(user_id, websocket)
+            manager.send_to_socket(user_id, websocket, {"type": "pong"})
+    except WebSocketDisconnect as exc:
+        # 1006/1011: uvicorn dio el socket por muerto (ping sin respuesta)
+        code = exc.code
+    except RuntimeError:
+        # El servidor ya cerró el socket (reaper, límite por usuario o fallo
+        # de envío)
+        pass
+    finally:
+        manager.disconnect(user_id, websocket, code)
+
+
+@router.get("/ws/notifications/stats", tags=["Notificaciones"])
+async def websocket_stats(
+    current_user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    id_rol = await db.scalar(
+        select(User.id_rol).where(User.id_usuario == int(current_user))
+    )
+    if await role_catalog.nombre_de(db, id_rol) != "ADMINISTRADOR":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo un administrador puede ver estas estadísticas",
+        )
+    return manager.stats()
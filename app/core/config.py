@@ -14,6 +14,32 @@ class Settings(BaseSettings):
     secret_key: str = Field(default=..., validation_alias="SECRET_KEY")
     algorithm: str = Field(default=..., validation_alias="ALGORITHM")
     access_token_expire_minutes: int = Field(default=60, validation_alias="ACCESS_TOKEN_EXPIRE_MINUTES")
+    # Zona horaria (IANA) en la que se interpretan las franjas de disponibilidad
+    timezone: str = Field(default="UTC", validation_alias="TIMEZONE")
+    # Despachador de eventos en tiempo real (tabla Outbox)
+    outbox_batch_size: int = Field(default=500, validation_alias="OUTBOX_BATCH_SIZE")
+    outbox_poll_interval: float = Field(default=1.0, validation_alias="OUTBOX_POLL_INTERVAL")
+    outbox_retention_hours: int = Field(default=24, validation_alias="OUTBOX_RETENTION_HOURS")
+    # Cola de salida por conexión WebSocket y política ante clientes lentos:
+    # "drop_oldest", "coalesce" o "disconnect"
+    ws_queue_size: int = Field(default=100, validation_alias="WS_QUEUE_SIZE")
+    ws_slow_policy: str = Field(default="drop_oldest", validation_alias="WS_SLOW_POLICY")
+    ws_send_timeout: float = Field(default=5.0, validation_alias="WS_SEND_TIMEOUT")
+    # Latido JSON para los sockets que lo piden (?heartbeat=true): ping tras
+    # WS_PING_INTERVAL s sin tráfico del cliente y cierre si no responde en
+    # WS_PING_TIMEOUT s. Los demás dependen de los pings de protocolo de
+    # uvicorn (20 s y 20 s por defecto). Máximo de sockets por usuario
+    ws_ping_interval: float = Field(default=25.0, validation_alias="WS_PING_INTERVAL")
+    ws_ping_timeout: float = Field(default=10.0, validation_alias="WS_PING_TIMEOUT")
+    ws_max_per_user: int = Field(default=5, validation_alias="WS_MAX_PER_USER")
+    # Ventana de agrupación para las conexiones que la piden (?batch=true)
+    ws_batch_window_ms: int = Field(default=25, validation_alias="WS_BATCH_WINDOW_MS")
+    # Eventos recientes por usuario que se reponen al reconectar con last_seq
+    ws_replay_buffer: int = Field(default=256, validation_alias="WS_REPLAY_BUFFER")
+    # Segundos que se conserva ese búfer tras cerrarse el último socket del usuario
+    ws_replay_ttl: float = Field(default=120.0, validation_alias="WS_REPLAY_TTL")
+    # Reparto entre procesos: "memory" (un solo proceso) o "postgres" (LISTEN/NOTIFY)
+    ws_backend: str = Field(default="memory", validation_alias="WS_BACKEND")
 
     model_config = SettingsConfigDict(
         env_file=str(env_path),
@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import (
+    BigInteger,
+    bindparam,
+    delete,
+    event,
+    func,
+    insert,
+    or_,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine
+from app.core.pubsub import PublicacionParcialError
+from app.core.ws import Destino, manager
+from app.models.outbox import OUTBOX_SEQ, EventoOutbox
+
+logger = logging.getLogger(__name__)
+
+# Clave en Session.info que marca una transacción con eventos encolados
+_PENDIENTE = "outbox_pendiente"
+# Cada cuánto se purgan los eventos ya entregados
+PURGE_INTERVAL = 600.0
+# Candado consultivo del despachador ("Outbox" en ASCII)
+DISPATCH_LOCK = 0x4F7574626F78
+
+
+async def encolar(
+    db: AsyncSession, mensajes: Iterable[Tuple[Destino, dict]]
+) -> None:
+    """Escribe los eventos en la Outbox dentro de la transacción de ``db``.
+
+    El destino es un id de usuario o un tópico (``topico_rol(...)``). No hace
+    commit: los eventos se confirman (o descartan) junto con el cambio de
+    dominio, y el despachador los entrega después.
+    """
+    filas = [
+        {
+            "id_usuario": None if isinstance(destino, str) else destino,
+            "topico": destino if isinstance(destino, str) else None,
+            "payload": jsonable_encoder(message),
+        }
+        for destino, message in mensajes
+    ]
+    if not filas:
+        return
+    await db.execute(insert(EventoOutbox).values(filas))
+    db.info[_PENDIENTE] = True
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        batch_size: int = settings.outbox_batch_size,
+        poll_interval: float = settings.outbox_poll_interval,
+        retention: timedelta = timedelta(hours=settings.outbox_retention_hours),
+    ) -> None:
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._ultima_purga = 0.0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def notify(self) -> None:
+        # Despierta al despachador sin esperar al siguiente sondeo
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                entregados = await self.drain_once()
+                await self._purgar()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error al despachar la Outbox")
+                entregados = 0
+            if entregados >= self.batch_size:
+                # Quedan eventos pendientes: siguiente lote sin esperar
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain_once(self) -> int:
+        """Entrega un lote de eventos pendientes y los marca como entregados.
+
+        El seq que ve el cliente se asigna aquí y no al insertar: un evento
+        cuya transacción confirmó tarde recibe un seq mayor que los ya
+        entregados. Un candado consultivo deja un solo despachador activo
+        entre todos los procesos, así los seq se publican en orden.
+        """
+        # Conexión propia: el candado es de sesión y debe durar hasta publicar
+        async with engine.connect() as conn:
+            bloqueado = await conn.scalar(
+                select(func.pg_try_advisory_lock(DISPATCH_LOCK))
+            )
+            await conn.commit()
+            if not bloqueado:
+                return 0
+            try:
+                return await self._despachar(conn)
+            finally:
+                try:
+                    await conn.execute(select(func.pg_advisory_unlock(DISPATCH_LOCK)))
+                    await conn.commit()
+                except Exception:
+                    # Cerrar la conexión también libera el candado
+                    logger.exception("No se pudo liberar el candado de la Outbox")
+                    await conn.invalidate()
+
+    async def _despachar(self, conn: AsyncConnection) -> int:
+        async with conn.begin():
+            result = await conn.execute(
+                select(
+                    EventoOutbox.id_evento,
+                    EventoOutbox.id_usuario,
+                    EventoOutbox.topico,
+                    EventoOutbox.payload,
+                )
+                .where(EventoOutbox.fecha_entrega.is_(None))
+                .order_by(EventoOutbox.id_evento)
+                .limit(self.batch_size)
+                .with_for_update()
+            )
+            rows = result.all()
+            if not rows:
+                return 0
+            result = await conn.execute(
+                select(OUTBOX_SEQ.next_value()).select_from(
+                    func.generate_series(1, len(rows))
+                )
+            )
+            seqs = sorted(result.scalars().all())
+            ids = [row[0] for row in rows]
+            asignados = (
+                func.unnest(
+                    bindparam("ids", ids, type_=ARRAY(BigInteger)),
+                    bindparam("seqs", seqs, type_=ARRAY(BigInteger)),
+                )
+                .table_valued("id_evento", "seq")
+                .render_derived()
+            )
+            await conn.execute(
+                update(EventoOutbox)
+                .where(EventoOutbox.id_evento == asignados.c.id_evento)
+                .values(seq=asignados.c.seq, fecha_entrega=func.now())
+            )
+        # Se publica tras el commit: los demás procesos ya pueden leer el
+        # evento por su seq (referencias de NOTIFY y reposición)
+        try:
+            await manager.publish(
+                (topico or user_id, {**payload, "seq": seq})
+                for (_, user_id, topico, payload), seq in zip(rows, seqs)
+            )
+        except Exception as exc:
+            # Los que no salieron vuelven a pendientes y reciben seq nuevos en
+            # el próximo lote, para no publicarlos detrás de seq mayores. Los
+            # ya publicados conservan su seq: reenviarlos con otro sería un
+            # duplicado que el cliente no podría descartar
+            publicados = exc.publicados if isinstance(exc, PublicacionParcialError) else 0
+            if publicados < len(ids):
+                async with conn.begin():
+                    await conn.execute(
+                        update(EventoOutbox)
+                        .where(EventoOutbox.id_evento.in_(ids[publicados:]))
+                        .values(seq=None, fecha_entrega=None)
+                    )
+            raise
+        return len(rows)
+
+    async def _purgar(self) -> None:
+        ahora = time.monotonic()
+        if ahora - self._ultima_purga < PURGE_INTERVAL:
+            return
+        self._ultima_purga = ahora
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                delete(EventoOutbox).where(
+                    EventoOutbox.fecha_entrega < func.now() - self.retention
+                )
+            )
+            await db.commit()
+
+
+dispatcher = OutboxDispatcher()
+
+
+async def cargar_eventos(seqs: List[int]) -> List[Tuple[Destino, dict]]:
+    """Eventos de la Outbox por seq, en orden, listos para ``send_many``."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(
+                EventoOutbox.seq,
+                EventoOutbox.id_usuario,
+                EventoOutbox.topico,
+                EventoOutbox.payload,
+            )
+            .where(EventoOutbox.seq.in_(seqs))
+            .order_by(EventoOutbox.seq)
+        )
+        return [
+            (topico or user_id, {**payload, "seq": seq})
+            for seq, user_id, topico, payload in result.all()
+        ]
+
+
+async def eventos_desde(
+    db: AsyncSession,
+    user_id: int,
+    topicos: Iterable[str],
+    last_seq: int,
+    limit: int = settings.ws_replay_buffer,
+) -> Optional[List[dict]]:
+    """Eventos ya entregados a ``user_id`` o a sus tópicos con seq > ``last_seq``.
+
+    Respaldo del búfer en memoria (vacío tras un reinicio). ``[]`` si no se
+    perdió nada, aunque la Outbox esté vacía. ``None`` si el hueco no se
+    puede reponer: la purga ya borró parte de él o supera ``limit`` eventos.
+    """
+    primero = await db.scalar(select(func.min(EventoOutbox.seq)))
+    if primero is None:
+        # Outbox vacía (purga o inactividad): no falta nada si el cliente ya
+        # vio el último seq asignado
+        result = await db.execute(
+            text(f'SELECT last_value, is_called FROM "{OUTBOX_SEQ.name}"')
+        )
+        last_value, is_called = result.one()
+        ultimo = last_value if is_called else last_value - 1
+        return [] if last_seq >= ultimo else None
+    if last_seq + 1 < primero:
+        return None
+    result = await db.execute(
+        select(EventoOutbox.seq, EventoOutbox.payload)
+        .where(
+            or_(
+                EventoOutbox.id_usuario == user_id,
+                EventoOutbox.topico.in_(list(topicos)),
+            ),
+            EventoOutbox.seq > last_seq,
+        )
+        .order_by(EventoOutbox.seq)
+        .limit(limit + 1)
+    )
+    rows = result.all()
+    if len(rows) > limit:
+        return None
+    return [{**payload, "seq": seq} for seq, payload in rows]
+
+
+@event.listens_for(Session, "after_commit")
+def _despertar_despachador(session: Session) -> None:
+    if session.info.pop(_PENDIENTE, False):
+        dispatcher.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_pendiente(session: Session) -> None:
+    session.info.pop(_PENDIENTE, None)
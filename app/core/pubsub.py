@@ -0,0 +1,207 @@
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional, Tuple, Union
+
+import asyncpg
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Destino de un evento: un id de usuario o un tópico como "rol:PSICOLOGO"
+Destino = Union[int, str]
+Mensajes = List[Tuple[Destino, dict]]
+Deliver = Callable[[Mensajes], None]
+
+# Postgres rechaza payloads de NOTIFY de 8000 bytes o más
+NOTIFY_MAX_BYTES = 7900
+NOTIFY_CHANNEL = "ws_events"
+# Un evento de la Outbox que no cabe viaja como referencia a su seq
+REF_KEY = "$ref"
+RECONNECT_DELAY = 2.0
+
+
+class PublicacionParcialError(Exception):
+    """La publicación falló después de entregar los primeros ``publicados`` mensajes."""
+
+    def __init__(self, publicados: int) -> None:
+        super().__init__(f"Publicación interrumpida tras {publicados} mensajes")
+        self.publicados = publicados
+
+
+class PubSubBackend(ABC):
+    """Reparte eventos a las conexiones de todos los procesos.
+
+    ``deliver`` es la entrega local del proceso (``ConnectionManager.send_many``).
+    """
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    async def publish(self, messages: Mensajes) -> None:
+        """Entrega ``messages`` a todos los procesos, en orden.
+
+        Si falla a mitad de camino lanza ``PublicacionParcialError`` con
+        cuántos mensajes del principio ya salieron.
+        """
+
+
+class InMemoryBackend(PubSubBackend):
+    # Un solo proceso: publicar es entregar localmente
+    async def publish(self, messages: Mensajes) -> None:
+        self._deliver(messages)
+
+
+def _asyncpg_dsn(url: str) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+class PostgresBackend(PubSubBackend):
+    """LISTEN/NOTIFY sobre una conexión asyncpg dedicada.
+
+    Cada proceso escucha el canal y entrega a sus propios sockets, incluido
+    el que publica (Postgres también le notifica a la sesión emisora).
+    """
+
+    def __init__(self, dsn: str, channel: str = NOTIFY_CHANNEL) -> None:
+        self.dsn = _asyncpg_dsn(dsn)
+        self.channel = channel
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._reconnect: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Payloads recibidos, entregados de a uno y en orden de llegada
+        self._entrantes: "asyncio.Queue[list]" = asyncio.Queue()
+        self._entrega: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        await super().start(deliver)
+        self._stopping = False
+        if self._entrega is None or self._entrega.done():
+            self._entrega = asyncio.create_task(self._entregar())
+        await self._connect()
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._reconnect is not None:
+            self._reconnect.cancel()
+        if self._entrega is not None:
+            self._entrega.cancel()
+            await asyncio.gather(self._entrega, return_exceptions=True)
+            self._entrega = None
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+    async def _connect(self) -> None:
+        async with self._lock:
+            if self._conn is not None and not self._conn.is_closed():
+                return
+            conn = await asyncpg.connect(self.dsn)
+            await conn.add_listener(self.channel, self._on_notify)
+            conn.add_termination_listener(self._on_terminate)
+            self._conn = conn
+
+    def _on_terminate(self, _conn) -> None:
+        if not self._stopping and (self._reconnect is None or self._reconnect.done()):
+            self._reconnect = asyncio.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self) -> None:
+        while not self._stopping:
+            try:
+                await self._connect()
+                return
+            except Exception:
+                logger.exception("No se pudo reconectar el canal LISTEN")
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    def _on_notify(self, _conn, _pid, _channel, payload: str) -> None:
+        try:
+            items = json.loads(payload)
+        except Exception:
+            logger.exception("Payload de NOTIFY inválido")
+            return
+        self._entrantes.put_nowait(items)
+
+    async def _entregar(self) -> None:
+        # Una referencia se resuelve antes de entregar lo que vino después:
+        # los sockets reciben los seq en el orden en que se publicaron
+        while True:
+            items = await self._entrantes.get()
+            refs = [message[REF_KEY] for _, message in items if REF_KEY in message]
+            if refs:
+                items = await self._resolve(items, refs)
+            self._deliver(items)
+
+    async def _resolve(self, items: Mensajes, refs: List[int]) -> Mensajes:
+        # Lazy import to avoid circular app (outbox -> ws -> pubsub)
+        from app.core.outbox import cargar_eventos
+
+        try:
+            cargados = {
+                message["seq"]: (destino, message)
+                for destino, message in await cargar_eventos(refs)
+            }
+        except Exception:
+            logger.exception("No se pudieron cargar eventos de la Outbox")
+            cargados = {}
+        return [
+            cargados[message[REF_KEY]] if REF_KEY in message else (destino, message)
+            for destino, message in items
+            if REF_KEY not in message or message[REF_KEY] in cargados
+        ]
+
+    def _chunks(self, messages: Mensajes):
+        # Agrupa los mensajes en payloads bajo el límite de NOTIFY; con cada
+        # payload va cuántos mensajes del principio quedan cubiertos al enviarlo
+        chunk: List[str] = []
+        size = 2
+        for i, (destino, message) in enumerate(messages):
+            item = json.dumps([destino, message], separators=(",", ":"), default=str)
+            item_size = len(item.encode()) + 1
+            if item_size + 2 > NOTIFY_MAX_BYTES:
+                if "seq" in message:
+                    # Cada proceso lo lee de la Outbox por su seq
+                    item = json.dumps(
+                        [destino, {REF_KEY: message["seq"]}], separators=(",", ":")
+                    )
+                    item_size = len(item.encode()) + 1
+                else:
+                    # No cabe en un NOTIFY: solo lo reciben los sockets locales
+                    logger.warning("Evento de %d bytes entregado solo localmente", item_size)
+                    self._deliver([(destino, message)])
+                    continue
+            if size + item_size > NOTIFY_MAX_BYTES:
+                yield "[" + ",".join(chunk) + "]", i
+                chunk, size = [], 2
+            chunk.append(item)
+            size += item_size
+        if chunk:
+            yield "[" + ",".join(chunk) + "]", len(messages)
+
+    async def publish(self, messages: Mensajes) -> None:
+        if self._conn is None or self._conn.is_closed():
+            await self._connect()
+        publicados = 0
+        for payload, hasta in self._chunks(messages):
+            try:
+                await self._conn.execute(
+                    "SELECT pg_notify($1, $2)", self.channel, payload
+                )
+            except Exception as exc:
+                raise PublicacionParcialError(publicados) from exc
+            publicados = hasta
+
+
+def create_backend(name: str = settings.ws_backend) -> PubSubBackend:
+    if name == "memory":
+        return InMemoryBackend()
+    if name == "postgres":
+        return PostgresBackend(str(settings.database_url))
+    raise ValueError(f"Backend de WebSocket desconocido: {name}")
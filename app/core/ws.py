@@ -1,34 +1,726 @@
-from typing import Dict, Set
-from fastapi import WebSocket
+import asyncio
+import logging
+import sys
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic_core import to_json
+
+from app.core.config import settings
+from app.core.pubsub import Destino, PubSubBackend, create_backend
+
+logger = logging.getLogger(__name__)
+
+# Políticas ante una cola de salida llena
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+SLOW_POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+# Códigos de cierre: cliente que no consume a tiempo ("try again later"),
+# fallo al enviar, socket sin respuesta al ping y socket desalojado por el
+# límite por usuario
+SLOW_CONSUMER_CLOSE_CODE = 1013
+SEND_ERROR_CLOSE_CODE = 1011
+IDLE_CLOSE_CODE = 4408
+CONNECTION_LIMIT_CLOSE_CODE = 4429
+# Cierres que reporta el servidor ASGI para un socket muerto: sin respuesta
+# al ping de protocolo de uvicorn (1011) o conexión cortada sin cierre (1006)
+DEAD_SOCKET_CODES = (1006, 1011)
+
+# Destino reservado para avisos entre procesos (invalidación de cachés): sus
+# mensajes van a los manejadores registrados con on_control, no a sockets
+CONTROL_TOPIC = "$control"
+
+# Aviso entre procesos: cambiaron los tópicos de un usuario (p. ej. su rol)
+TOPICOS_CAMBIADOS = "topicos_cambiados"
+
+PING_MESSAGE = {"type": "ping"}
+# El hueco desde last_seq ya no se puede reponer: el cliente debe recargar
+RESYNC_MESSAGE = {"type": "resync"}
+
+# Eventos cuya lista de ids se puede fusionar con uno pendiente del mismo tipo
+_EVENTOS_CON_IDS = ("notifications_read", "notifications_deleted", "notifications_cleared")
+# Eventos en los que solo importa el último valor
+_EVENTOS_DE_ESTADO = ("unread_count",)
+
+
+# Mensaje ya serializado: el dict se conserva solo para poder fusionarlo
+Envelope = Tuple[dict, str]
+
+
+def topico_rol(nombre_rol: str) -> str:
+    # Tópico al que se suscriben los sockets de los usuarios con ese rol
+    return f"rol:{nombre_rol}"
+
+
+def encode(message: dict) -> str:
+    # Una sola serialización por evento, compartida por todos los sockets
+    return to_json(message).decode()
+
+
+def _coalesce(queue: Deque[Envelope], message: dict) -> bool:
+    """Intenta fusionar ``message`` con uno pendiente en la cola.
+
+    El fusionado pasa al final de la cola con el seq de ``message``: así los
+    seq siguen en orden y ningún evento posterior al pendiente llega antes.
+    """
+    tipo = message.get("type")
+    if tipo not in _EVENTOS_CON_IDS and tipo not in _EVENTOS_DE_ESTADO:
+        return False
+    for i in range(len(queue) - 1, -1, -1):
+        pendiente = queue[i][0]
+        if pendiente.get("type") != tipo:
+            continue
+        if tipo in _EVENTOS_DE_ESTADO:
+            fusionado = message
+        else:
+            ids = list(pendiente.get("ids", []))
+            ids.extend(x for x in message.get("ids", []) if x not in ids)
+            fusionado = {**pendiente, "ids": ids}
+            if "seq" in message:
+                fusionado["seq"] = message["seq"]
+        del queue[i]
+        queue.append((fusionado, encode(fusionado)))
+        return True
+    return False
+
+
+_PING_TEXT = encode(PING_MESSAGE)
+_RESYNC_TEXT = encode(RESYNC_MESSAGE)
+
+
+_LECTURAS = ("notification_read", "notifications_read")
+_BORRADOS = ("notification_deleted", "notifications_deleted")
+
+
+def _ids(message: dict) -> list:
+    return list(message["ids"]) if "ids" in message else [message.get("id")]
+
+
+def _merged(tipo: str, ids: list, seq: Optional[int]) -> str:
+    # Un evento fusionado lleva el seq más alto de los que reemplaza
+    message = {"type": tipo, "ids": ids}
+    if seq is not None:
+        message["seq"] = seq
+    return encode(message)
+
+
+def _batch_frame(envelopes: Iterable[Envelope]) -> Tuple[Optional[str], int]:
+    """Arma un solo frame con los eventos acumulados en la ventana.
+
+    Las lecturas se juntan en un único ``notifications_read`` sin los ids que
+    además se borraron, los borrados en un único ``notifications_deleted`` y
+    de ``unread_count`` solo queda el último. Cada fusionado ocupa el lugar
+    del último evento que reemplaza y lleva su seq, así los seq del frame
+    quedan en orden. Devuelve el frame y cuántos eventos lleva.
+    """
+    partes: List[Optional[str]] = []
+    leidas: Dict[int, None] = {}
+    borradas: Dict[int, None] = {}
+    eliminadas = set()
+    pos_leidas = pos_borradas = pos_count = None
+    ultimo_count = None
+    seq_leidas = seq_borradas = None
+
+    def mover(pos: Optional[int]) -> int:
+        # Libera el lugar anterior del fusionado y reserva uno al final
+        if pos is not None:
+            partes[pos] = None
+        partes.append(None)
+        return len(partes) - 1
+
+    for message, data in envelopes:
+        tipo = message.get("type")
+        seq = message.get("seq")
+        if tipo in _LECTURAS:
+            pos_leidas = mover(pos_leidas)
+            leidas.update(dict.fromkeys(_ids(message)))
+            seq_leidas = seq if seq is not None else seq_leidas
+        elif tipo in _BORRADOS:
+            pos_borradas = mover(pos_borradas)
+            borradas.update(dict.fromkeys(_ids(message)))
+            eliminadas.update(_ids(message))
+            seq_borradas = seq if seq is not None else seq_borradas
+        elif tipo == "unread_count":
+            pos_count = mover(pos_count)
+            ultimo_count = data
+        else:
+            if tipo == "notifications_cleared":
+                eliminadas.update(_ids(message))
+            partes.append(data)
+    if pos_leidas is not None:
+        ids = [i for i in leidas if i not in eliminadas]
+        if ids:
+            partes[pos_leidas] = _merged("notifications_read", ids, seq_leidas)
+    if pos_borradas is not None:
+        partes[pos_borradas] = _merged(
+            "notifications_deleted", list(borradas), seq_borradas
+        )
+    if pos_count is not None:
+        partes[pos_count] = ultimo_count
+    eventos = [parte for parte in partes if parte is not None]
+    if not eventos:
+        return None, 0
+    if len(eventos) == 1:
+        return eventos[0], 1
+    # Los eventos ya vienen serializados: el frame se arma sin re-codificarlos
+    return '{"type":"batch","events":[' + ",".join(eventos) + "]}", len(eventos)
+
+
+def _shallow_size(obj) -> int:
+    # El objeto y su __dict__, sin seguir referencias (pueden ser compartidas)
+    d = getattr(obj, "__dict__", None)
+    return sys.getsizeof(obj) + (sys.getsizeof(d) if d is not None else 0)
+
+
+class _Connection:
+    # Socket con su cola de salida acotada y su tarea escritora; __slots__
+    # mantiene compacto el registro con miles de conexiones abiertas
+    __slots__ = (
+        "user_id",
+        "websocket",
+        "queue",
+        "ready",
+        "close_code",
+        "stopped",
+        "dropped",
+        "writer",
+        "connected_at",
+        "last_seen",
+        "last_ping",
+        "batch_window",
+        "paused",
+        "topics",
+        "heartbeat",
+    )
+
+    def __init__(
+        self,
+        user_id: int,
+        websocket: WebSocket,
+        batch_window: float = 0.0,
+        paused: bool = False,
+        heartbeat: bool = False,
+    ) -> None:
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue: Deque[Envelope] = deque()
+        self.ready = asyncio.Event()
+        self.close_code: Optional[int] = None
+        self.stopped = False
+        self.dropped = 0
+        self.writer: Optional[asyncio.Task] = None
+        self.connected_at = self.last_seen = time.monotonic()
+        self.last_ping = 0.0
+        self.batch_window = batch_window
+        self.paused = paused
+        self.topics: Tuple[str, ...] = ()
+        self.heartbeat = heartbeat
+
+    def approx_bytes(self) -> int:
+        """Memoria aproximada que retiene esta conexión en el proceso.
+
+        Suma el registro, la cola, la tarea escritora con su corrutina, el
+        Event y el WebSocket con su scope ASGI y el objeto de protocolo del
+        servidor (sin su estado interno). No incluye los búferes del
+        transporte ni del kernel: para dimensionar, medir también el RSS.
+        """
+        total = (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.queue)
+            + sum(sys.getsizeof(data) for _, data in self.queue)
+            + _shallow_size(self.ready)
+            + sys.getsizeof(getattr(self.ready, "_waiters", None) or ())
+            + _shallow_size(self.websocket)
+        )
+        if self.writer is not None:
+            coro = self.writer.get_coro()
+            total += sys.getsizeof(self.writer) + sys.getsizeof(coro)
+            frame = getattr(coro, "cr_frame", None)
+            if frame is not None:
+                total += sys.getsizeof(frame)
+        scope = getattr(self.websocket, "scope", None)
+        if isinstance(scope, dict):
+            total += sys.getsizeof(scope) + sum(
+                sys.getsizeof(v) for v in scope.values()
+            )
+            for header in scope.get("headers", ()):
+                total += sys.getsizeof(header) + sum(sys.getsizeof(x) for x in header)
+        # uvicorn: el send de ASGI es un método del protocolo de la conexión
+        protocol = getattr(getattr(self.websocket, "_send", None), "__self__", None)
+        if protocol is not None:
+            total += _shallow_size(protocol)
+        return total
+
 
 
 class ConnectionManager:
-    def __init__(self) -> None:
-        self.active_connections: Dict[int, Set[WebSocket]] = {}
+    def __init__(
+        self,
+        queue_size: int = settings.ws_queue_size,
+        policy: str = settings.ws_slow_policy,
+        send_timeout: float = settings.ws_send_timeout,
+        backend: Optional[PubSubBackend] = None,
+        ping_interval: float = settings.ws_ping_interval,
+        ping_timeout: float = settings.ws_ping_timeout,
+        max_per_user: int = settings.ws_max_per_user,
+        replay_size: int = settings.ws_replay_buffer,
+        replay_ttl: float = settings.ws_replay_ttl,
+    ) -> None:
+        if policy not in SLOW_POLICIES:
+            raise ValueError(f"Política de WebSocket desconocida: {policy}")
+        self.active_connections: Dict[int, Dict[WebSocket, _Connection]] = {}
+        # Sockets suscritos a cada tópico (registrados al autenticarse)
+        self.topic_connections: Dict[str, Dict[WebSocket, _Connection]] = {}
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.backend = backend or create_backend()
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.max_per_user = max_per_user
+        self._reaper: Optional[asyncio.Task] = None
+        # Búfer circular de los últimos eventos con seq por usuario o tópico
+        # con sockets en este proceso. replay_desde: seq a partir del cual el
+        # búfer está completo (None: desde el primer evento del proceso).
+        # Sin sockets, el búfer vive replay_ttl s más; después la reposición
+        # sale de la Outbox
+        self.replay_size = replay_size
+        self.replay_ttl = replay_ttl
+        self.replay_buffers: Dict[Destino, Deque[Tuple[int, Envelope]]] = {}
+        self.replay_desde: Dict[Destino, Optional[int]] = {}
+        self.replay_expira: Dict[Destino, float] = {}
+        self._first_seq: Optional[int] = None
+        self._last_seq: Optional[int] = None
+        # Identifica los avisos propios, que ya se aplicaron antes de publicarse
+        self.instance_id = uuid.uuid4().hex
+        self._control_handlers: Dict[str, Callable[[dict], None]] = {}
+        self.on_control(
+            TOPICOS_CAMBIADOS,
+            lambda aviso: self.set_topics(aviso["user_id"], aviso["topics"]),
+        )
+        self.counters: Dict[str, int] = {
+            "enqueued": 0,
+            "sent": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "slow_disconnects": 0,
+            "send_errors": 0,
+            "max_queue_depth": 0,
+            "pings_sent": 0,
+            "reaped": 0,
+            "evicted": 0,
+            "batches": 0,
+            "batched_events": 0,
+            "replayed": 0,
+            "resyncs": 0,
+        }
+
+    async def start(self) -> None:
+        await self.backend.start(self.send_many)
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_loop())
 
-    async def connect(self, user_id: int, websocket: WebSocket):
+    async def stop(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+        await self.backend.stop()
+        conns = [c for by_ws in self.active_connections.values() for c in by_ws.values()]
+        for conn in conns:
+            self._stop_writer(conn)
+        await asyncio.gather(
+            *(c.writer for c in conns if c.writer is not None), return_exceptions=True
+        )
+        self.active_connections.clear()
+        self.topic_connections.clear()
+
+    async def publish(self, messages: Iterable[Tuple[Destino, dict]]) -> None:
+        # Entrega a los sockets de todos los procesos a través del backend
+        messages = list(messages)
+        if messages:
+            await self.backend.publish(messages)
+
+    def on_control(self, tipo: str, handler: Callable[[dict], None]) -> None:
+        # handler recibe los avisos ``tipo`` publicados por otros procesos
+        self._control_handlers[tipo] = handler
+
+    async def broadcast_control(self, tipo: str, **datos) -> None:
+        """Avisa a los demás procesos de un cambio ya aplicado en este.
+
+        Se llama después del commit: si el backend falla, el cambio ya está
+        en la base y los demás procesos lo verán al vencer el TTL de su caché.
+        """
+        message = {"type": tipo, "origen": self.instance_id, **datos}
+        try:
+            await self.publish([(CONTROL_TOPIC, message)])
+        except Exception:
+            logger.exception("No se pudo publicar el aviso %s", tipo)
+
+    def _control(self, message: dict) -> None:
+        if message.get("origen") == self.instance_id:
+            return
+        handler = self._control_handlers.get(message.get("type"))
+        if handler is None:
+            return
+        try:
+            handler(message)
+        except Exception:
+            # Un aviso mal formado no debe cortar la entrega del resto del lote
+            logger.exception("Aviso %s inválido", message.get("type"))
+
+    async def connect(
+        self,
+        user_id: int,
+        websocket: WebSocket,
+        batch_window: float = 0.0,
+        paused: bool = False,
+        heartbeat: bool = False,
+    ):
         # The websocket must already be accepted by the router endpoint.
-        self.active_connections.setdefault(user_id, set()).add(websocket)
+        conns = self.active_connections.setdefault(user_id, {})
+        # Límite por usuario: se desaloja el socket más antiguo (orden de inserción)
+        while conns and len(conns) >= self.max_per_user:
+            self._close(next(iter(conns.values())), CONNECTION_LIMIT_CLOSE_CODE)
+            self.counters["evicted"] += 1
+        # paused: el escritor espera a resume() para enviar primero la reposición
+        conn = _Connection(user_id, websocket, batch_window, paused, heartbeat)
+        conn.writer = asyncio.create_task(self._writer(conn))
+        self.active_connections.setdefault(user_id, {})[websocket] = conn
+        self._abrir_replay(user_id)
 
-    def disconnect(self, user_id: int, websocket: WebSocket):
-        conns = self.active_connections.get(user_id)
-        if not conns:
+    def subscribe(self, user_id: int, websocket: WebSocket, topics: Iterable[str]):
+        conn = self.active_connections.get(user_id, {}).get(websocket)
+        if conn is None:
             return
-        if websocket in conns:
-            conns.remove(websocket)
+        conn.topics = tuple(dict.fromkeys((*conn.topics, *topics)))
+        for topic in conn.topics:
+            self.topic_connections.setdefault(topic, {})[websocket] = conn
+            self._abrir_replay(topic)
+
+    def _unsubscribe(self, conn: _Connection) -> None:
+        for topic in conn.topics:
+            subs = self.topic_connections.get(topic)
+            if subs and subs.get(conn.websocket) is conn:
+                del subs[conn.websocket]
+                if not subs:
+                    self.topic_connections.pop(topic, None)
+                    self._cerrar_replay(topic)
+        conn.topics = ()
+
+    def set_topics(self, user_id: int, topics: Iterable[str]) -> None:
+        # Reemplaza los tópicos de todos los sockets del usuario en este proceso
+        topics = list(topics)
+        for websocket, conn in list(self.active_connections.get(user_id, {}).items()):
+            self._unsubscribe(conn)
+            self.subscribe(user_id, websocket, topics)
+
+    async def cambiar_topicos(self, user_id: int, topics: Iterable[str]) -> None:
+        """Resuscribe los sockets abiertos del usuario, en todos los procesos.
+
+        Para cambios que afectan a los tópicos de un usuario conectado, como
+        su rol: sin esto seguiría recibiendo los eventos del rol anterior
+        hasta reconectar.
+        """
+        topics = list(topics)
+        self.set_topics(user_id, topics)
+        await self.broadcast_control(TOPICOS_CAMBIADOS, user_id=user_id, topics=topics)
+
+    def touch(self, user_id: int, websocket: WebSocket) -> None:
+        # Cualquier mensaje del cliente cuenta como respuesta al ping
+        conn = self.active_connections.get(user_id, {}).get(websocket)
+        if conn is not None:
+            conn.last_seen = time.monotonic()
+
+    def _remove(self, conn: _Connection) -> None:
+        conns = self.active_connections.get(conn.user_id)
+        if not conns or conns.get(conn.websocket) is not conn:
+            return
+        del conns[conn.websocket]
         if not conns:
-            self.active_connections.pop(user_id, None)
-
-    async def send_to_user(self, user_id: int, message: dict):
-        conns = self.active_connections.get(user_id, set())
-        to_remove: Set[WebSocket] = set()
-        for ws in conns:
-            try:
-                await ws.send_json(message)
-            except Exception:
-                to_remove.add(ws)
-        for ws in to_remove:
-            self.disconnect(user_id, ws)
+            self.active_connections.pop(conn.user_id, None)
+            self._cerrar_replay(conn.user_id)
+        self._unsubscribe(conn)
+
+    @staticmethod
+    def _stop_writer(conn: _Connection) -> None:
+        # La bandera cubre el caso en que wait_for se traga la cancelación
+        conn.stopped = True
+        conn.queue.clear()
+        conn.ready.set()
+        if conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+
+    def _close(self, conn: _Connection, code: int) -> None:
+        # Deja de recibir eventos ya; el escritor envía el cierre
+        self._remove(conn)
+        if conn.close_code is None:
+            conn.close_code = code
+            conn.queue.clear()
+            conn.ready.set()
+
+    def disconnect(self, user_id: int, websocket: WebSocket, code: Optional[int] = None):
+        # code: el del WebSocketDisconnect que terminó el bucle del endpoint
+        conn = self.active_connections.get(user_id, {}).get(websocket)
+        if conn is None:
+            return
+        if code in DEAD_SOCKET_CODES and conn.close_code is None:
+            # Lo detectó el ping de uvicorn, no este proceso: también cuenta
+            # como socket muerto cerrado
+            self.counters["reaped"] += 1
+        self._remove(conn)
+        self._stop_writer(conn)
+
+    async def _writer(self, conn: _Connection) -> None:
+        # Un escritor por socket: un cliente lento solo se retrasa a sí mismo
+        ws = conn.websocket
+        try:
+            while True:
+                await conn.ready.wait()
+                if conn.stopped:
+                    return
+                if conn.close_code is not None:
+                    await asyncio.wait_for(
+                        ws.close(code=conn.close_code), self.send_timeout
+                    )
+                    return
+                if conn.paused or not conn.queue:
+                    conn.ready.clear()
+                    continue
+                if conn.batch_window:
+                    # Ventana de agrupación: lo que llegue mientras tanto sale
+                    # en el mismo frame
+                    await asyncio.sleep(conn.batch_window)
+                    if conn.stopped or conn.close_code is not None:
+                        continue
+                    pendientes = len(conn.queue)
+                    data, _ = _batch_frame(conn.queue)
+                    conn.queue.clear()
+                    if data is None:
+                        continue
+                    if pendientes > 1:
+                        self.counters["batches"] += 1
+                        self.counters["batched_events"] += pendientes
+                else:
+                    _, data = conn.queue.popleft()
+                await asyncio.wait_for(ws.send_text(data), self.send_timeout)
+                self.counters["sent"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            if isinstance(exc, WebSocketDisconnect) and exc.code in DEAD_SOCKET_CODES:
+                self.counters["reaped"] += 1
+            else:
+                self.counters["send_errors"] += 1
+            # Sin escritor el socket ya no recibe nada: se cierra para que el
+            # cliente reconecte y el bucle del endpoint termine
+            code = (
+                SLOW_CONSUMER_CLOSE_CODE
+                if isinstance(exc, asyncio.TimeoutError)
+                else SEND_ERROR_CLOSE_CODE
+            )
+            if conn.close_code is None:
+                conn.close_code = code
+                try:
+                    await asyncio.wait_for(ws.close(code=code), self.send_timeout)
+                except Exception:
+                    pass
+        finally:
+            self._remove(conn)
+
+    def _enqueue(self, conn: _Connection, message: dict, data: str) -> None:
+        # Nunca bloquea: si la cola está llena se aplica la política configurada
+        if conn.close_code is not None:
+            return
+        queue = conn.queue
+        if len(queue) >= self.queue_size:
+            if self.policy == DISCONNECT:
+                self._close(conn, SLOW_CONSUMER_CLOSE_CODE)
+                self.counters["slow_disconnects"] += 1
+                return
+            if self.policy == COALESCE and _coalesce(queue, message):
+                self.counters["coalesced"] += 1
+                return
+            queue.popleft()
+            conn.dropped += 1
+            self.counters["dropped"] += 1
+        queue.append((message, data))
+        self.counters["enqueued"] += 1
+        if len(queue) > self.counters["max_queue_depth"]:
+            self.counters["max_queue_depth"] = len(queue)
+        conn.ready.set()
+
+    def send_to_socket(self, user_id: int, websocket: WebSocket, message: dict):
+        conn = self.active_connections.get(user_id, {}).get(websocket)
+        if conn is not None:
+            self._enqueue(conn, message, encode(message))
+
+    def send_to_user(self, user_id: int, message: dict):
+        self.send_many([(user_id, message)])
+
+    def send_many(self, messages: Iterable[Tuple[Destino, dict]]):
+        # Entrega local: solo encola; el orden por socket se conserva en su cola.
+        # Cada mensaje se serializa una vez aunque vaya a varios destinos
+        # (se guarda el dict junto al texto para que su id no se reutilice).
+        # Un destino str es un tópico: llega solo a los sockets suscritos
+        encoded: Dict[int, Envelope] = {}
+        for destino, message in messages:
+            if destino == CONTROL_TOPIC:
+                self._control(message)
+                continue
+            if isinstance(destino, str):
+                conns = self.topic_connections.get(destino)
+            else:
+                conns = self.active_connections.get(destino)
+            seq = message.get("seq")
+            if seq is not None:
+                if self._first_seq is None:
+                    self._first_seq = seq
+                self._last_seq = seq
+            buffer = self.replay_buffers.get(destino) if seq is not None else None
+            if not conns and buffer is None:
+                continue
+            envelope = encoded.get(id(message))
+            if envelope is None:
+                envelope = encoded[id(message)] = (message, encode(message))
+            if buffer is not None:
+                # También sin sockets mientras dure el búfer: así se repone
+                # tras una reconexión
+                self._remember(destino, buffer, seq, envelope)
+            for conn in list((conns or {}).values()):
+                self._enqueue(conn, message, envelope[1])
+
+    def _abrir_replay(self, destino: Destino) -> None:
+        self.replay_expira.pop(destino, None)
+        if destino not in self.replay_buffers:
+            # Solo cubre lo que llegue a partir de ahora
+            self.replay_buffers[destino] = deque()
+            self.replay_desde[destino] = self._last_seq
+
+    def _cerrar_replay(self, destino: Destino) -> None:
+        # Sin sockets: el búfer sigue un rato para la reconexión
+        if destino in self.replay_buffers:
+            self.replay_expira[destino] = time.monotonic() + self.replay_ttl
+
+    def purge_replay(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        for destino, expira in list(self.replay_expira.items()):
+            if expira <= now:
+                del self.replay_expira[destino]
+                self.replay_buffers.pop(destino, None)
+                self.replay_desde.pop(destino, None)
+
+    def _remember(
+        self, destino: Destino, buffer: Deque, seq: int, envelope: Envelope
+    ) -> None:
+        if len(buffer) >= self.replay_size:
+            evicted, _ = buffer.popleft()
+            desde = self.replay_desde.get(destino)
+            self.replay_desde[destino] = evicted if desde is None else max(evicted, desde)
+        buffer.append((seq, envelope))
+
+    def buffered_since(
+        self, destinos: Iterable[Destino], last_seq: int
+    ) -> Optional[List[Envelope]]:
+        """Eventos de los búferes de ``destinos`` con seq mayor que ``last_seq``.
+
+        ``None`` si algún búfer no cubre el hueco: no existe (sin sockets en
+        este proceso), se abrió después de ``last_seq``, parte del hueco
+        ocurrió antes de que este proceso viera su primer evento o ya salió
+        del búfer.
+        """
+        if self._first_seq is None or last_seq < self._first_seq - 1:
+            return None
+        eventos: List[Tuple[int, Envelope]] = []
+        for destino in destinos:
+            buffer = self.replay_buffers.get(destino)
+            if buffer is None:
+                return None
+            desde = self.replay_desde.get(destino)
+            if desde is not None and last_seq < desde:
+                return None
+            eventos.extend(item for item in buffer if item[0] > last_seq)
+        eventos.sort(key=lambda item: item[0])
+        return [envelope for _, envelope in eventos]
+
+    def resume(
+        self, user_id: int, websocket: WebSocket, replay: Optional[List[Envelope]]
+    ) -> None:
+        # Antepone los eventos perdidos (o un resync) a lo que ya esté en cola
+        conn = self.active_connections.get(user_id, {}).get(websocket)
+        if conn is None:
+            return
+        if replay is None:
+            conn.queue.appendleft((RESYNC_MESSAGE, _RESYNC_TEXT))
+            self.counters["resyncs"] += 1
+        else:
+            en_cola = {message.get("seq") for message, _ in conn.queue}
+            faltantes = [env for env in replay if env[0].get("seq") not in en_cola]
+            conn.queue.extendleft(reversed(faltantes))
+            self.counters["replayed"] += len(faltantes)
+        conn.paused = False
+        conn.ready.set()
+
+    async def _reap_loop(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.ping_interval, self.ping_timeout) / 2)
+            self.reap_idle()
+            self.purge_replay()
+
+    def reap_idle(self, now: Optional[float] = None) -> None:
+        """Envía pings a sockets inactivos y cierra los que no respondieron.
+
+        Solo para las conexiones que lo pidieron (``heartbeat``): un socket
+        sin tráfico durante ``ping_interval`` recibe un ping JSON; si no llega
+        nada en ``ping_timeout`` desde ese ping, se da por muerto. Las demás
+        dependen de los pings de protocolo de uvicorn (20 s de intervalo y de
+        espera por defecto); esos cierres se cuentan en ``disconnect`` y en
+        el escritor. ``reaped`` suma ambos.
+        """
+        now = time.monotonic() if now is None else now
+        for conns in list(self.active_connections.values()):
+            for conn in list(conns.values()):
+                if not conn.heartbeat:
+                    continue
+                if conn.last_ping > conn.last_seen:
+                    if now - conn.last_ping >= self.ping_timeout:
+                        self._close(conn, IDLE_CLOSE_CODE)
+                        self.counters["reaped"] += 1
+                elif now - conn.last_seen >= self.ping_interval:
+                    conn.last_ping = now
+                    self._enqueue(conn, PING_MESSAGE, _PING_TEXT)
+                    self.counters["pings_sent"] += 1
+
+    def stats(self) -> dict:
+        conns = [c for by_ws in self.active_connections.values() for c in by_ws.values()]
+        memoria = sum(conn.approx_bytes() for conn in conns)
+        return {
+            **self.counters,
+            "users": len(self.active_connections),
+            "topics": {topic: len(subs) for topic, subs in self.topic_connections.items()},
+            "connections": len(conns),
+            "queued": sum(len(conn.queue) for conn in conns),
+            "bytes_per_connection": memoria // len(conns) if conns else 0,
+            "max_per_user": self.max_per_user,
+            "ping_interval": self.ping_interval,
+            "ping_timeout": self.ping_timeout,
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+            "backend": type(self.backend).__name__,
+            "replay_users": len(self.replay_buffers),
+            # Los búferes son por usuario o tópico, aparte de cada conexión
+            "replay_bytes": sum(
+                sys.getsizeof(buffer)
+                + sum(sys.getsizeof(envelope[1]) for _, envelope in buffer)
+                for buffer in self.replay_buffers.values()
+            ),
+            "replay_size": self.replay_size,
+            "replay_ttl": self.replay_ttl,
+        }
 
 
 manager = ConnectionManager()
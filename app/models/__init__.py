@@ -9,3 +9,6 @@ from .notificacion import Notificacion
 from .observacion import Observacion
 
 # from .reportes import Reporte
+from .alerta import Alerta
+from .outbox import EventoOutbox
+from .alerta_resumen import AlertaResumenDiario
@@ -1,10 +1,13 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, text
 
 from .base import Base
 
 
 class Alerta(Base):
     __tablename__ = "Alertas"
+    __table_args__ = (
+        Index("ix_Alertas_fecha_creacion_id_alerta", "fecha_creacion", "id_alerta"),
+    )
     id_alerta = Column(Integer, primary_key=True, index=True)
     id_estudiante = Column(Integer, ForeignKey("Usuarios.id_usuario"), nullable=False)
     texto = Column(String, nullable=False)
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Date, ForeignKey, Index, Integer, String
+
+from .base import Base
+
+
+class AlertaResumenDiario(Base):
+    # Conteo de alertas por día (zona horaria de settings), severidad y
+    # estudiante; se mantiene al insertar alertas
+    __tablename__ = "AlertasResumenDiario"
+    __table_args__ = (
+        Index("ix_AlertasResumenDiario_id_estudiante_dia", "id_estudiante", "dia"),
+    )
+    dia = Column(Date, primary_key=True)
+    severidad = Column(String(20), primary_key=True)
+    id_estudiante = Column(
+        Integer, ForeignKey("Usuarios.id_usuario"), primary_key=True
+    )
+    total = Column(Integer, nullable=False, default=0)
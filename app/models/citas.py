@@ -1,11 +1,27 @@
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, text
-from sqlalchemy.sql import func
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, text
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.sql import column, func
 
 from .base import Base
 
 
 class Cita(Base):
     __tablename__ = "Citas"
+    __table_args__ = (
+        Index("ix_Citas_id_psicologo_fecha_hora_inicio", "id_psicologo", "fecha_hora_inicio"),
+        Index("ix_Citas_id_estudiante_fecha_hora_inicio", "id_estudiante", "fecha_hora_inicio"),
+        # Un psicólogo no puede tener dos citas activas solapadas (requiere btree_gist)
+        ExcludeConstraint(
+            (column("id_psicologo"), "="),
+            (
+                func.tstzrange(column("fecha_hora_inicio"), column("fecha_hora_fin")),
+                "&&",
+            ),
+            name="citas_psicologo_sin_solapes",
+            using="gist",
+            where=text("fecha_cancelacion IS NULL"),
+        ),
+    )
     id_cita = Column(Integer, primary_key=True, index=True)
     id_estudiante = Column(Integer, ForeignKey("Usuarios.id_usuario"), nullable=False)
     id_psicologo = Column(Integer, ForeignKey("Usuarios.id_usuario"), nullable=False)
@@ -1,13 +1,17 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Time
+from sqlalchemy import CheckConstraint, Column, ForeignKey, Index, Integer, SmallInteger, Time
 
 from .base import Base
 
 
 class DisponibilidadPsicologo(Base):
     __tablename__ = "DisponibilidadPsicologo"
+    __table_args__ = (
+        CheckConstraint("dia_semana BETWEEN 0 AND 6", name="ck_disponibilidad_dia_semana"),
+        Index("ix_DisponibilidadPsicologo_id_psicologo_dia", "id_psicologo", "dia_semana"),
+    )
 
     id_disponibilidad = Column(Integer, primary_key=True, index=True)
     id_psicologo = Column(Integer, ForeignKey("Usuarios.id_usuario"), nullable=False)
-    dia_semana = Column(String(10), nullable=False)
+    dia_semana = Column(SmallInteger, nullable=False)  # 0=lunes ... 6=domingo
     hora_inicio = Column(Time, nullable=False)
     hora_fin = Column(Time, nullable=False)
@@ -1,8 +1,23 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, func
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Index, func, text
 from .base import Base
 
 class Notificacion(Base):
     __tablename__ = "Notificaciones"
+    __table_args__ = (
+        Index("ix_Notificaciones_id_estudiante_fecha", "id_estudiante", "fecha_creacion"),
+        Index("ix_Notificaciones_id_psicologo_fecha", "id_psicologo", "fecha_creacion"),
+        # Parciales: el conteo de no leídas solo recorre las filas pendientes
+        Index(
+            "ix_Notificaciones_id_estudiante_no_leidas",
+            "id_estudiante",
+            postgresql_where=text("leida = false"),
+        ),
+        Index(
+            "ix_Notificaciones_id_psicologo_no_leidas",
+            "id_psicologo",
+            postgresql_where=text("leida = false"),
+        ),
+    )
     id_notificacion = Column(Integer, primary_key=True, index=True)
     id_estudiante = Column(Integer, ForeignKey("Usuarios.id_usuario"), nullable=True)
     id_psicologo = Column(Integer, ForeignKey("Usuarios.id_usuario"), nullable=True)
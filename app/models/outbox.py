@@ -0,0 +1,43 @@
+from sqlalchemy import (
+    BigInteger,
+    CheckConstraint,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    Sequence,
+    String,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+
+from .base import Base
+
+# Números de secuencia que ven los clientes; los asigna el despachador al
+# entregar, así siguen el orden de entrega y no el de inserción
+OUTBOX_SEQ = Sequence("Outbox_seq", metadata=Base.metadata)
+
+
+class EventoOutbox(Base):
+    # Eventos en tiempo real escritos en la misma transacción que el cambio
+    __tablename__ = "Outbox"
+    __table_args__ = (
+        # Destino: un usuario o un tópico (p. ej. "rol:PSICOLOGO"), nunca ambos
+        CheckConstraint(
+            "(id_usuario IS NULL) <> (topico IS NULL)", name="ck_Outbox_destino"
+        ),
+        Index(
+            "ix_Outbox_pendientes",
+            "id_evento",
+            postgresql_where=text("fecha_entrega IS NULL"),
+        ),
+        Index("ix_Outbox_seq", "seq", unique=True),
+    )
+    id_evento = Column(BigInteger, primary_key=True)
+    id_usuario = Column(Integer, nullable=True)
+    topico = Column(String(64), nullable=True)
+    payload = Column(JSONB, nullable=False)
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    fecha_entrega = Column(DateTime(timezone=True), nullable=True)
+    seq = Column(BigInteger, nullable=True)
@@ -1,5 +1,9 @@
-from datetime import datetime
-from pydantic import BaseModel, ConfigDict
+from datetime import date, datetime
+from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field
+
+# Alertas por petición en POST /alertas/batch
+MAX_ALERTAS_LOTE = 500
 
 
 class AlertaBase(BaseModel):
@@ -12,7 +16,20 @@ class AlertaCreate(AlertaBase):
     pass
 
 
+class AlertaLote(BaseModel):
+    alertas: list[AlertaCreate] = Field(min_length=1, max_length=MAX_ALERTAS_LOTE)
+
+
 class AlertaRead(AlertaBase):
     id_alerta: int
     fecha_creacion: datetime
     model_config = ConfigDict(from_attributes=True)
+
+
+class AlertaResumen(BaseModel):
+    # Una cubeta de la analítica: periodo (inicio), severidad y, si se pidió,
+    # estudiante
+    bucket: date
+    severidad: str
+    id_estudiante: Optional[int] = None
+    total: int
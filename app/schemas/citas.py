@@ -1,5 +1,11 @@
-from datetime import datetime
-from pydantic import BaseModel
+from datetime import datetime, timedelta
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+MAX_OCURRENCIAS_SERIE = 52
+
+FRECUENCIAS = {"DIARIA": timedelta(days=1), "SEMANAL": timedelta(weeks=1)}
 
 
 class CitaBase(BaseModel):
@@ -33,3 +39,49 @@ class CitaRead(BaseModel):
 class CitaReschedule(BaseModel):
     fecha_hora_inicio: datetime
     fecha_hora_fin: datetime
+
+
+class CitaSerieCreate(CitaCreate):
+    # Regla de recurrencia: cada `intervalo` días/semanas, hasta `ocurrencias` o `hasta`
+    frecuencia: Literal["DIARIA", "SEMANAL"] = "SEMANAL"
+    intervalo: int = Field(1, ge=1)
+    ocurrencias: Optional[int] = Field(None, ge=1, le=MAX_OCURRENCIAS_SERIE)
+    hasta: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def validar_regla(self):
+        if self.ocurrencias is None and self.hasta is None:
+            raise ValueError("Se requiere 'ocurrencias' o 'hasta'")
+        if self.hasta is not None and (self.hasta.tzinfo is None) != (
+            self.fecha_hora_inicio.tzinfo is None
+        ):
+            raise ValueError("'hasta' y 'fecha_hora_inicio' deben usar la misma zona")
+        if self.fecha_hora_fin <= self.fecha_hora_inicio:
+            raise ValueError("La fecha de fin debe ser posterior a la fecha de inicio")
+        if self.fecha_hora_fin - self.fecha_hora_inicio > self.periodo:
+            raise ValueError("La duración de la cita supera el periodo de la serie")
+        if self.hasta is not None:
+            if self.hasta < self.fecha_hora_inicio:
+                raise ValueError("'hasta' es anterior al inicio de la serie")
+            # Una regla que pide más citas que el máximo se rechaza, no se recorta
+            en_rango = (self.hasta - self.fecha_hora_inicio) // self.periodo + 1
+            if self.ocurrencias is None and en_rango > MAX_OCURRENCIAS_SERIE:
+                raise ValueError(
+                    f"La serie hasta {self.hasta} tiene {en_rango} ocurrencias; "
+                    f"el máximo es {MAX_OCURRENCIAS_SERIE}"
+                )
+        return self
+
+    @property
+    def periodo(self) -> timedelta:
+        return FRECUENCIAS[self.frecuencia] * self.intervalo
+
+    def expandir(self) -> list[tuple[datetime, datetime]]:
+        duracion = self.fecha_hora_fin - self.fecha_hora_inicio
+        limite = self.ocurrencias or MAX_OCURRENCIAS_SERIE
+        ocurrencias = []
+        inicio = self.fecha_hora_inicio
+        while len(ocurrencias) < limite and (self.hasta is None or inicio <= self.hasta):
+            ocurrencias.append((inicio, inicio + duracion))
+            inicio += self.periodo
+        return ocurrencias
@@ -1,7 +1,10 @@
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from datetime import time
+from typing import Optional
+
+from app.utils.date_utils import DIAS_SEMANA, dia_a_weekday
 
 
 class DisponibilidadDocenteBase(BaseModel):
@@ -10,20 +13,38 @@ class DisponibilidadDocenteBase(BaseModel):
     fecha_hora_fin: datetime
 
 
-class DisponibilidadCreate(BaseModel):
-    id_psicologo: int
-    dia_semana: str  # ej: 'lunes'
+class FranjaSemanal(BaseModel):
+    dia_semana: int = Field(ge=0, le=6)  # 0=lunes; acepta también 'lunes'
     hora_inicio: time
     hora_fin: time
 
+    @field_validator("dia_semana", mode="before")
+    @classmethod
+    def parse_dia_semana(cls, v):
+        if isinstance(v, str) and not v.strip().isdigit():
+            weekday = dia_a_weekday(v)
+            if weekday is None:
+                raise ValueError("Día de la semana inválido")
+            return weekday
+        return v
+
+
+class DisponibilidadCreate(FranjaSemanal):
+    id_psicologo: int
+
 
 class DisponibilidadRead(BaseModel):
     id_disponibilidad: int
     id_psicologo: int
-    dia_semana: str
+    dia_semana: str  # 'LUNES' ... 'DOMINGO'
     hora_inicio: time
     hora_fin: time
 
+    @field_validator("dia_semana", mode="before")
+    @classmethod
+    def nombre_dia_semana(cls, v):
+        return DIAS_SEMANA[v] if isinstance(v, int) else v
+
     class Config:
         orm_mode = True
 
@@ -31,3 +52,14 @@ class DisponibilidadRead(BaseModel):
 class HorarioLibre(BaseModel):
     inicio: time
     fin: time
+
+
+class SlotLibre(BaseModel):
+    inicio: datetime
+    fin: datetime
+
+
+class SlotPsicologo(SlotLibre):
+    id_psicologo: int
+    psicologo: str
+    modalidad: Optional[str] = None
@@ -1,5 +1,5 @@
 from datetime import datetime
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional
 
 
@@ -20,3 +20,7 @@ class NotificacionRead(NotificacionBase):
 
     # Pydantic v2: enable ORM attributes support for from_orm
     model_config = ConfigDict(from_attributes=True)
+
+
+class NotificacionIds(BaseModel):
+    ids: list[int] = Field(default_factory=list, max_length=1000)
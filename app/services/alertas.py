@@ -0,0 +1,235 @@
+from collections import Counter
+from datetime import date, tzinfo
+
+from sqlalchemy import (
+    Date,
+    Integer,
+    String,
+    bindparam,
+    cast,
+    delete,
+    false,
+    func,
+    insert,
+    literal_column,
+    text,
+    true,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.models.alerta import Alerta
+from app.models.alerta_resumen import AlertaResumenDiario
+from app.models.notificacion import Notificacion
+from app.models.users import User
+from app.schemas.alerta import AlertaCreate
+from app.services.catalogos import staff_directory
+from app.services.notificaciones import destinatarios
+from app.utils.date_utils import ZONA_POR_DEFECTO
+
+# Roles que reciben las alertas
+STAFF_ROLES = ("ADMINISTRADOR", "PSICOLOGO")
+
+# Periodos de la analítica -> unidad de date_trunc
+PERIODOS = {"dia": "day", "semana": "week", "mes": "month"}
+
+
+class EstudiantesNoEncontradosError(Exception):
+    """Alguna alerta apunta a un estudiante que no existe."""
+
+    def __init__(self, ids: list[int]):
+        super().__init__(ids)
+        self.ids = ids
+
+
+def nombre_completo(estudiante: User) -> str:
+    return f"{getattr(estudiante, 'nombre', '')} {getattr(estudiante, 'apellido', '')}".strip()
+
+
+def titulo_notificacion(alerta: Alerta, estudiante: User) -> str:
+    # Build human-readable info for notifications
+    return (
+        f"ALERTA {alerta.severidad}: {nombre_completo(estudiante)} ({estudiante.email}) a las "
+        f"{alerta.fecha_creacion} dijo: '{alerta.texto[:150]}{'...' if len(alerta.texto) > 150 else ''}'"
+    )
+
+
+def alerta_evento(alerta: Alerta, estudiante: User) -> dict:
+    # Datos de la alerta que reciben las UIs especializadas
+    return {
+        "id_alerta": alerta.id_alerta,
+        "id_estudiante": alerta.id_estudiante,
+        "texto": alerta.texto,
+        "severidad": alerta.severidad,
+        "fecha_creacion": str(alerta.fecha_creacion),
+        "estudiante_nombre": nombre_completo(estudiante),
+        "estudiante_email": estudiante.email,
+    }
+
+
+class AlertasService:
+    @staticmethod
+    async def crear_lote(
+        db: AsyncSession, alertas_in: list[AlertaCreate]
+    ) -> tuple[list[Alerta], list[Notificacion], dict[int, User]]:
+        """Inserta alertas y sus notificaciones al personal, sin commit.
+
+        Una consulta valida todos los estudiantes, un INSERT multi-fila crea
+        las alertas y un único INSERT ... SELECT sobre ``unnest`` crea todas
+        las notificaciones (alertas x personal) con tres parámetros, sin
+        importar cuántas filas salgan.
+        """
+        ids = {a.id_estudiante for a in alertas_in}
+        result = await db.execute(select(User).where(User.id_usuario.in_(ids)))
+        estudiantes = {u.id_usuario: u for u in result.scalars().all()}
+        faltantes = sorted(ids - estudiantes.keys())
+        if faltantes:
+            raise EstudiantesNoEncontradosError(faltantes)
+
+        result = await db.execute(
+            insert(Alerta)
+            .values([a.model_dump() for a in alertas_in])
+            .returning(Alerta)
+        )
+        alertas = result.scalars().all()
+        await AlertasService._acumular_resumen(db, alertas)
+
+        staff = await staff_directory.get(db, STAFF_ROLES)
+        notis: list[Notificacion] = []
+        if staff:
+            filas = (
+                func.unnest(
+                    bindparam(
+                        "estudiantes",
+                        [a.id_estudiante for a in alertas],
+                        type_=ARRAY(Integer),
+                    ),
+                    bindparam(
+                        "titulos",
+                        [
+                            titulo_notificacion(a, estudiantes[a.id_estudiante])
+                            for a in alertas
+                        ],
+                        type_=ARRAY(String),
+                    ),
+                )
+                .table_valued("id_estudiante", "titulo")
+                .render_derived()
+            )
+            personal = (
+                func.unnest(bindparam("staff", staff, type_=ARRAY(Integer)))
+                .table_valued("id_psicologo")
+                .render_derived()
+            )
+            result = await db.execute(
+                insert(Notificacion)
+                .from_select(
+                    ["id_estudiante", "id_psicologo", "titulo", "leida"],
+                    select(
+                        filas.c.id_estudiante,
+                        personal.c.id_psicologo,
+                        filas.c.titulo,
+                        false(),
+                    ).select_from(filas.join(personal, true())),
+                )
+                .returning(Notificacion)
+            )
+            notis = result.scalars().all()
+        return alertas, notis, estudiantes
+
+    @staticmethod
+    async def _acumular_resumen(db: AsyncSession, alertas: list[Alerta]) -> None:
+        # Suma las alertas nuevas al resumen diario en la misma transacción:
+        # un solo upsert con las filas (día, severidad, estudiante) afectadas
+        conteo = Counter(
+            (
+                a.fecha_creacion.astimezone(ZONA_POR_DEFECTO).date(),
+                a.severidad,
+                a.id_estudiante,
+            )
+            for a in alertas
+            if a.fecha_creacion is not None
+        )
+        if not conteo:
+            return
+        # Orden fijo de claves para que lotes concurrentes no se bloqueen en cruz
+        stmt = pg_insert(AlertaResumenDiario).values(
+            [
+                {"dia": dia, "severidad": sev, "id_estudiante": est, "total": total}
+                for (dia, sev, est), total in sorted(conteo.items())
+            ]
+        )
+        await db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["dia", "severidad", "id_estudiante"],
+                set_={"total": AlertaResumenDiario.total + stmt.excluded.total},
+            )
+        )
+
+    @staticmethod
+    async def reconstruir_resumen(
+        db: AsyncSession, tz: tzinfo = ZONA_POR_DEFECTO
+    ) -> int:
+        """Rehace el resumen diario desde ``Alertas`` y hace commit.
+
+        El bloqueo de la tabla deja esperando a las inserciones concurrentes
+        hasta el commit, así ninguna alerta queda contada dos veces ni fuera.
+        """
+        await db.execute(
+            text('LOCK TABLE "AlertasResumenDiario" IN SHARE ROW EXCLUSIVE MODE')
+        )
+        await db.execute(delete(AlertaResumenDiario))
+        # Zona en línea (no como parámetro) para que el GROUP BY coincida
+        zona = bindparam("zona", str(tz), literal_execute=True)
+        dia = cast(func.timezone(zona, Alerta.fecha_creacion), Date)
+        result = await db.execute(
+            insert(AlertaResumenDiario).from_select(
+                ["dia", "severidad", "id_estudiante", "total"],
+                select(dia, Alerta.severidad, Alerta.id_estudiante, func.count())
+                .where(Alerta.fecha_creacion.is_not(None))
+                .group_by(dia, Alerta.severidad, Alerta.id_estudiante),
+            )
+        )
+        await db.commit()
+        return result.rowcount
+
+    @staticmethod
+    async def resumen(
+        db: AsyncSession,
+        periodo: str = "dia",
+        desde: date | None = None,
+        hasta: date | None = None,
+        id_estudiante: int | None = None,
+        por_estudiante: bool = False,
+    ):
+        # Agregado sobre el resumen diario: O(cubetas), no O(alertas)
+        unidad = literal_column(f"'{PERIODOS[periodo]}'")
+        bucket = cast(func.date_trunc(unidad, AlertaResumenDiario.dia), Date).label(
+            "bucket"
+        )
+        grupos = [bucket, AlertaResumenDiario.severidad]
+        if por_estudiante:
+            grupos.append(AlertaResumenDiario.id_estudiante)
+        stmt = (
+            select(*grupos, func.sum(AlertaResumenDiario.total).label("total"))
+            .group_by(*grupos)
+            .order_by(*grupos)
+        )
+        if desde:
+            stmt = stmt.where(AlertaResumenDiario.dia >= desde)
+        if hasta:
+            stmt = stmt.where(AlertaResumenDiario.dia <= hasta)
+        if id_estudiante is not None:
+            stmt = stmt.where(AlertaResumenDiario.id_estudiante == id_estudiante)
+        result = await db.execute(stmt)
+        return [row._asdict() for row in result.all()]
+
+    @staticmethod
+    def no_leidas_por_usuario(notis: list[Notificacion]) -> Counter:
+        # Cuántas notificaciones nuevas sin leer ve cada usuario
+        conteo: Counter = Counter()
+        for n in notis:
+            conteo.update(destinatarios(n.id_estudiante, n.id_psicologo))
+        return conteo
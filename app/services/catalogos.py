@@ -0,0 +1,139 @@
+from time import monotonic
+from typing import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.ws import manager
+from app.models.roles import Role
+from app.models.users import User
+
+
+class RoleCatalog:
+    """Tabla ``Roles`` en memoria (id <-> nombre).
+
+    Se carga al arrancar y se recarga cuando la invalidan los endpoints que
+    escriben roles, en este proceso o en otro (``invalidar_catalogos``), o
+    cuando vence el TTL, que acota la deriva si se pierde el aviso.
+    """
+
+    def __init__(self, ttl: float = 600.0) -> None:
+        self.ttl = ttl
+        self._por_nombre: dict[str, int] = {}
+        self._por_id: dict[int, str] = {}
+        self._cargado: float | None = None
+        # Se incrementa al invalidar para descartar cargas que lo solapan
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self, db: AsyncSession) -> None:
+        version = self._version
+        result = await db.execute(select(Role.id_rol, Role.nombre_rol))
+        rows = result.all()
+        if self._version != version:
+            return
+        self._por_id = {id_rol: nombre for id_rol, nombre in rows}
+        self._por_nombre = {nombre: id_rol for id_rol, nombre in rows}
+        self._cargado = monotonic()
+
+    async def _vigente(self, db: AsyncSession) -> None:
+        if self._cargado is not None and monotonic() - self._cargado < self.ttl:
+            self.hits += 1
+            return
+        self.misses += 1
+        await self.load(db)
+
+    async def id_de(self, db: AsyncSession, nombre_rol: str) -> int | None:
+        await self._vigente(db)
+        return self._por_nombre.get(nombre_rol)
+
+    async def ids_de(self, db: AsyncSession, nombres: Iterable[str]) -> list[int]:
+        await self._vigente(db)
+        return [self._por_nombre[n] for n in nombres if n in self._por_nombre]
+
+    async def nombre_de(self, db: AsyncSession, id_rol: int | None) -> str | None:
+        await self._vigente(db)
+        return self._por_id.get(id_rol)
+
+    def invalidate(self) -> None:
+        self._version += 1
+        self._cargado = None
+
+    def stats(self) -> dict:
+        return {"roles": len(self._por_id), "hits": self.hits, "misses": self.misses}
+
+
+class StaffDirectory:
+    """Ids de usuario por nombre de rol, para repartir alertas al personal.
+
+    Lo invalidan los endpoints que crean, modifican o borran usuarios o
+    roles, en cualquier proceso; el TTL cubre un aviso perdido.
+    """
+
+    def __init__(self, ttl: float = 300.0) -> None:
+        self.ttl = ttl
+        self._por_rol: dict[str, tuple[list[int], float]] = {}
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, db: AsyncSession, roles: Iterable[str]) -> list[int]:
+        ahora = monotonic()
+        por_rol: dict[str, list[int]] = {}
+        faltantes = []
+        for rol in roles:
+            cached = self._por_rol.get(rol)
+            if cached and ahora - cached[1] < self.ttl:
+                por_rol[rol] = cached[0]
+            else:
+                faltantes.append(rol)
+        self.hits += len(por_rol)
+        if faltantes:
+            self.misses += len(faltantes)
+            version = self._version
+            # Una sola consulta para todos los roles que faltan
+            result = await db.execute(
+                select(Role.nombre_rol, User.id_usuario)
+                .join(User, User.id_rol == Role.id_rol)
+                .where(Role.nombre_rol.in_(faltantes))
+            )
+            cargados: dict[str, list[int]] = {rol: [] for rol in faltantes}
+            for nombre, id_usuario in result.all():
+                cargados[nombre].append(id_usuario)
+            if self._version == version:
+                for rol, ids in cargados.items():
+                    self._por_rol[rol] = (ids, ahora)
+            por_rol.update(cargados)
+        return sorted({uid for ids in por_rol.values() for uid in ids})
+
+    def invalidate(self) -> None:
+        self._version += 1
+        self._por_rol.clear()
+
+    def stats(self) -> dict:
+        return {"roles": len(self._por_rol), "hits": self.hits, "misses": self.misses}
+
+
+role_catalog = RoleCatalog()
+staff_directory = StaffDirectory()
+
+
+# Aviso entre procesos: cambiaron roles (roles=True) o usuarios
+CATALOGOS_CAMBIADOS = "catalogos_cambiados"
+
+
+def _invalidar(aviso: dict) -> None:
+    if aviso.get("roles"):
+        role_catalog.invalidate()
+    staff_directory.invalidate()
+
+
+async def invalidar_catalogos(roles: bool = True) -> None:
+    # Para los endpoints que escriben roles o usuarios (roles=False); los
+    # demás procesos reciben el aviso por el backend de manager
+    _invalidar({"roles": roles})
+    await manager.broadcast_control(CATALOGOS_CAMBIADOS, roles=roles)
+
+
+manager.on_control(CATALOGOS_CAMBIADOS, _invalidar)
@@ -1,22 +1,40 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, insert, or_, union_all, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
 
 from app.models.citas import Cita
 from app.models.users import User
+from app.services.disponibilidad import slot_store
+from app.utils.pagination import apply_keyset, split_page
+
+# SQLSTATE de Postgres para violaciones de restricciones EXCLUDE
+EXCLUSION_VIOLATION = "23P01"
+
+
+class CitaSolapadaError(Exception):
+    """El psicólogo ya tiene una cita activa que se cruza con el horario pedido."""
+
+    def __init__(self, conflictos: list[datetime] | None = None):
+        super().__init__(conflictos)
+        # Inicio de las ocurrencias pedidas que chocan, si se conocen
+        self.conflictos = conflictos or []
+
+
+def _es_solape(exc: IntegrityError) -> bool:
+    return getattr(exc.orig, "sqlstate", None) == EXCLUSION_VIOLATION
 
 
 class CitasService:
     @staticmethod
-    async def get_all(db: AsyncSession):
-        # Fetch citas with psicologo and estudiante names in a single query
-        from sqlalchemy.orm import aliased
-
+    def _enriched_select():
+        # Cita + nombres de psicologo y estudiante en una sola consulta
         P = aliased(User)
         E = aliased(User)
-        stmt = (
+        return (
             select(
                 Cita,
                 P.nombre.label("p_nombre"),
@@ -24,43 +42,160 @@ class CitasService:
                 E.nombre.label("e_nombre"),
                 E.apellido.label("e_apellido"),
             )
-            .join(P, Cita.id_psicologo == P.id_usuario)
-            .join(E, Cita.id_estudiante == E.id_usuario)
+            .outerjoin(P, Cita.id_psicologo == P.id_usuario)
+            .outerjoin(E, Cita.id_estudiante == E.id_usuario)
+        )
+
+    @staticmethod
+    def _to_dict(cita: Cita, psicologo: str | None, estudiante: str | None):
+        return {
+            "id_cita": cita.id_cita,
+            "id_estudiante": cita.id_estudiante,
+            "id_psicologo": cita.id_psicologo,
+            "fecha_hora_inicio": cita.fecha_hora_inicio,
+            "fecha_hora_fin": cita.fecha_hora_fin,
+            "modalidad": cita.modalidad,
+            "titulo": getattr(cita, "nombre_cita", None),
+            "psicologo": psicologo,
+            "estudiante": estudiante,
+        }
+
+    @staticmethod
+    def row_to_dict(row):
+        cita, p_nombre, p_apellido, e_nombre, e_apellido = row
+        return CitasService._to_dict(
+            cita,
+            f"{p_nombre} {p_apellido}" if p_nombre is not None else None,
+            f"{e_nombre} {e_apellido}" if e_nombre is not None else None,
         )
+
+    @staticmethod
+    async def _fetch_enriched(db: AsyncSession, stmt):
         result = await db.execute(stmt)
-        rows = result.all()
-        citas = []
-        for cita, p_nombre, p_apellido, e_nombre, e_apellido in rows:
-            citas.append(
-                {
-                    "id_cita": cita.id_cita,
-                    "id_estudiante": cita.id_estudiante,
-                    "id_psicologo": cita.id_psicologo,
-                    "fecha_hora_inicio": cita.fecha_hora_inicio,
-                    "fecha_hora_fin": cita.fecha_hora_fin,
-                    "modalidad": cita.modalidad,
-                    "psicologo": f"{p_nombre} {p_apellido}",
-                    "estudiante": f"{e_nombre} {e_apellido}",
-                }
+        return [CitasService.row_to_dict(row) for row in result.all()]
+
+    @staticmethod
+    async def enrich_many(db: AsyncSession, citas):
+        # Para citas ya cargadas: una sola consulta IN por todos los usuarios
+        citas = list(citas)
+        if not citas:
+            return []
+        ids = {c.id_psicologo for c in citas} | {c.id_estudiante for c in citas}
+        result = await db.execute(
+            select(User.id_usuario, User.nombre, User.apellido).where(
+                User.id_usuario.in_(ids)
             )
-        return citas
+        )
+        nombres = {
+            id_usuario: f"{nombre} {apellido}"
+            for id_usuario, nombre, apellido in result.all()
+        }
+        return [
+            CitasService._to_dict(
+                c, nombres.get(c.id_psicologo), nombres.get(c.id_estudiante)
+            )
+            for c in citas
+        ]
+
+    @staticmethod
+    async def enriched_cita(db: AsyncSession, cita: Cita):
+        return (await CitasService.enrich_many(db, [cita]))[0]
+
+    @staticmethod
+    async def get_all(db: AsyncSession):
+        return await CitasService._fetch_enriched(db, CitasService._enriched_select())
+
+    @staticmethod
+    def page_stmt(cursor: str | None = None):
+        return apply_keyset(CitasService._enriched_select(), [Cita.id_cita], cursor)
+
+    @staticmethod
+    async def get_page(db: AsyncSession, limit: int, cursor: str | None = None):
+        citas = await CitasService._fetch_enriched(
+            db, CitasService.page_stmt(cursor).limit(limit + 1)
+        )
+        return split_page(citas, limit, lambda c: (c["id_cita"],))
 
     @staticmethod
     async def get_by_id(db: AsyncSession, cita_id: int):
-        result = await db.execute(select(Cita).where(Cita.id_cita == cita_id))
-        cita = result.scalar_one_or_none()
-        if cita:
-            return await CitasService.enriched_cita(db, cita)
-        return None
+        citas = await CitasService._fetch_enriched(
+            db, CitasService._enriched_select().where(Cita.id_cita == cita_id)
+        )
+        return citas[0] if citas else None
+
+    @staticmethod
+    async def _commit_reserva(db: AsyncSession, stmt):
+        # La restricción EXCLUDE valida el solape en la misma sentencia
+        try:
+            citas = (await db.execute(stmt)).scalars().all()
+            await db.commit()
+        except IntegrityError as e:
+            await db.rollback()
+            if _es_solape(e):
+                raise CitaSolapadaError() from e
+            raise
+        for cita in citas:
+            slot_store.cita_agregada(
+                cita.id_psicologo, cita.fecha_hora_inicio, cita.fecha_hora_fin
+            )
+        for id_psicologo in {cita.id_psicologo for cita in citas}:
+            await slot_store.publicar(id_psicologo)
+        return citas
 
     @staticmethod
     async def create(db: AsyncSession, cita_in):
-        db_cita = Cita(**cita_in.dict())
-        db.add(db_cita)
-        await db.commit()
-        await db.refresh(db_cita)
+        db_cita, = await CitasService._commit_reserva(
+            db, insert(Cita).values(**cita_in.dict()).returning(Cita)
+        )
         return await CitasService.enriched_cita(db, db_cita)
 
+    @staticmethod
+    async def create_series(db: AsyncSession, serie_in):
+        ocurrencias = serie_in.expandir()
+        # Un solo SELECT para comprobar todas las ocurrencias contra la agenda
+        result = await db.execute(
+            select(Cita.fecha_hora_inicio, Cita.fecha_hora_fin).where(
+                Cita.id_psicologo == serie_in.id_psicologo,
+                Cita.fecha_cancelacion.is_(None),
+                or_(
+                    *[
+                        and_(Cita.fecha_hora_inicio < fin, Cita.fecha_hora_fin > inicio)
+                        for inicio, fin in ocurrencias
+                    ]
+                ),
+            )
+        )
+        ocupadas = result.all()
+        if ocupadas:
+            await db.rollback()
+            raise CitaSolapadaError(
+                [
+                    inicio
+                    for inicio, fin in ocurrencias
+                    if any(o_ini < fin and o_fin > inicio for o_ini, o_fin in ocupadas)
+                ]
+            )
+        # Un único INSERT multi-fila con RETURNING, en la misma transacción
+        citas = await CitasService._commit_reserva(
+            db,
+            insert(Cita)
+            .values(
+                [
+                    {
+                        "id_estudiante": serie_in.id_estudiante,
+                        "id_psicologo": serie_in.id_psicologo,
+                        "fecha_hora_inicio": inicio,
+                        "fecha_hora_fin": fin,
+                        "modalidad": serie_in.modalidad,
+                    }
+                    for inicio, fin in ocurrencias
+                ]
+            )
+            .returning(Cita),
+        )
+        citas = sorted(citas, key=lambda c: c.fecha_hora_inicio)
+        return await CitasService.enrich_many(db, citas)
+
     @staticmethod
     async def delete(db: AsyncSession, cita_id: int):
         cita = await CitasService.get_by_id(db, cita_id)
@@ -71,49 +206,50 @@ class CitasService:
             if cita_obj:
                 await db.delete(cita_obj)
                 await db.commit()
+                slot_store.cita_eliminada(
+                    cita_obj.id_psicologo,
+                    cita_obj.fecha_hora_inicio,
+                    cita_obj.fecha_hora_fin,
+                )
+                await slot_store.publicar(cita_obj.id_psicologo)
         return cita
 
     @staticmethod
     async def get_by_estudiante(db: AsyncSession, id_estudiante: int):
-        result = await db.execute(
-            select(Cita).where(Cita.id_estudiante == id_estudiante)
+        return await CitasService._fetch_enriched(
+            db,
+            CitasService._enriched_select().where(Cita.id_estudiante == id_estudiante),
         )
-        citas = result.scalars().all()
-        return [await CitasService.enriched_cita(db, t) for t in citas]
 
     @staticmethod
     async def get_by_psicologo(db: AsyncSession, id_psicologo: int):
-        result = await db.execute(select(Cita).where(Cita.id_psicologo == id_psicologo))
-        citas = result.scalars().all()
-        return [await CitasService.enriched_cita(db, t) for t in citas]
+        return await CitasService._fetch_enriched(
+            db,
+            CitasService._enriched_select().where(Cita.id_psicologo == id_psicologo),
+        )
 
     @staticmethod
-    async def enriched_cita(db: AsyncSession, cita: Cita):
-        # Busca nombres de psicologo y estudiante, y nombre de la cita
-        result = await db.execute(
-            select(User).where(User.id_usuario == cita.id_psicologo)
+    def range_stmt(usuario_id: int, from_dt: datetime, to_dt: datetime):
+        # Una rama por rol para que cada una use su índice
+        # (id_psicologo|id_estudiante, fecha_hora_inicio); un OR fuerza seq scan
+        rango = (
+            Cita.fecha_hora_inicio >= from_dt,
+            Cita.fecha_hora_inicio <= to_dt,
+            Cita.fecha_hora_fin <= to_dt,
         )
-        psicologo = result.scalar_one_or_none()
-        result = await db.execute(
-            select(User).where(User.id_usuario == cita.id_estudiante)
-        )
-        estudiante = result.scalar_one_or_none()
-        # No need to re-query cita, already have it
-        return {
-            "id_cita": cita.id_cita,
-            "id_estudiante": cita.id_estudiante,
-            "id_psicologo": cita.id_psicologo,
-            "fecha_hora_inicio": cita.fecha_hora_inicio,
-            "fecha_hora_fin": cita.fecha_hora_fin,
-            "modalidad": cita.modalidad,
-            "titulo": getattr(cita, "nombre_cita", None),
-            "psicologo": (
-                f"{psicologo.nombre} {psicologo.apellido}" if psicologo else None
-            ),
-            "estudiante": (
-                f"{estudiante.nombre} {estudiante.apellido}" if estudiante else None
+        ids = union_all(
+            select(Cita.id_cita).where(Cita.id_psicologo == usuario_id, *rango),
+            select(Cita.id_cita).where(
+                Cita.id_estudiante == usuario_id,
+                Cita.id_psicologo != usuario_id,
+                *rango,
             ),
-        }
+        ).subquery()
+        return (
+            CitasService._enriched_select()
+            .where(Cita.id_cita.in_(select(ids.c.id_cita)))
+            .order_by(Cita.fecha_hora_inicio)
+        )
 
     @staticmethod
     async def get_by_user_and_range(
@@ -122,20 +258,9 @@ class CitasService:
         # from_date y to_date son strings tipo 'YYYY-MM-DD'
         from_dt = datetime.fromisoformat(from_date)
         to_dt = datetime.fromisoformat(to_date)
-
-        stmt = select(Cita).where(
-            and_(
-                or_(
-                    Cita.id_estudiante == usuario_id,
-                    Cita.id_psicologo == usuario_id,
-                ),
-                Cita.fecha_hora_inicio >= from_dt,
-                Cita.fecha_hora_fin <= to_dt,
-            )
+        return await CitasService._fetch_enriched(
+            db, CitasService.range_stmt(usuario_id, from_dt, to_dt)
         )
-        result = await db.execute(stmt)
-        citas = result.scalars().all()
-        return [await CitasService.enriched_cita(db, t) for t in citas]
 
     @staticmethod
     async def reschedule(db: AsyncSession, cita_id: int, reschedule_in):
@@ -151,8 +276,19 @@ class CitasService:
         if (cita_fecha_inicio - now).total_seconds() < 24 * 3600:
             # Not allowed to reschedule if cita is less than 24h away
             return None
-        cita.fecha_hora_inicio = reschedule_in.fecha_hora_inicio
-        cita.fecha_hora_fin = reschedule_in.fecha_hora_fin
-        await db.commit()
-        await db.refresh(cita)
-        return await CitasService.enriched_cita(db, cita)
+        anterior = (cita.id_psicologo, cita.fecha_hora_inicio, cita.fecha_hora_fin)
+        citas = await CitasService._commit_reserva(
+            db,
+            update(Cita)
+            .where(Cita.id_cita == cita_id)
+            .values(
+                fecha_hora_inicio=reschedule_in.fecha_hora_inicio,
+                fecha_hora_fin=reschedule_in.fecha_hora_fin,
+            )
+            .returning(Cita),
+        )
+        if not citas:
+            return None
+        slot_store.cita_eliminada(*anterior)
+        await slot_store.publicar(anterior[0])
+        return await CitasService.enriched_cita(db, citas[0])
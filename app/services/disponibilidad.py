@@ -0,0 +1,517 @@
+import heapq
+from datetime import date, datetime, time, timedelta, tzinfo
+from itertools import islice
+from time import monotonic
+from typing import Optional
+
+from sqlalchemy import Date, cast, delete, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.ws import ConnectionManager, manager
+from app.models.citas import Cita
+from app.models.disponibilidad import DisponibilidadPsicologo
+from app.models.users import User
+from app.utils.date_utils import ZONA_POR_DEFECTO
+from app.utils.slots import Interval, expand_bands, iter_free_slots
+
+# Aviso entre procesos: la agenda de un psicólogo cambió
+AGENDA_CAMBIADA = "agenda_cambiada"
+
+
+class FranjasInvalidasError(ValueError):
+    """Las franjas enviadas se solapan o tienen una hora de fin no posterior al inicio."""
+
+
+def validar_franjas(franjas) -> None:
+    ordenadas = sorted(franjas, key=lambda f: (f.dia_semana, f.hora_inicio))
+    for i, franja in enumerate(ordenadas):
+        if franja.hora_fin <= franja.hora_inicio:
+            raise FranjasInvalidasError(
+                f"La franja {franja.hora_inicio}-{franja.hora_fin} termina antes de empezar"
+            )
+        anterior = ordenadas[i - 1] if i else None
+        if (
+            anterior
+            and anterior.dia_semana == franja.dia_semana
+            and franja.hora_inicio < anterior.hora_fin
+        ):
+            raise FranjasInvalidasError(
+                f"Las franjas {anterior.hora_inicio}-{anterior.hora_fin} y "
+                f"{franja.hora_inicio}-{franja.hora_fin} se solapan"
+            )
+
+
+class DisponibilidadService:
+    @staticmethod
+    async def get_weekdays(db: AsyncSession, id_psicologo: int) -> set[int]:
+        result = await db.execute(
+            select(DisponibilidadPsicologo.dia_semana)
+            .where(DisponibilidadPsicologo.id_psicologo == id_psicologo)
+            .distinct()
+        )
+        return set(result.scalars().all())
+
+    @staticmethod
+    async def get_bands(
+        db: AsyncSession, id_psicologo: int, weekdays: set[int] | None = None
+    ):
+        stmt = select(
+            DisponibilidadPsicologo.dia_semana,
+            DisponibilidadPsicologo.hora_inicio,
+            DisponibilidadPsicologo.hora_fin,
+        ).where(DisponibilidadPsicologo.id_psicologo == id_psicologo)
+        if weekdays is not None:
+            stmt = stmt.where(DisponibilidadPsicologo.dia_semana.in_(weekdays))
+        result = await db.execute(stmt)
+        return [tuple(row) for row in result.all()]
+
+    @staticmethod
+    async def replace_semana(db: AsyncSession, id_psicologo: int, franjas):
+        """Sustituye el horario semanal completo aplicando solo la diferencia:
+        un DELETE y un INSERT multi-fila en una única transacción."""
+        validar_franjas(franjas)
+        result = await db.execute(
+            select(DisponibilidadPsicologo).where(
+                DisponibilidadPsicologo.id_psicologo == id_psicologo
+            )
+        )
+        actuales = result.scalars().all()
+
+        def clave(f):
+            return (f.dia_semana, f.hora_inicio, f.hora_fin)
+
+        nuevas = {clave(f) for f in franjas}
+        conservadas = [d for d in actuales if clave(d) in nuevas]
+        borrar = [d.id_disponibilidad for d in actuales if clave(d) not in nuevas]
+        insertar = nuevas - {clave(d) for d in conservadas}
+
+        if borrar:
+            await db.execute(
+                delete(DisponibilidadPsicologo).where(
+                    DisponibilidadPsicologo.id_disponibilidad.in_(borrar)
+                )
+            )
+        insertadas = []
+        if insertar:
+            result = await db.execute(
+                insert(DisponibilidadPsicologo)
+                .values(
+                    [
+                        {
+                            "id_psicologo": id_psicologo,
+                            "dia_semana": dia,
+                            "hora_inicio": hora_inicio,
+                            "hora_fin": hora_fin,
+                        }
+                        for dia, hora_inicio, hora_fin in insertar
+                    ]
+                )
+                .returning(DisponibilidadPsicologo)
+            )
+            insertadas = result.scalars().all()
+        await db.commit()
+        if borrar or insertar:
+            slot_store.franjas_reemplazadas(id_psicologo, nuevas)
+            await slot_store.publicar(id_psicologo)
+        return sorted(
+            [*conservadas, *insertadas],
+            key=lambda d: (d.dia_semana, d.hora_inicio),
+        )
+
+    @staticmethod
+    async def get_busy(
+        db: AsyncSession, id_psicologo: int, desde: datetime, hasta: datetime
+    ) -> list[Interval]:
+        result = await db.execute(
+            select(Cita.fecha_hora_inicio, Cita.fecha_hora_fin).where(
+                Cita.id_psicologo == id_psicologo,
+                Cita.fecha_cancelacion.is_(None),
+                Cita.fecha_hora_inicio < hasta,
+                Cita.fecha_hora_fin > desde,
+            )
+        )
+        return [tuple(row) for row in result.all()]
+
+    @staticmethod
+    async def get_horarios_libres(
+        db: AsyncSession,
+        id_psicologo: int,
+        desde: date,
+        hasta: date,
+        duracion: timedelta,
+        paso: timedelta | None = None,
+        buffer: timedelta = timedelta(0),
+        tz: tzinfo = ZONA_POR_DEFECTO,
+        usar_store: bool = True,
+    ) -> list[Interval]:
+        if usar_store and slot_store.cubre(duracion, paso, buffer, tz):
+            cached = await slot_store.get_slots(db, id_psicologo, desde, hasta)
+            if cached is not None:
+                return cached
+        # Para rangos de menos de una semana solo hacen falta algunos días
+        weekdays = (
+            {dia.weekday() for dia in _dias(desde, hasta)}
+            if (hasta - desde).days < 6
+            else None
+        )
+        bands = expand_bands(
+            await DisponibilidadService.get_bands(db, id_psicologo, weekdays),
+            desde,
+            hasta,
+            tz,
+        )
+        if not bands:
+            return []
+        busy = await DisponibilidadService.get_busy(
+            db,
+            id_psicologo,
+            min(inicio for inicio, _ in bands) - buffer,
+            max(fin for _, fin in bands) + buffer,
+        )
+        return list(iter_free_slots(bands, busy, duracion, paso, buffer))
+
+    @staticmethod
+    async def get_earliest(
+        db: AsyncSession,
+        desde: datetime,
+        dias: int,
+        limit: int,
+        duracion: timedelta,
+        tz: tzinfo = ZONA_POR_DEFECTO,
+    ) -> list[dict]:
+        """Primeros ``limit`` slots libres entre todos los psicólogos.
+
+        Dos consultas en total (franjas y citas de la ventana); los slots de
+        cada psicólogo se generan en orden y se mezclan con un heap, así solo
+        se calcula lo necesario para llegar a ``limit``.
+        """
+        hasta = desde + timedelta(days=dias)
+        result = await db.execute(
+            select(
+                DisponibilidadPsicologo.id_psicologo,
+                DisponibilidadPsicologo.dia_semana,
+                DisponibilidadPsicologo.hora_inicio,
+                DisponibilidadPsicologo.hora_fin,
+                User.nombre,
+                User.apellido,
+            ).join(User, User.id_usuario == DisponibilidadPsicologo.id_psicologo)
+        )
+        bands: dict[int, list[tuple[int, time, time]]] = {}
+        nombres: dict[int, str] = {}
+        for id_psicologo, weekday, hora_inicio, hora_fin, nombre, apellido in result.all():
+            bands.setdefault(id_psicologo, []).append((weekday, hora_inicio, hora_fin))
+            nombres[id_psicologo] = f"{nombre} {apellido}"
+        if not bands:
+            return []
+
+        result = await db.execute(
+            select(Cita.id_psicologo, Cita.fecha_hora_inicio, Cita.fecha_hora_fin).where(
+                Cita.id_psicologo.in_(bands),
+                Cita.fecha_cancelacion.is_(None),
+                Cita.fecha_hora_inicio < hasta,
+                Cita.fecha_hora_fin > desde,
+            )
+        )
+        busy: dict[int, list[Interval]] = {}
+        for id_psicologo, inicio, fin in result.all():
+            busy.setdefault(id_psicologo, []).append((inicio, fin))
+
+        def slots_de(id_psicologo: int):
+            bands_psicologo = expand_bands(
+                bands[id_psicologo],
+                desde.astimezone(tz).date(),
+                hasta.astimezone(tz).date(),
+                tz,
+            )
+            for inicio, fin in iter_free_slots(
+                bands_psicologo, busy.get(id_psicologo, ()), duracion
+            ):
+                if fin > hasta:
+                    return
+                if inicio >= desde:
+                    yield inicio, id_psicologo, fin
+
+        return [
+            {
+                "id_psicologo": id_psicologo,
+                "psicologo": nombres[id_psicologo],
+                "inicio": inicio,
+                "fin": fin,
+            }
+            for inicio, id_psicologo, fin in islice(
+                heapq.merge(*(slots_de(id_psicologo) for id_psicologo in bands)), limit
+            )
+        ]
+
+    @staticmethod
+    async def get_dias_libres(
+        db: AsyncSession,
+        id_psicologo: int,
+        start: date,
+        end: date,
+        tz: tzinfo = ZONA_POR_DEFECTO,
+        usar_store: bool = True,
+    ) -> list[str]:
+        if usar_store and tz == slot_store.tz:
+            cached = await slot_store.get_dias_libres(db, id_psicologo, start, end)
+            if cached is not None:
+                return cached
+        weekdays = await DisponibilidadService.get_weekdays(db, id_psicologo)
+        if not weekdays or start > end:
+            return []
+        # Días con citas en una sola consulta agrupada; el filtro es un rango
+        # semiabierto sobre fecha_hora_inicio (sin cast) y usa el índice del
+        # psicólogo. Solo la agrupación convierte a la zona pedida.
+        dia = cast(func.timezone(str(tz), Cita.fecha_hora_inicio), Date)
+        result = await db.execute(
+            select(dia)
+            .where(
+                Cita.id_psicologo == id_psicologo,
+                Cita.fecha_cancelacion.is_(None),
+                Cita.fecha_hora_inicio >= datetime.combine(start, time.min, tzinfo=tz),
+                Cita.fecha_hora_inicio
+                < datetime.combine(end + timedelta(days=1), time.min, tzinfo=tz),
+            )
+            .group_by(dia)
+        )
+        ocupados = set(result.scalars().all())
+        libres = []
+        current = end
+        while current >= start:
+            if current.weekday() in weekdays and current not in ocupados:
+                libres.append(current.isoformat())
+            current -= timedelta(days=1)
+        # Ya quedan ordenadas de forma descendente
+        return libres
+
+
+def _dias(desde: date, hasta: date):
+    dia = desde
+    while dia <= hasta:
+        yield dia
+        dia += timedelta(days=1)
+
+
+class _Agenda:
+    def __init__(self, bands, desde: date, hasta: date):
+        self.bands: list[tuple[int, time, time]] = list(bands)
+        self.desde = desde
+        self.hasta = hasta
+        self.cargada = monotonic()
+        # Citas activas y slots libres por día (en la zona del store)
+        self.busy: dict[date, list[Interval]] = {}
+        self.slots: dict[date, list[Interval]] = {}
+
+
+class SlotStore:
+    """Slots libres precalculados por psicólogo para las próximas semanas.
+
+    Cada agenda se carga la primera vez que se consulta (dos consultas) y
+    después se mantiene de forma incremental: una cita o una franja que cambia
+    solo recalcula los días a los que afecta. El store es por proceso: tras
+    aplicar un cambio, ``publicar`` avisa por el backend de ``manager`` y los
+    demás procesos descartan su copia de esa agenda. El TTL acota la deriva
+    si el aviso se pierde y ``verificar`` la detecta.
+    """
+
+    def __init__(
+        self,
+        semanas: int = 8,
+        ttl: float = 300.0,
+        duracion: timedelta = timedelta(hours=1),
+        tz: tzinfo = ZONA_POR_DEFECTO,
+        manager: Optional[ConnectionManager] = None,
+    ) -> None:
+        self.semanas = semanas
+        self.ttl = ttl
+        self.duracion = duracion
+        self.tz = tz
+        self.manager = manager
+        self._agendas: dict[int, _Agenda] = {}
+        # Se incrementa con cada cambio para descartar cargas que lo solapan
+        self._versiones: dict[int, int] = {}
+        if manager is not None:
+            manager.on_control(
+                AGENDA_CAMBIADA, lambda aviso: self.invalidar(aviso["id_psicologo"])
+            )
+
+    def cubre(self, duracion, paso, buffer, tz) -> bool:
+        return (
+            duracion == self.duracion
+            and paso in (None, duracion)
+            and not buffer
+            and tz == self.tz
+        )
+
+    def _ventana(self) -> tuple[date, date]:
+        hoy = datetime.now(self.tz).date()
+        return hoy, hoy + timedelta(weeks=self.semanas, days=-1)
+
+    def _inicio_dia(self, dia: date) -> datetime:
+        return datetime.combine(dia, time.min, tzinfo=self.tz)
+
+    def _dias_afectados(self, agenda: _Agenda, inicio: datetime, fin: datetime):
+        desde = max(inicio.astimezone(self.tz).date(), agenda.desde)
+        hasta = min((fin - timedelta(microseconds=1)).astimezone(self.tz).date(), agenda.hasta)
+        return _dias(desde, hasta)
+
+    def _recalcular(self, agenda: _Agenda, dia: date) -> None:
+        bands = expand_bands(agenda.bands, dia, dia, self.tz)
+        agenda.slots[dia] = list(
+            iter_free_slots(bands, agenda.busy.get(dia, ()), self.duracion)
+        )
+
+    async def _agenda(self, db: AsyncSession, id_psicologo: int) -> _Agenda:
+        desde, hasta = self._ventana()
+        agenda = self._agendas.get(id_psicologo)
+        if agenda and agenda.desde == desde and monotonic() - agenda.cargada < self.ttl:
+            return agenda
+        version = self._versiones.get(id_psicologo, 0)
+        agenda = _Agenda(
+            await DisponibilidadService.get_bands(db, id_psicologo), desde, hasta
+        )
+        for inicio, fin in await DisponibilidadService.get_busy(
+            db,
+            id_psicologo,
+            self._inicio_dia(desde),
+            self._inicio_dia(hasta + timedelta(days=1)),
+        ):
+            for dia in self._dias_afectados(agenda, inicio, fin):
+                agenda.busy.setdefault(dia, []).append((inicio, fin))
+        for dia in _dias(desde, hasta):
+            self._recalcular(agenda, dia)
+        if self._versiones.get(id_psicologo, 0) == version:
+            self._agendas[id_psicologo] = agenda
+        return agenda
+
+    def _en_ventana(self, desde: date, hasta: date) -> bool:
+        ventana_desde, ventana_hasta = self._ventana()
+        return ventana_desde <= desde and hasta <= ventana_hasta
+
+    async def get_slots(
+        self, db: AsyncSession, id_psicologo: int, desde: date, hasta: date
+    ) -> list[Interval] | None:
+        """Slots libres del rango, o None si cae fuera de la ventana."""
+        if not self._en_ventana(desde, hasta):
+            return None
+        agenda = await self._agenda(db, id_psicologo)
+        return [slot for dia in _dias(desde, hasta) for slot in agenda.slots.get(dia, ())]
+
+    async def get_dias_libres(
+        self, db: AsyncSession, id_psicologo: int, start: date, end: date
+    ) -> list[str] | None:
+        if start > end or not self._en_ventana(start, end):
+            return None
+        agenda = await self._agenda(db, id_psicologo)
+        weekdays = {weekday for weekday, _, _ in agenda.bands}
+        libres = []
+        for dia in _dias(start, end):
+            ocupado = any(
+                inicio.astimezone(self.tz).date() == dia
+                for inicio, _ in agenda.busy.get(dia, ())
+            )
+            if dia.weekday() in weekdays and not ocupado:
+                libres.append(dia.isoformat())
+        libres.reverse()
+        return libres
+
+    def _cambio(self, id_psicologo: int) -> _Agenda | None:
+        self._versiones[id_psicologo] = self._versiones.get(id_psicologo, 0) + 1
+        return self._agendas.get(id_psicologo)
+
+    def invalidar(self, id_psicologo: int) -> None:
+        # La próxima consulta vuelve a cargar la agenda desde la base
+        self._cambio(id_psicologo)
+        self._agendas.pop(id_psicologo, None)
+
+    async def publicar(self, id_psicologo: int) -> None:
+        # Los demás procesos descartan su agenda; la de este ya se actualizó
+        if self.manager is not None:
+            await self.manager.broadcast_control(
+                AGENDA_CAMBIADA, id_psicologo=id_psicologo
+            )
+
+    def cita_agregada(self, id_psicologo: int, inicio: datetime, fin: datetime) -> None:
+        agenda = self._cambio(id_psicologo)
+        if agenda is None:
+            return
+        for dia in self._dias_afectados(agenda, inicio, fin):
+            agenda.busy.setdefault(dia, []).append((inicio, fin))
+            self._recalcular(agenda, dia)
+
+    def cita_eliminada(self, id_psicologo: int, inicio: datetime, fin: datetime) -> None:
+        agenda = self._cambio(id_psicologo)
+        if agenda is None:
+            return
+        for dia in self._dias_afectados(agenda, inicio, fin):
+            busy = agenda.busy.get(dia, [])
+            if (inicio, fin) in busy:
+                busy.remove((inicio, fin))
+            self._recalcular(agenda, dia)
+
+    def _franja_cambiada(self, agenda: _Agenda, weekday: int) -> None:
+        for dia in _dias(agenda.desde, agenda.hasta):
+            if dia.weekday() == weekday:
+                self._recalcular(agenda, dia)
+
+    def franja_agregada(
+        self, id_psicologo: int, weekday: int, hora_inicio: time, hora_fin: time
+    ) -> None:
+        agenda = self._cambio(id_psicologo)
+        if agenda is None:
+            return
+        agenda.bands.append((weekday, hora_inicio, hora_fin))
+        self._franja_cambiada(agenda, weekday)
+
+    def franja_eliminada(
+        self, id_psicologo: int, weekday: int, hora_inicio: time, hora_fin: time
+    ) -> None:
+        agenda = self._cambio(id_psicologo)
+        if agenda is None:
+            return
+        if (weekday, hora_inicio, hora_fin) in agenda.bands:
+            agenda.bands.remove((weekday, hora_inicio, hora_fin))
+        self._franja_cambiada(agenda, weekday)
+
+    def franjas_reemplazadas(
+        self, id_psicologo: int, bands: set[tuple[int, time, time]]
+    ) -> None:
+        agenda = self._cambio(id_psicologo)
+        if agenda is None:
+            return
+        cambiados = {weekday for weekday, _, _ in set(agenda.bands) ^ bands}
+        agenda.bands = list(bands)
+        for weekday in cambiados:
+            self._franja_cambiada(agenda, weekday)
+
+    async def verificar(self, db: AsyncSession, id_psicologo: int) -> list[date]:
+        """Compara el store con un recálculo completo y devuelve los días que difieren."""
+        agenda = await self._agenda(db, id_psicologo)
+        completo: dict[date, list[Interval]] = {}
+        for slot in await DisponibilidadService.get_horarios_libres(
+            db,
+            id_psicologo,
+            agenda.desde,
+            agenda.hasta,
+            self.duracion,
+            tz=self.tz,
+            usar_store=False,
+        ):
+            completo.setdefault(slot[0].astimezone(self.tz).date(), []).append(slot)
+        diferencias = {
+            dia
+            for dia in _dias(agenda.desde, agenda.hasta)
+            if agenda.slots.get(dia, []) != completo.get(dia, [])
+        }
+        dias_store = await self.get_dias_libres(db, id_psicologo, agenda.desde, agenda.hasta)
+        dias_completo = await DisponibilidadService.get_dias_libres(
+            db, id_psicologo, agenda.desde, agenda.hasta, self.tz, usar_store=False
+        )
+        diferencias |= {
+            date.fromisoformat(dia) for dia in set(dias_store or ()) ^ set(dias_completo)
+        }
+        return sorted(diferencias)
+
+
+slot_store = SlotStore(manager=manager)
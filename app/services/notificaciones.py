@@ -0,0 +1,104 @@
+from time import monotonic
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.ws import ConnectionManager, manager
+from app.models.notificacion import Notificacion
+
+# Aviso entre procesos: cambiaron las no leídas de estos usuarios
+UNREAD_CAMBIADO = "unread_cambiado"
+
+
+def destinatarios(id_estudiante: int | None, id_psicologo: int | None) -> list[int]:
+    # Usuarios que ven una notificación (sin repetir si ambos coinciden)
+    targets = []
+    if id_estudiante:
+        targets.append(id_estudiante)
+    if id_psicologo and id_psicologo != id_estudiante:
+        targets.append(id_psicologo)
+    return targets
+
+
+def agrupar_por_destinatario(rows) -> dict[int, list[int]]:
+    # rows: (id_notificacion, id_estudiante, id_psicologo) -> {usuario: [ids]}
+    por_usuario: dict[int, list[int]] = {}
+    for id_notificacion, id_estudiante, id_psicologo in rows:
+        for uid in destinatarios(id_estudiante, id_psicologo):
+            por_usuario.setdefault(uid, []).append(id_notificacion)
+    return por_usuario
+
+
+class UnreadCounter:
+    """Notificaciones no leídas por usuario.
+
+    El valor inicial sale de un COUNT(*) resuelto con los índices parciales
+    ``leida = false``; a partir de ahí se mantiene en memoria con los ajustes
+    que hacen los endpoints que crean, leen o borran notificaciones. Tras
+    ajustar, ``publicar`` avisa a los demás procesos, que descartan el conteo
+    de esos usuarios (no aplican el delta: el aviso puede repetirse). El TTL
+    acota la deriva si se pierde un aviso.
+    """
+
+    def __init__(
+        self, ttl: float = 300.0, manager: Optional[ConnectionManager] = None
+    ) -> None:
+        self.ttl = ttl
+        self.manager = manager
+        self._counts: dict[int, tuple[int, float]] = {}
+        # Se incrementa con cada ajuste para descartar conteos que lo solapan
+        self._versiones: dict[int, int] = {}
+        if manager is not None:
+            manager.on_control(
+                UNREAD_CAMBIADO, lambda aviso: self.invalidate_many(aviso["user_ids"])
+            )
+
+    async def get(self, db: AsyncSession, user_id: int) -> int:
+        cached = self._counts.get(user_id)
+        if cached and monotonic() - cached[1] < self.ttl:
+            return cached[0]
+        version = self._versiones.get(user_id, 0)
+        result = await db.execute(
+            select(func.count())
+            .select_from(Notificacion)
+            .where(
+                (
+                    (Notificacion.id_estudiante == user_id)
+                    | (Notificacion.id_psicologo == user_id)
+                )
+                & (Notificacion.leida == False)  # noqa: E712
+            )
+        )
+        count = result.scalar_one()
+        if self._versiones.get(user_id, 0) == version:
+            self._counts[user_id] = (count, monotonic())
+        return count
+
+    def adjust(self, user_id: int, delta: int) -> None:
+        self._versiones[user_id] = self._versiones.get(user_id, 0) + 1
+        cached = self._counts.get(user_id)
+        if cached:
+            self._counts[user_id] = (max(cached[0] + delta, 0), cached[1])
+
+    def adjust_many(self, user_ids, delta: int = 1) -> None:
+        for user_id in user_ids:
+            self.adjust(user_id, delta)
+
+    def invalidate(self, user_id: int) -> None:
+        self._versiones[user_id] = self._versiones.get(user_id, 0) + 1
+        self._counts.pop(user_id, None)
+
+
+    def invalidate_many(self, user_ids) -> None:
+        for user_id in user_ids:
+            self.invalidate(user_id)
+
+    async def publicar(self, user_ids) -> None:
+        user_ids = list(user_ids)
+        if self.manager is not None and user_ids:
+            await self.manager.broadcast_control(UNREAD_CAMBIADO, user_ids=user_ids)
+
+
+unread_counter = UnreadCounter(manager=manager)
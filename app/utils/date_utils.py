@@ -0,0 +1,31 @@
+import unicodedata
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+DIAS_SEMANA = ["LUNES", "MARTES", "MIERCOLES", "JUEVES", "VIERNES", "SABADO", "DOMINGO"]
+
+ZONA_POR_DEFECTO = ZoneInfo(settings.timezone)
+
+
+def dia_a_weekday(dia: str) -> int | None:
+    # 'miércoles', 'Miercoles ', 'MIERCOLES' -> 2 (0=lunes, como date.weekday())
+    nombre = (
+        unicodedata.normalize("NFKD", dia)
+        .encode("ascii", "ignore")
+        .decode("ascii")
+        .upper()
+        .strip()
+    )
+    return DIAS_SEMANA.index(nombre) if nombre in DIAS_SEMANA else None
+
+
+def zona_horaria(nombre: str | None) -> ZoneInfo:
+    if not nombre:
+        return ZONA_POR_DEFECTO
+    try:
+        return ZoneInfo(nombre)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail="Zona horaria inválida")
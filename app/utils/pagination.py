@@ -0,0 +1,72 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Sequence
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_YIELD_PER = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps(jsonable_encoder(list(values)), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _cursor_value(key, value: Any) -> Any:
+    # Cada valor debe ser del tipo de su columna: un cursor manipulado se
+    # rechaza con 400 en lugar de llegar al driver
+    tipo = key.type.python_type
+    if tipo is datetime:
+        return datetime.fromisoformat(value)
+    if value is None or isinstance(value, bool) or not isinstance(value, tipo):
+        raise ValueError(value)
+    return value
+
+
+def decode_cursor(cursor: str, keys: Sequence) -> list:
+    # Los cursores son opacos para el cliente: base64 de los valores de la clave
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError(cursor)
+        return [_cursor_value(k, v) for k, v in zip(keys, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def apply_keyset(stmt, keys: Sequence, cursor: str | None, descending: bool = False):
+    """Ordena por ``keys`` y deja solo las filas posteriores al cursor."""
+    stmt = stmt.order_by(*[k.desc() if descending else k.asc() for k in keys])
+    if cursor:
+        row = tuple_(*keys)
+        values = tuple_(*decode_cursor(cursor, keys))
+        stmt = stmt.where(row < values if descending else row > values)
+    return stmt
+
+
+def split_page(rows: Sequence, limit: int, key: Callable[[Any], tuple]):
+    """Corta ``limit + 1`` filas en la página y el cursor siguiente (o None)."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(*key(rows[-1]))
+    return rows, None
+
+
+async def stream_ndjson(stmt, serialize: Callable[[Any], str]) -> AsyncIterator[str]:
+    # Sesión propia: la de get_db se cierra antes de que termine el streaming
+    from app.core.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(
+            stmt.execution_options(yield_per=STREAM_YIELD_PER)
+        )
+        async for row in result:
+            yield serialize(row) + "\n"
@@ -0,0 +1,78 @@
+"""Cálculo de horarios libres por barrido de intervalos.
+
+Las franjas de disponibilidad y los intervalos ocupados se ordenan una sola
+vez y se recorren en paralelo, así el coste es O(franjas + ocupados + slots)
+en lugar de comparar cada slot contra cada cita.
+"""
+
+from datetime import date, datetime, time, timedelta, tzinfo
+from typing import Iterable, Iterator
+
+Interval = tuple[datetime, datetime]
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> list[Interval]:
+    """Ordena y une los intervalos que se solapan o se tocan."""
+    merged: list[Interval] = []
+    for inicio, fin in sorted(intervals):
+        if merged and inicio <= merged[-1][1]:
+            if fin > merged[-1][1]:
+                merged[-1] = (merged[-1][0], fin)
+        else:
+            merged.append((inicio, fin))
+    return merged
+
+
+def expand_bands(
+    bands: Iterable[tuple[int, time, time]], desde: date, hasta: date, tz: tzinfo
+) -> list[Interval]:
+    """Convierte franjas semanales (weekday, hora_inicio, hora_fin) en
+    intervalos concretos para cada día de ``desde`` a ``hasta`` (inclusive)."""
+    por_dia: dict[int, list[tuple[time, time]]] = {}
+    for weekday, hora_inicio, hora_fin in bands:
+        if hora_inicio < hora_fin:
+            por_dia.setdefault(weekday, []).append((hora_inicio, hora_fin))
+    intervals: list[Interval] = []
+    dia = desde
+    while dia <= hasta:
+        for hora_inicio, hora_fin in por_dia.get(dia.weekday(), ()):
+            intervals.append(
+                (
+                    datetime.combine(dia, hora_inicio, tzinfo=tz),
+                    datetime.combine(dia, hora_fin, tzinfo=tz),
+                )
+            )
+        dia += timedelta(days=1)
+    return intervals
+
+
+def iter_free_slots(
+    bands: Iterable[Interval],
+    busy: Iterable[Interval],
+    duracion: timedelta,
+    paso: timedelta | None = None,
+    buffer: timedelta = timedelta(0),
+) -> Iterator[Interval]:
+    """Genera en orden los slots de ``duracion`` que caben en las franjas sin
+    tocar ningún intervalo ocupado (ampliado en ``buffer`` a cada lado).
+
+    Los slots arrancan en el inicio de cada franja y avanzan de ``paso`` en
+    ``paso`` (por defecto, la propia duración).
+    """
+    paso = paso or duracion
+    bands = merge_intervals(bands)
+    busy = merge_intervals((inicio - buffer, fin + buffer) for inicio, fin in busy)
+    j = 0
+    for band_inicio, band_fin in bands:
+        inicio = band_inicio
+        while inicio + duracion <= band_fin:
+            # Los ocupados que terminan antes del slot ya no afectan a ninguno posterior
+            while j < len(busy) and busy[j][1] <= inicio:
+                j += 1
+            if j < len(busy) and busy[j][0] < inicio + duracion:
+                # Salta al primer paso de la franja posterior al bloque ocupado
+                pasos = -(-(busy[j][1] - band_inicio) // paso)
+                inicio = band_inicio + pasos * paso
+                continue
+            yield inicio, inicio + duracion
+            inicio += paso
@@ -0,0 +1,25 @@
+import asyncio
+import os
+import sys
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.core.database import AsyncSessionLocal
+from app.services.alertas import AlertasService
+
+
+async def backfill_alert_rollups():
+    # Rehace "AlertasResumenDiario" desde "Alertas" con la zona horaria de
+    # TIMEZONE; seguro de ejecutar con la API en marcha
+    async with AsyncSessionLocal() as db:
+        filas = await AlertasService.reconstruir_resumen(db)
+    print(f"Resumen diario reconstruido: {filas} filas")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_alert_rollups())
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.database import engine
+from app.models.citas import Cita
+from app.models.users import User
+from app.services.citas import CitasService
+
+# Citas por corrida; todo se crea dentro de una transacción que se descarta
+TAMANOS = [int(n) for n in os.getenv("CITAS", "10,100,1000").split(",")]
+INICIO = datetime(2030, 1, 6, 8, tzinfo=timezone.utc)
+
+
+class ContadorSQL:
+    # Listener before_cursor_execute: una llamada por sentencia enviada
+    def __init__(self) -> None:
+        self.n = 0
+
+    def __call__(self, *args) -> None:
+        self.n += 1
+
+
+async def sembrar(db: AsyncSession, n: int) -> tuple[int, int]:
+    # Un psicólogo y n estudiantes distintos, así cada cita aporta nombres nuevos
+    marca = uuid.uuid4().hex[:8]
+    result = await db.execute(
+        insert(User)
+        .values(
+            [
+                {
+                    "nombre": "Bench",
+                    "apellido": str(i),
+                    "email": f"bench-{marca}-{i}@example.com",
+                    "contrasena": "x",
+                }
+                for i in range(n + 1)
+            ]
+        )
+        .returning(User.id_usuario)
+    )
+    psicologo, *estudiantes = result.scalars().all()
+    await db.execute(
+        insert(Cita).values(
+            [
+                {
+                    "id_estudiante": id_estudiante,
+                    "id_psicologo": psicologo,
+                    "fecha_hora_inicio": INICIO + timedelta(hours=i),
+                    "fecha_hora_fin": INICIO + timedelta(hours=i, minutes=50),
+                    "modalidad": "presencial",
+                }
+                for i, id_estudiante in enumerate(estudiantes)
+            ]
+        )
+    )
+    return psicologo, estudiantes[0]
+
+
+async def medir(n: int) -> dict[str, int]:
+    contador = ContadorSQL()
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        db = AsyncSession(bind=conn, expire_on_commit=False)
+        try:
+            psicologo, estudiante = await sembrar(db, n)
+            citas = (
+                await db.execute(select(Cita).where(Cita.id_psicologo == psicologo))
+            ).scalars().all()
+            desde = INICIO.date().isoformat()
+            hasta = (INICIO + timedelta(hours=n + 24)).date().isoformat()
+            rutas = {
+                "get_all": lambda: CitasService.get_all(db),
+                "get_page": lambda: CitasService.get_page(db, n),
+                "get_by_id": lambda: CitasService.get_by_id(db, citas[-1].id_cita),
+                "get_by_psicologo": lambda: CitasService.get_by_psicologo(db, psicologo),
+                "get_by_estudiante": lambda: CitasService.get_by_estudiante(
+                    db, estudiante
+                ),
+                "get_by_user_and_range": lambda: CitasService.get_by_user_and_range(
+                    db, psicologo, desde, hasta
+                ),
+                "enrich_many": lambda: CitasService.enrich_many(db, citas),
+            }
+            sentencias = {}
+            event.listen(engine.sync_engine, "before_cursor_execute", contador)
+            try:
+                for nombre, ruta in rutas.items():
+                    contador.n = 0
+                    await ruta()
+                    sentencias[nombre] = contador.n
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", contador)
+        finally:
+            await db.close()
+            await trans.rollback()
+    return sentencias
+
+
+async def main():
+    # El engine de la app registra cada sentencia; aquí solo interesa contarlas
+    engine.sync_engine.echo = False
+    resultados = {n: await medir(n) for n in TAMANOS}
+    print("Sentencias SQL por ruta de lectura de CitasService")
+    print(f"{'ruta':<24}" + "".join(f"{f'N={n}':>10}" for n in TAMANOS))
+    for ruta in resultados[TAMANOS[0]]:
+        print(f"{ruta:<24}" + "".join(f"{resultados[n][ruta]:>10}" for n in TAMANOS))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from datetime import time as hora
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import Date, cast, event, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.database import engine
+from app.models.citas import Cita
+from app.models.disponibilidad import DisponibilidadPsicologo
+from app.models.users import User
+from app.services.disponibilidad import DisponibilidadService, SlotStore
+from app.utils.date_utils import ZONA_POR_DEFECTO
+
+RANGOS = {"1 semana": 7, "1 mes": 30, "1 año": 365}
+REPETICIONES = int(os.getenv("REPETICIONES", "5"))
+
+
+class ContadorSQL:
+    # Listener before_cursor_execute: una llamada por sentencia enviada
+    def __init__(self) -> None:
+        self.n = 0
+
+    def __call__(self, *args) -> None:
+        self.n += 1
+
+
+async def por_dia(db: AsyncSession, id_psicologo: int, start: date, end: date):
+    # Comportamiento anterior: un count(*) por cada día laborable del rango
+    weekdays = await DisponibilidadService.get_weekdays(db, id_psicologo)
+    libres = []
+    current = start
+    while current <= end:
+        if current.weekday() in weekdays:
+            total = await db.scalar(
+                select(func.count())
+                .select_from(Cita)
+                .where(
+                    Cita.id_psicologo == id_psicologo,
+                    cast(Cita.fecha_hora_inicio, Date) == current,
+                )
+            )
+            if total == 0:
+                libres.append(current.isoformat())
+        current += timedelta(days=1)
+    libres.sort(reverse=True)
+    return libres
+
+
+async def sembrar(db: AsyncSession, desde: date) -> int:
+    # Lunes a viernes de 9 a 17 y una cita en días alternos durante un año
+    marca = uuid.uuid4().hex[:8]
+    result = await db.execute(
+        insert(User)
+        .values(
+            [
+                {
+                    "nombre": "Bench",
+                    "apellido": rol,
+                    "email": f"bench-{marca}-{rol}@example.com",
+                    "contrasena": "x",
+                }
+                for rol in ("psicologo", "estudiante")
+            ]
+        )
+        .returning(User.id_usuario)
+    )
+    psicologo, estudiante = result.scalars().all()
+    await db.execute(
+        insert(DisponibilidadPsicologo).values(
+            [
+                {
+                    "id_psicologo": psicologo,
+                    "dia_semana": weekday,
+                    "hora_inicio": hora(9),
+                    "hora_fin": hora(17),
+                }
+                for weekday in range(5)
+            ]
+        )
+    )
+    dias = [desde + timedelta(days=i) for i in range(max(RANGOS.values()))]
+    await db.execute(
+        insert(Cita).values(
+            [
+                {
+                    "id_estudiante": estudiante,
+                    "id_psicologo": psicologo,
+                    "fecha_hora_inicio": datetime.combine(
+                        dia, hora(10), tzinfo=ZONA_POR_DEFECTO
+                    ),
+                    "fecha_hora_fin": datetime.combine(
+                        dia, hora(10, 50), tzinfo=ZONA_POR_DEFECTO
+                    ),
+                    "modalidad": "presencial",
+                }
+                for i, dia in enumerate(dias)
+                if dia.weekday() < 5 and i % 2
+            ]
+        )
+    )
+    return psicologo
+
+
+async def medir(consulta, contador: ContadorSQL) -> tuple[float, int]:
+    tiempos = []
+    for _ in range(REPETICIONES):
+        contador.n = 0
+        inicio = time.perf_counter()
+        await consulta()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos) * 1000, contador.n
+
+
+async def main():
+    # El engine de la app registra cada sentencia; aquí solo interesa contarlas
+    engine.sync_engine.echo = False
+    contador = ContadorSQL()
+    desde = datetime.now(ZONA_POR_DEFECTO).date()
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        db = AsyncSession(bind=conn, expire_on_commit=False)
+        try:
+            psicologo = await sembrar(db, desde)
+            # Store propio para no depender del estado del singleton
+            store = SlotStore()
+            event.listen(engine.sync_engine, "before_cursor_execute", contador)
+            print(f"dias_libres, mediana de {REPETICIONES} corridas (ms / sentencias)")
+            print(f"{'rango':<10}{'por día':>20}{'agrupada':>20}{'store':>20}")
+            for nombre, dias in RANGOS.items():
+                hasta = desde + timedelta(days=dias - 1)
+                columnas = [
+                    await medir(lambda: por_dia(db, psicologo, desde, hasta), contador),
+                    await medir(
+                        lambda: DisponibilidadService.get_dias_libres(
+                            db, psicologo, desde, hasta, usar_store=False
+                        ),
+                        contador,
+                    ),
+                ]
+                # El store solo cubre su ventana (8 semanas): fuera de ella
+                # se usa la consulta agrupada
+                if store._en_ventana(desde, hasta):
+                    # Primera carga fuera de la medición
+                    await store.get_dias_libres(db, psicologo, desde, hasta)
+                    columnas.append(
+                        await medir(
+                            lambda: store.get_dias_libres(db, psicologo, desde, hasta),
+                            contador,
+                        )
+                    )
+                print(
+                    f"{nombre:<10}"
+                    + "".join(f"{f'{ms:.1f} / {n}':>20}" for ms, n in columnas)
+                    + ("" if len(columnas) == 3 else f"{'fuera de ventana':>20}")
+                )
+            event.remove(engine.sync_engine, "before_cursor_execute", contador)
+        finally:
+            await db.close()
+            await trans.rollback()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Add the project root to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.ws import ConnectionManager
+
+SOCKETS = int(os.getenv("SOCKETS", "1000"))
+EVENTS = 50
+
+
+def evento(i: int) -> dict:
+    return {
+        "type": "alerta_nueva",
+        "data": {
+            "id_alerta": i,
+            "id_estudiante": 7,
+            "texto": "Me siento muy mal y no sé con quién hablar. " * 10,
+            "severidad": "ALTA",
+            "fecha_creacion": "2026-10-17T10:00:00+00:00",
+            "estudiante_nombre": "Ana Pérez",
+            "estudiante_email": "ana@example.com",
+        },
+    }
+
+
+class FakeWebSocket:
+    def __init__(self, done: "Contador") -> None:
+        self.done = done
+
+    async def send_text(self, data: str):
+        self.done.tick()
+
+
+class Contador:
+    def __init__(self, objetivo: int) -> None:
+        self.objetivo = objetivo
+        self.n = 0
+        self.listo = asyncio.Event()
+
+    def tick(self):
+        self.n += 1
+        if self.n >= self.objetivo:
+            self.listo.set()
+
+
+class PorSocket(ConnectionManager):
+    # Comportamiento anterior: json.dumps por cada socket (como ws.send_json)
+    def send_many(self, messages):
+        for user_id, message in messages:
+            for conn in list(self.active_connections.get(user_id, {}).values()):
+                self._enqueue(conn, message, json.dumps(message, separators=(",", ":")))
+
+
+async def medir(manager: ConnectionManager) -> float:
+    contador = Contador(SOCKETS * EVENTS)
+    await manager.start()
+    sockets = [FakeWebSocket(contador) for _ in range(SOCKETS)]
+    for uid, ws in enumerate(sockets):
+        await manager.connect(uid, ws)
+    start = time.process_time()
+    for i in range(EVENTS):
+        message = evento(i)
+        manager.send_many((uid, message) for uid in range(SOCKETS))
+        await asyncio.sleep(0)
+    await contador.listo.wait()
+    elapsed = time.process_time() - start
+    await manager.stop()
+    return elapsed
+
+
+async def memoria() -> tuple[int, int]:
+    # Memoria que el manager retiene por conexión (registro, cola, escritor,
+    # Event, búfer de reposición del usuario) medida con tracemalloc, frente
+    # a la estimación de stats()
+    manager = ConnectionManager()
+    await manager.start()
+    sockets = [FakeWebSocket(Contador(1)) for _ in range(SOCKETS)]
+    await asyncio.sleep(0)
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    for uid, ws in enumerate(sockets):
+        await manager.connect(uid, ws)
+    # Deja que cada escritor arranque y quede esperando eventos
+    await asyncio.sleep(0)
+    medido = (tracemalloc.get_traced_memory()[0] - antes) // SOCKETS
+    tracemalloc.stop()
+    stats = manager.stats()
+    estimado = stats["bytes_per_connection"] + stats["replay_bytes"] // SOCKETS
+    await manager.stop()
+    return medido, estimado
+
+
+async def main():
+    antes = await medir(PorSocket(queue_size=EVENTS + 1))
+    despues = await medir(ConnectionManager(queue_size=EVENTS + 1))
+    print(f"{EVENTS} eventos x {SOCKETS} sockets ({SOCKETS * EVENTS} envíos)")
+    print(f"json.dumps por socket: {antes * 1000:8.1f} ms CPU")
+    print(f"serializado una vez:   {despues * 1000:8.1f} ms CPU")
+    print(f"ahorro:                {(1 - despues / antes) * 100:8.1f} %")
+    medido, estimado = await memoria()
+    print(f"memoria por conexión:  {medido:8d} B medidos (tracemalloc)")
+    print(f"                       {estimado:8d} B según stats()")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -9,7 +9,6 @@ import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 
 from app.controllers.auth import router as auth
 from app.controllers.disponibilidad import router as disponibilidad
@@ -20,7 +19,11 @@ from app.controllers.notifications import router as notifications_router
 from app.controllers.observaciones import router as observaciones_router
 from app.controllers.alertas import router as alertas_router
 from app.controllers.ws_notifications import router as ws_notifications_router
+from app.core.outbox import dispatcher
+from app.core.ws import manager
 from app.models.roles import Role
+from app.services.catalogos import role_catalog
+from app.utils.pagination import NEXT_CURSOR_HEADER
 from fastapi.responses import RedirectResponse
 
 
@@ -30,7 +33,12 @@ async def lifespan(_: FastAPI):
 
     async with AsyncSessionLocal() as session:
         await seed_roles(session)
+    # Entrega en segundo plano de los eventos de la Outbox
+    await manager.start()
+    dispatcher.start()
     yield
+    await dispatcher.stop()
+    await manager.stop()
 
 
 app = FastAPI(title="AASMC API", lifespan=lifespan)
@@ -64,6 +72,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
@@ -92,12 +101,16 @@ async def health_check():
 
 async def seed_roles(db: AsyncSession):
     roles = ["ADMINISTRADOR", "PSICOLOGO", "ESTUDIANTE"]
-    for nombre in roles:
-        result = await db.execute(select(Role).where(Role.nombre_rol == nombre))
-        rol = result.scalars().first()
-        if not rol:
-            db.add(Role(nombre_rol=nombre))
-    await db.commit()
+    # Carga el catálogo de roles en memoria y crea solo los que falten
+    await role_catalog.load(db)
+    faltantes = [
+        nombre for nombre in roles if await role_catalog.id_de(db, nombre) is None
+    ]
+    if faltantes:
+        db.add_all([Role(nombre_rol=nombre) for nombre in faltantes])
+        await db.commit()
+        role_catalog.invalidate()
+        await role_catalog.load(db)
 
 
 if __name__ == "__main__":
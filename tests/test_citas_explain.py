@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.services.citas import CitasService
+
+
+def _plan(stmt) -> list[str] | None:
+    # Lazy import: app.core.database solo hace falta si hay base de datos
+    from app.core.database import db_url
+
+    sql = str(
+        stmt.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+    )
+
+    async def run():
+        engine = create_async_engine(
+            db_url, poolclass=NullPool, connect_args={"timeout": 5}
+        )
+        try:
+            try:
+                conn = await engine.connect()
+            except Exception:  # noqa: BLE001 - sin base de datos se omite
+                return None
+            async with conn:
+                # Con tablas pequeñas el planificador prefiere un seq scan
+                # aunque haya índice; así solo lo elige si no tiene otro camino
+                await conn.exec_driver_sql("SET enable_seqscan = off")
+                result = await conn.exec_driver_sql("EXPLAIN " + sql)
+                return [row[0] for row in result.all()]
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_rango_por_usuario_usa_indices():
+    plan = _plan(
+        CitasService.range_stmt(
+            7,
+            datetime(2026, 1, 1, tzinfo=timezone.utc),
+            datetime(2026, 2, 1, tzinfo=timezone.utc),
+        )
+    )
+    if plan is None:
+        pytest.skip("DATABASE_URL no accesible")
+    assert not any('Seq Scan on "Citas"' in linea for linea in plan), "\n".join(plan)
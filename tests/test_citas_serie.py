@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pydantic import ValidationError
+
+from app.schemas.citas import MAX_OCURRENCIAS_SERIE, CitaSerieCreate
+
+INICIO = datetime(2026, 1, 5, 10, tzinfo=timezone.utc)
+
+
+def serie(**regla) -> CitaSerieCreate:
+    return CitaSerieCreate(
+        id_estudiante=1,
+        id_psicologo=2,
+        fecha_hora_inicio=INICIO,
+        fecha_hora_fin=INICIO + timedelta(hours=1),
+        modalidad="presencial",
+        **regla,
+    )
+
+
+def test_hasta_en_el_limite_expande_todas():
+    hasta = INICIO + timedelta(weeks=MAX_OCURRENCIAS_SERIE - 1)
+    assert len(serie(hasta=hasta).expandir()) == MAX_OCURRENCIAS_SERIE
+
+
+def test_hasta_sobre_el_limite_se_rechaza():
+    with pytest.raises(ValidationError):
+        serie(hasta=INICIO + timedelta(weeks=MAX_OCURRENCIAS_SERIE))
+
+
+def test_ocurrencias_acotan_un_hasta_lejano():
+    ocurrencias = serie(ocurrencias=3, hasta=INICIO + timedelta(days=3650)).expandir()
+    assert [inicio for inicio, _ in ocurrencias] == [
+        INICIO + timedelta(weeks=i) for i in range(3)
+    ]
+
+
+def test_hasta_anterior_al_inicio_se_rechaza():
+    with pytest.raises(ValidationError):
+        serie(hasta=INICIO - timedelta(days=1))
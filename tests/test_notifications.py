@@ -0,0 +1,52 @@
+import asyncio
+
+from app.controllers import notifications
+
+
+class Resultado:
+    def __init__(self, rows) -> None:
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class Sesion:
+    # DELETE ... RETURNING con las filas dadas
+    def __init__(self, rows) -> None:
+        self.rows = rows
+        self.commits = 0
+
+    async def execute(self, stmt):
+        return Resultado(self.rows)
+
+    async def commit(self) -> None:
+        self.commits += 1
+
+
+def borrar_todas(monkeypatch, user_id, rows):
+    encolados = []
+
+    async def encolar(db, mensajes):
+        encolados.extend(mensajes)
+
+    monkeypatch.setattr(notifications, "encolar", encolar)
+    db = Sesion(rows)
+    asyncio.run(notifications.delete_all_notifications(user_id, db))
+    assert db.commits == 1
+    return encolados
+
+
+def test_borrar_todas_sin_notificaciones_avisa_al_usuario(monkeypatch):
+    assert borrar_todas(monkeypatch, 7, []) == [
+        (7, {"type": "notifications_cleared", "ids": []})
+    ]
+
+
+def test_borrar_todas_avisa_a_la_otra_parte(monkeypatch):
+    # (id_notificacion, id_estudiante, id_psicologo, leida)
+    encolados = borrar_todas(monkeypatch, 7, [(1, 7, 9, True), (2, 7, None, True)])
+    assert sorted(encolados, key=lambda m: m[0]) == [
+        (7, {"type": "notifications_cleared", "ids": [1, 2]}),
+        (9, {"type": "notifications_deleted", "ids": [1]}),
+    ]
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+import app.core.outbox as outbox
+from app.core.pubsub import PostgresBackend, PublicacionParcialError
+from app.core.ws import ConnectionManager
+from tests.test_pubsub import ConexionInestable
+
+
+class Resultado:
+    def __init__(self, filas) -> None:
+        self.filas = filas
+
+    def all(self):
+        return self.filas
+
+    def scalars(self):
+        return self
+
+
+class Transaccion:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class Conexion:
+    # Respuestas en orden: filas pendientes, seqs asignados y luego updates
+    def __init__(self, filas, seqs) -> None:
+        self.respuestas = [filas, seqs]
+        self.sentencias = []
+
+    def begin(self):
+        return Transaccion()
+
+    async def execute(self, stmt):
+        self.sentencias.append(stmt)
+        return Resultado(self.respuestas.pop(0) if self.respuestas else [])
+
+
+def test_fallo_en_el_segundo_payload_solo_devuelve_los_no_publicados(monkeypatch):
+    backend = PostgresBackend("postgresql://localhost/db")
+    backend._conn = ConexionInestable(falla=2)
+    monkeypatch.setattr(outbox, "manager", ConnectionManager(backend=backend))
+    # Cada payload cabe justo en un NOTIFY: tres eventos, tres payloads
+    grande = "a" * 7000
+    filas = [
+        (id_evento, 1, None, {"type": "x", "relleno": grande})
+        for id_evento in (1, 2, 3)
+    ]
+    conn = Conexion(filas, [10, 11, 12])
+
+    with pytest.raises(PublicacionParcialError):
+        asyncio.run(outbox.OutboxDispatcher()._despachar(conn))
+
+    # El primero salió con seq 10 y lo conserva; los otros vuelven a pendientes
+    reinicio = conn.sentencias[-1].compile(dialect=postgresql.dialect())
+    assert [v for v in reinicio.params.values() if isinstance(v, list)] == [[2, 3]]
+    assert len(conn.sentencias) == 4
+
+
+class Sesion:
+    # Outbox vacía; la secuencia ya entregó hasta ``ultimo``
+    def __init__(self, ultimo: int) -> None:
+        self.ultimo = ultimo
+
+    async def scalar(self, stmt):
+        return None
+
+    async def execute(self, stmt):
+        return ResultadoSecuencia((self.ultimo, True))
+
+
+class ResultadoSecuencia:
+    def __init__(self, fila) -> None:
+        self.fila = fila
+
+    def one(self):
+        return self.fila
+
+
+def test_outbox_vacia_sin_eventos_perdidos_no_pide_resync():
+    assert asyncio.run(outbox.eventos_desde(Sesion(ultimo=40), 1, [], 40)) == []
+    # Hubo eventos después de last_seq y la purga ya los borró
+    assert asyncio.run(outbox.eventos_desde(Sesion(ultimo=40), 1, [], 35)) is None
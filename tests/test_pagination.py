@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.alerta import Alerta
+from app.models.citas import Cita
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    fecha = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    cursor = encode_cursor(fecha, 5)
+    assert decode_cursor(cursor, [Alerta.fecha_creacion, Alerta.id_alerta]) == [fecha, 5]
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        encode_cursor("x"),
+        encode_cursor(None),
+        encode_cursor(True),
+        encode_cursor(1.5),
+        encode_cursor(1, 2),
+        "no-es-base64!",
+    ],
+)
+def test_cursor_invalido_es_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor, [Cita.id_cita])
+    assert exc.value.status_code == 400
+
+
+def test_cursor_fecha_invalida_es_400():
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(encode_cursor(None, 1), [Alerta.fecha_creacion, Alerta.id_alerta])
+    assert exc.value.status_code == 400
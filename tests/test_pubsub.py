@@ -0,0 +1,194 @@
+import asyncio
+import json
+import uuid
+
+import asyncpg
+import pytest
+
+import app.core.outbox as outbox
+from app.core.pubsub import (
+    NOTIFY_MAX_BYTES,
+    REF_KEY,
+    PostgresBackend,
+    PublicacionParcialError,
+    PubSubBackend,
+    _asyncpg_dsn,
+)
+
+
+def test_referencias_se_entregan_en_orden(monkeypatch):
+    async def cargar_eventos(seqs):
+        # Más lenta que el NOTIFY siguiente
+        await asyncio.sleep(0.05)
+        return [(1, {"type": "grande", "seq": seq}) for seq in seqs]
+
+    monkeypatch.setattr(outbox, "cargar_eventos", cargar_eventos)
+
+    async def escenario():
+        entregados = []
+        backend = PostgresBackend("postgresql://localhost/db")
+        backend._deliver = entregados.extend
+        backend._entrega = asyncio.create_task(backend._entregar())
+        backend._on_notify(None, 0, "ws_events", f'[[1,{{"{REF_KEY}":10}}]]')
+        backend._on_notify(None, 0, "ws_events", '[[1,{"type":"x","seq":11}]]')
+        await asyncio.sleep(0.1)
+        await backend.stop()
+        return [message["seq"] for _, message in entregados]
+
+    assert asyncio.run(escenario()) == [10, 11]
+
+
+def test_backend_sin_publish_no_se_instancia():
+    class Incompleto(PubSubBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incompleto()
+
+
+def _item(seq: int, relleno: int) -> tuple:
+    return (1, {"type": "x", "seq": seq, "relleno": "a" * relleno})
+
+
+def _relleno_maximo() -> int:
+    # Relleno con el que un solo evento ocupa el payload más grande admitido
+    base = len(json.dumps([1, _item(1, 0)[1]], separators=(",", ":")))
+    return NOTIFY_MAX_BYTES - 3 - base
+
+
+class ConexionInestable:
+    # Conexión asyncpg cuyo NOTIFY falla a partir del número ``falla``
+    def __init__(self, falla: int) -> None:
+        self.falla = falla
+        self.payloads: list[str] = []
+
+    def is_closed(self) -> bool:
+        return False
+
+    async def execute(self, sql, canal, payload):
+        if len(self.payloads) + 1 >= self.falla:
+            raise ConnectionError("NOTIFY falló")
+        self.payloads.append(payload)
+
+
+def test_fallo_en_el_segundo_payload_informa_lo_publicado():
+    backend = PostgresBackend("postgresql://localhost/db")
+    backend._conn = ConexionInestable(falla=2)
+    # Cada evento ocupa un payload propio
+    mensajes = [_item(seq, _relleno_maximo()) for seq in range(1, 4)]
+
+    with pytest.raises(PublicacionParcialError) as exc:
+        asyncio.run(backend.publish(mensajes))
+    assert exc.value.publicados == 1
+    assert len(backend._conn.payloads) == 1
+
+
+# Integración: dos backends (dos procesos) sobre la base de DATABASE_URL, en
+# un canal propio de cada prueba; sin base de datos se omiten
+
+
+async def _esperar(recibidos: list, n: int, timeout: float = 5.0) -> None:
+    async def llenar():
+        while len(recibidos) < n:
+            await asyncio.sleep(0.02)
+
+    await asyncio.wait_for(llenar(), timeout)
+
+
+def _con_postgres(escenario):
+    from app.core.database import db_url
+
+    dsn = _asyncpg_dsn(db_url)
+
+    async def run():
+        try:
+            conn = await asyncpg.connect(dsn, timeout=5)
+        except Exception:  # noqa: BLE001 - sin base de datos se omite
+            return False
+        await conn.close()
+        canal = f"ws_test_{uuid.uuid4().hex[:8]}"
+        emisor, receptor = PostgresBackend(dsn, canal), PostgresBackend(dsn, canal)
+        recibidos: list = []
+        await emisor.start(lambda items: None)
+        await receptor.start(recibidos.extend)
+        try:
+            await escenario(emisor, receptor, recibidos)
+        finally:
+            await emisor.stop()
+            await receptor.stop()
+        return True
+
+    if not asyncio.run(run()):
+        pytest.skip("DATABASE_URL no accesible")
+
+
+def test_lote_en_varios_payloads_llega_en_orden():
+    relleno = _relleno_maximo()
+    # Cabe justo en un payload; lo siguiente obliga a partir
+    mensajes = [_item(1, relleno)] + [_item(seq, 500) for seq in range(2, 60)]
+
+    async def escenario(emisor, receptor, recibidos):
+        payloads = [payload for payload, _ in emisor._chunks(mensajes)]
+        assert len(payloads) > 2
+        assert len(payloads[0].encode()) == NOTIFY_MAX_BYTES - 1
+        assert all(len(p.encode()) < NOTIFY_MAX_BYTES for p in payloads)
+        await emisor.publish(mensajes)
+        await _esperar(recibidos, len(mensajes))
+        assert [tuple(item) for item in recibidos] == mensajes
+
+    _con_postgres(escenario)
+
+
+def test_evento_grande_viaja_como_referencia_a_la_outbox():
+    from sqlalchemy import delete, insert
+
+    from app.core.database import AsyncSessionLocal, engine
+    from app.models.outbox import OUTBOX_SEQ, EventoOutbox
+
+    async def escenario(emisor, receptor, recibidos):
+        try:
+            async with AsyncSessionLocal() as db:
+                seq = await db.scalar(OUTBOX_SEQ.next_value())
+                grande = {"type": "x", "relleno": "a" * (_relleno_maximo() + 1)}
+                await db.execute(
+                    insert(EventoOutbox).values(
+                        id_usuario=1, payload=grande, seq=seq, fecha_entrega=None
+                    )
+                )
+                await db.commit()
+        except Exception:  # noqa: BLE001 - base sin migrar
+            await engine.dispose()
+            pytest.skip("Tabla Outbox no disponible")
+        try:
+            mensajes = [(1, {**grande, "seq": seq}), (1, {"type": "y", "seq": seq + 1})]
+            payload, _ = next(emisor._chunks(mensajes))
+            assert REF_KEY in json.loads(payload)[0][1]
+            await emisor.publish(mensajes)
+            await _esperar(recibidos, 2)
+            assert [tuple(item) for item in recibidos] == mensajes
+        finally:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(EventoOutbox).where(EventoOutbox.seq == seq))
+                await db.commit()
+            await engine.dispose()
+
+    _con_postgres(escenario)
+
+
+def test_receptor_reconecta_si_se_cae_su_conexion():
+    async def escenario(emisor, receptor, recibidos):
+        anterior = receptor._conn
+        await emisor._conn.execute(
+            "SELECT pg_terminate_backend($1)", anterior.get_server_pid()
+        )
+
+        async def reconectado():
+            while receptor._conn is anterior or receptor._conn.is_closed():
+                await asyncio.sleep(0.05)
+
+        await asyncio.wait_for(reconectado(), 10)
+        await emisor.publish([(1, {"type": "x", "seq": 1})])
+        await _esperar(recibidos, 1)
+        assert [tuple(item) for item in recibidos] == [(1, {"type": "x", "seq": 1})]
+
+    _con_postgres(escenario)
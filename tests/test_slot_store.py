@@ -0,0 +1,129 @@
+import asyncio
+from datetime import datetime, time, timedelta, timezone
+
+from app.core.pubsub import PubSubBackend
+from app.core.ws import ConnectionManager
+from app.services.disponibilidad import DisponibilidadService, SlotStore
+from app.utils.slots import expand_bands, iter_free_slots
+
+PSICOLOGO = 1
+HORA = timedelta(hours=1)
+
+
+class Agenda:
+    # Estado "de la base": las consultas del store leen de aquí
+    def __init__(self) -> None:
+        self.bands = {(0, time(9), time(13)), (2, time(14), time(18))}
+        self.busy: list[tuple[datetime, datetime]] = []
+
+    async def get_bands(self, db, id_psicologo, weekdays=None):
+        return [b for b in self.bands if weekdays is None or b[0] in weekdays]
+
+    async def get_busy(self, db, id_psicologo, desde, hasta):
+        return [(i, f) for i, f in self.busy if i < hasta and f > desde]
+
+
+def test_cambios_incrementales_igualan_el_recalculo(monkeypatch):
+    agenda = Agenda()
+    monkeypatch.setattr(DisponibilidadService, "get_bands", agenda.get_bands)
+    monkeypatch.setattr(DisponibilidadService, "get_busy", agenda.get_busy)
+    store = SlotStore(semanas=2, ttl=3600, duracion=HORA, tz=timezone.utc)
+    desde, hasta = store._ventana()
+
+    def lunes(semana: int, hora: int, minuto: int = 0) -> datetime:
+        dia = desde + timedelta(days=(-desde.weekday()) % 7 + 7 * semana)
+        return datetime.combine(dia, time(hora, minuto), tzinfo=timezone.utc)
+
+    def recalculo():
+        return list(
+            iter_free_slots(
+                expand_bands(agenda.bands, desde, hasta, timezone.utc),
+                agenda.busy,
+                HORA,
+            )
+        )
+
+    async def run():
+        # Primera consulta: carga completa
+        assert await store.get_slots(None, PSICOLOGO, desde, hasta) == recalculo()
+
+        citas = [
+            (lunes(0, 9, 30), lunes(0, 10, 30)),
+            (lunes(1, 12), lunes(1, 13)),
+            # Cruza la medianoche: afecta a dos días
+            (lunes(0, 23), lunes(0, 23) + 12 * HORA),
+        ]
+        for inicio, fin in citas:
+            agenda.busy.append((inicio, fin))
+            store.cita_agregada(PSICOLOGO, inicio, fin)
+            assert await store.get_slots(None, PSICOLOGO, desde, hasta) == recalculo()
+
+        agenda.busy.remove(citas[0])
+        store.cita_eliminada(PSICOLOGO, *citas[0])
+        assert await store.get_slots(None, PSICOLOGO, desde, hasta) == recalculo()
+
+        agenda.bands = {(0, time(8), time(10)), (1, time(9), time(12))}
+        store.franjas_reemplazadas(PSICOLOGO, set(agenda.bands))
+        assert await store.get_slots(None, PSICOLOGO, desde, hasta) == recalculo()
+
+    asyncio.run(run())
+
+
+class Bus:
+    # Canal compartido entre procesos simulados (como LISTEN/NOTIFY): cada
+    # publicación llega a todos los backends, también al que la envió
+    def __init__(self) -> None:
+        self.entregas = []
+
+
+class BusBackend(PubSubBackend):
+    def __init__(self, bus: Bus) -> None:
+        self.bus = bus
+
+    async def start(self, deliver) -> None:
+        self.bus.entregas.append(deliver)
+
+    async def publish(self, messages) -> None:
+        for deliver in self.bus.entregas:
+            deliver(list(messages))
+
+
+def test_cambio_en_otro_proceso_descarta_la_agenda(monkeypatch):
+    agenda = Agenda()
+    monkeypatch.setattr(DisponibilidadService, "get_bands", agenda.get_bands)
+    monkeypatch.setattr(DisponibilidadService, "get_busy", agenda.get_busy)
+    bus = Bus()
+    # Dos workers: cada uno con su manager y su store
+    workers = [ConnectionManager(backend=BusBackend(bus)) for _ in range(2)]
+    store_a, store_b = (
+        SlotStore(semanas=2, ttl=3600, duracion=HORA, tz=timezone.utc, manager=m)
+        for m in workers
+    )
+    desde, hasta = store_a._ventana()
+    dia = desde + timedelta(days=(-desde.weekday()) % 7)
+    cita = (
+        datetime.combine(dia, time(9), tzinfo=timezone.utc),
+        datetime.combine(dia, time(10), tzinfo=timezone.utc),
+    )
+
+    async def run():
+        for m in workers:
+            await m.start()
+        try:
+            for store in (store_a, store_b):
+                assert cita[0] in [
+                    inicio for inicio, _ in await store.get_slots(None, PSICOLOGO, desde, hasta)
+                ]
+            # Solo el worker A atiende la reserva
+            agenda.busy.append(cita)
+            store_a.cita_agregada(PSICOLOGO, *cita)
+            await store_a.publicar(PSICOLOGO)
+            for store in (store_a, store_b):
+                assert cita[0] not in [
+                    inicio for inicio, _ in await store.get_slots(None, PSICOLOGO, desde, hasta)
+                ]
+        finally:
+            for m in workers:
+                await m.stop()
+
+    asyncio.run(run())
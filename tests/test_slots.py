@@ -0,0 +1,98 @@
+import random
+from datetime import date, datetime, time, timedelta, timezone
+
+from app.utils.slots import expand_bands, iter_free_slots, merge_intervals
+
+LUNES = date(2026, 1, 5)
+HORA = timedelta(hours=1)
+
+
+def at(hora: int, minuto: int = 0, dia: date = LUNES) -> datetime:
+    return datetime.combine(dia, time(hora, minuto), tzinfo=timezone.utc)
+
+
+def inicios(slots) -> list[datetime]:
+    return [inicio for inicio, _ in slots]
+
+
+def slots_ingenuos(bands, busy, duracion, paso=None, buffer=timedelta(0)):
+    # Referencia: prueba cada paso de cada franja contra cada ocupado
+    paso = paso or duracion
+    busy = [(inicio - buffer, fin + buffer) for inicio, fin in busy]
+    for band_inicio, band_fin in merge_intervals(bands):
+        inicio = band_inicio
+        while inicio + duracion <= band_fin:
+            if not any(b0 < inicio + duracion and b1 > inicio for b0, b1 in busy):
+                yield inicio, inicio + duracion
+            inicio += paso
+
+
+def test_merge_une_solapados_y_contiguos():
+    assert merge_intervals([(at(10), at(11)), (at(9), at(10)), (at(12), at(13))]) == [
+        (at(9), at(11)),
+        (at(12), at(13)),
+    ]
+
+
+def test_ocupado_entre_dos_franjas():
+    bands = [(at(9), at(12)), (at(13), at(17))]
+    slots = iter_free_slots(bands, [(at(11, 30), at(13, 30))], HORA)
+    assert inicios(slots) == [at(9), at(10), at(14), at(15), at(16)]
+
+
+def test_paso_menor_que_duracion():
+    slots = iter_free_slots(
+        [(at(9), at(12))], [(at(10), at(10, 30))], HORA, paso=timedelta(minutes=30)
+    )
+    assert inicios(slots) == [at(9), at(10, 30), at(11)]
+
+
+def test_buffer_que_toca_el_borde_de_la_franja():
+    busy = [(at(8), at(8, 45)), (at(12), at(13))]
+    slots = iter_free_slots(
+        [(at(9), at(12))], busy, HORA, buffer=timedelta(minutes=15)
+    )
+    # El primero toca el inicio de la franja sin solaparla; el segundo
+    # se come la última hora
+    assert inicios(slots) == [at(9), at(10)]
+
+
+def test_rango_de_varios_dias():
+    miercoles = LUNES + timedelta(days=2)
+    bands = expand_bands(
+        [(0, time(9), time(11)), (2, time(9), time(11))],
+        LUNES,
+        miercoles,
+        timezone.utc,
+    )
+    assert bands == [(at(9), at(11)), (at(9, dia=miercoles), at(11, dia=miercoles))]
+    # Un ocupado que cruza la noche afecta a las dos franjas
+    slots = iter_free_slots(bands, [(at(10, 30), at(9, 30, miercoles))], HORA)
+    assert inicios(slots) == [at(9), at(10, dia=miercoles)]
+
+
+def test_franjas_solapadas_no_duplican_slots():
+    bands = expand_bands(
+        [(0, time(9), time(11)), (0, time(10), time(12))], LUNES, LUNES, timezone.utc
+    )
+    assert inicios(iter_free_slots(bands, [], HORA)) == [at(9), at(10), at(11)]
+
+
+def test_coincide_con_la_referencia():
+    rnd = random.Random(7)
+    cuarto = timedelta(minutes=15)
+    for _ in range(200):
+        bands = []
+        for _ in range(rnd.randint(1, 4)):
+            inicio = at(6) + rnd.randint(0, 48) * cuarto
+            bands.append((inicio, inicio + rnd.randint(1, 24) * cuarto))
+        busy = []
+        for _ in range(rnd.randint(0, 6)):
+            inicio = at(6) + rnd.randint(0, 60) * cuarto
+            busy.append((inicio, inicio + rnd.randint(1, 8) * cuarto))
+        duracion = rnd.choice([30, 45, 60]) * timedelta(minutes=1)
+        paso = rnd.choice([None, cuarto, 2 * cuarto])
+        buffer = rnd.choice([timedelta(0), cuarto])
+        assert list(iter_free_slots(bands, busy, duracion, paso, buffer)) == list(
+            slots_ingenuos(bands, busy, duracion, paso, buffer)
+        )
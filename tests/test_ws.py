@@ -0,0 +1,298 @@
+import asyncio
+import json
+import sys
+from collections import deque
+
+from fastapi import WebSocketDisconnect
+
+from app.core.pubsub import InMemoryBackend
+from app.core.ws import (
+    IDLE_CLOSE_CODE,
+    SEND_ERROR_CLOSE_CODE,
+    SLOW_CONSUMER_CLOSE_CODE,
+    ConnectionManager,
+    _batch_frame,
+    _coalesce,
+    encode,
+)
+from tests.test_slot_store import Bus, BusBackend
+
+
+class FakeWebSocket:
+    def __init__(
+        self, send_delay: float = 0.0, fail: bool = False, dead: bool = False
+    ) -> None:
+        self.send_delay = send_delay
+        self.fail = fail
+        # Socket que uvicorn ya dio por muerto (ping de protocolo sin respuesta)
+        self.dead = dead
+        self.sent: list[str] = []
+        self.closed: list[int] = []
+
+    async def send_text(self, data: str) -> None:
+        if self.dead:
+            raise WebSocketDisconnect(code=1006)
+        if self.fail:
+            raise RuntimeError("socket roto")
+        await asyncio.sleep(self.send_delay)
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed.append(code)
+
+
+def manager(**kwargs) -> ConnectionManager:
+    return ConnectionManager(backend=InMemoryBackend(), **kwargs)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_envio_lento_cierra_el_socket():
+    async def escenario():
+        m = manager(send_timeout=0.05)
+        ws = FakeWebSocket(send_delay=1)
+        await m.connect(1, ws)
+        m.send_to_user(1, {"type": "x"})
+        await asyncio.sleep(0.2)
+        assert ws.closed == [SLOW_CONSUMER_CLOSE_CODE]
+        assert 1 not in m.active_connections
+        await m.stop()
+
+    run(escenario())
+
+
+def test_error_de_envio_cierra_el_socket():
+    async def escenario():
+        m = manager()
+        ws = FakeWebSocket(fail=True)
+        await m.connect(1, ws)
+        m.send_to_user(1, {"type": "x"})
+        await asyncio.sleep(0.05)
+        assert ws.closed == [SEND_ERROR_CLOSE_CODE]
+        assert m.counters["send_errors"] == 1
+        await m.stop()
+
+    run(escenario())
+
+
+def test_sockets_muertos_por_el_ping_de_uvicorn_cuentan_como_reaped():
+    async def escenario():
+        m = manager()
+        en_espera, cerrado = FakeWebSocket(), FakeWebSocket()
+        escribiendo = FakeWebSocket(dead=True)
+        for user_id, ws in enumerate((en_espera, escribiendo, cerrado)):
+            await m.connect(user_id, ws)
+        # El bucle de recepción termina con el código de uvicorn
+        m.disconnect(0, en_espera, 1011)
+        # El escritor lo descubre al enviar
+        m.send_to_user(1, {"type": "x"})
+        await asyncio.sleep(0.05)
+        # Un cierre pedido por este proceso no se cuenta dos veces
+        m._close(m.active_connections[2][cerrado], SEND_ERROR_CLOSE_CODE)
+        m.disconnect(2, cerrado, 1011)
+        assert m.counters["reaped"] == 2
+        assert m.counters["send_errors"] == 0
+        await m.stop()
+
+    run(escenario())
+
+
+def test_latido_json_solo_con_heartbeat():
+    async def escenario():
+        m = manager(ping_interval=25, ping_timeout=10)
+        oyente, con_latido = FakeWebSocket(), FakeWebSocket()
+        await m.connect(1, oyente)
+        await m.connect(2, con_latido, heartbeat=True)
+        inicio = m.active_connections[2][con_latido].last_seen
+        m.reap_idle(now=inicio + 30)
+        await asyncio.sleep(0.05)
+        m.reap_idle(now=inicio + 45)
+        await asyncio.sleep(0.05)
+        # El cliente que solo escucha no recibe pings ni se cierra
+        assert oyente.sent == [] and oyente.closed == []
+        assert 1 in m.active_connections
+        assert con_latido.sent == ['{"type":"ping"}']
+        assert con_latido.closed == [IDLE_CLOSE_CODE]
+        await m.stop()
+
+    run(escenario())
+
+
+def test_memoria_por_conexion_incluye_escritor_y_event():
+    async def escenario():
+        m = manager()
+        ws = FakeWebSocket()
+        await m.connect(1, ws)
+        await asyncio.sleep(0)
+        conn = m.active_connections[1][ws]
+        base = sys.getsizeof(conn) + sys.getsizeof(conn.queue)
+        assert conn.approx_bytes() > base + sys.getsizeof(conn.writer)
+        await m.stop()
+
+    run(escenario())
+
+
+def envelope(message: dict):
+    return message, encode(message)
+
+
+def test_fusiona_ids_al_final_con_el_ultimo_seq():
+    queue = deque(
+        [
+            envelope({"type": "notifications_read", "ids": [1], "seq": 2}),
+            envelope({"type": "notification_new", "id": 9, "seq": 3}),
+        ]
+    )
+    assert _coalesce(queue, {"type": "notifications_read", "ids": [1, 9], "seq": 4})
+    assert [m for m, _ in queue] == [
+        {"type": "notification_new", "id": 9, "seq": 3},
+        {"type": "notifications_read", "ids": [1, 9], "seq": 4},
+    ]
+    assert [m.get("seq") for m, _ in queue] == [3, 4]
+
+
+def test_estado_conserva_solo_el_ultimo():
+    queue = deque(
+        [
+            envelope({"type": "unread_count", "count": 5}),
+            envelope({"type": "notification_new", "id": 9, "seq": 3}),
+        ]
+    )
+    assert _coalesce(queue, {"type": "unread_count", "count": 4})
+    assert [m for m, _ in queue] == [
+        {"type": "notification_new", "id": 9, "seq": 3},
+        {"type": "unread_count", "count": 4},
+    ]
+    assert queue[-1][1] == encode(queue[-1][0])
+
+
+def test_no_fusiona_eventos_sin_ids():
+    queue = deque([envelope({"type": "notification_new", "id": 1})])
+    assert not _coalesce(queue, {"type": "notification_new", "id": 2})
+    assert len(queue) == 1
+
+
+def frame(*messages: dict) -> list[dict]:
+    data, _ = _batch_frame([envelope(m) for m in messages])
+    if data is None:
+        return []
+    decoded = json.loads(data)
+    return decoded["events"] if decoded.get("type") == "batch" else [decoded]
+
+
+def test_batch_lectura_oculta_por_borrado():
+    eventos = frame(
+        {"type": "notification_read", "id": 1, "seq": 1},
+        {"type": "notification_read", "id": 2, "seq": 2},
+        {"type": "notification_deleted", "id": 1, "seq": 3},
+    )
+    assert eventos == [
+        {"type": "notifications_read", "ids": [2], "seq": 2},
+        {"type": "notifications_deleted", "ids": [1], "seq": 3},
+    ]
+
+
+def test_batch_lecturas_todas_borradas_desaparecen():
+    eventos = frame(
+        {"type": "notification_read", "id": 1, "seq": 1},
+        {"type": "notifications_cleared", "ids": [1], "seq": 2},
+    )
+    assert eventos == [{"type": "notifications_cleared", "ids": [1], "seq": 2}]
+
+
+def test_batch_ultimo_unread_count_gana():
+    eventos = frame(
+        {"type": "unread_count", "count": 3},
+        {"type": "notification_new", "id": 7, "seq": 1},
+        {"type": "unread_count", "count": 4},
+    )
+    assert eventos == [
+        {"type": "notification_new", "id": 7, "seq": 1},
+        {"type": "unread_count", "count": 4},
+    ]
+
+
+def test_batch_seq_en_orden():
+    eventos = frame(
+        {"type": "notification_read", "id": 1, "seq": 2},
+        {"type": "notification_new", "id": 9, "seq": 3},
+        {"type": "notification_read", "id": 9, "seq": 4},
+        {"type": "notification_new", "id": 10, "seq": 5},
+    )
+    assert [e["seq"] for e in eventos] == [3, 4, 5]
+    # La lectura fusionada no llega antes de la notificación que marca
+    assert eventos[1] == {"type": "notifications_read", "ids": [1, 9], "seq": 4}
+
+
+def test_batch_un_solo_evento_sin_envoltorio():
+    data, total = _batch_frame([envelope({"type": "notification_new", "id": 1})])
+    assert total == 1 and json.loads(data) == {"type": "notification_new", "id": 1}
+
+
+def test_sin_sockets_no_se_crean_buferes_de_reposicion():
+    m = manager()
+    m.send_many((uid, {"type": "x", "seq": uid}) for uid in range(1, 101))
+    assert m.replay_buffers == {}
+
+
+def test_bufer_de_reposicion_vive_replay_ttl_tras_desconectar():
+    async def escenario():
+        m = manager(replay_ttl=60)
+        ws = FakeWebSocket()
+        await m.connect(1, ws)
+        m.send_to_user(1, {"type": "x", "seq": 1})
+        m.disconnect(1, ws)
+        # Perdidos mientras estaba desconectado
+        m.send_to_user(1, {"type": "x", "seq": 2})
+        m.send_to_user(1, {"type": "x", "seq": 3})
+        assert [e[0]["seq"] for e in m.buffered_since([1], 1)] == [2, 3]
+        m.purge_replay(now=m.replay_expira[1] + 1)
+        assert m.replay_buffers == {} and m.replay_desde == {}
+        # Un búfer nuevo no cubre lo anterior: la reposición sale de la Outbox
+        await m.connect(1, FakeWebSocket())
+        assert m.buffered_since([1], 1) is None
+        assert m.buffered_since([1], 3) == []
+        await m.stop()
+
+    run(escenario())
+
+
+def test_reconectar_cancela_la_expiracion():
+    async def escenario():
+        m = manager(replay_ttl=60)
+        ws = FakeWebSocket()
+        await m.connect(1, ws)
+        m.disconnect(1, ws)
+        await m.connect(1, FakeWebSocket())
+        m.purge_replay(now=float("inf"))
+        assert 1 in m.replay_buffers
+        await m.stop()
+
+    run(escenario())
+
+
+def test_cambio_de_rol_resuscribe_los_sockets_de_otro_proceso():
+    async def escenario():
+        bus = Bus()
+        atiende, conectado = (
+            ConnectionManager(backend=BusBackend(bus)) for _ in range(2)
+        )
+        for m in (atiende, conectado):
+            await m.start()
+        ws = FakeWebSocket()
+        await conectado.connect(1, ws)
+        conectado.subscribe(1, ws, ["rol:ESTUDIANTE"])
+        # El PATCH lo atiende el otro proceso
+        await atiende.cambiar_topicos(1, ["rol:PSICOLOGO"])
+        await atiende.publish(
+            [("rol:ESTUDIANTE", {"type": "viejo"}), ("rol:PSICOLOGO", {"type": "nuevo"})]
+        )
+        await asyncio.sleep(0.05)
+        assert [json.loads(data)["type"] for data in ws.sent] == ["nuevo"]
+        assert set(conectado.topic_connections) == {"rol:PSICOLOGO"}
+        for m in (atiende, conectado):
+            await m.stop()
+
+    run(escenario())